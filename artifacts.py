@@ -0,0 +1,197 @@
+"""
+Failure artifacts for Cita Previa Checker Bot
+Keeps a screenshot, the HTML and the URL of the page a step failed on, keyed by check
+ID and step. The check thread only grabs the raw data; compression and disk writes
+happen on a background thread, and the oldest captures are deleted to stay under a
+size cap
+"""
+
+import base64
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _safe_name(value):
+    """Make a check ID or step name usable in a directory name"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", str(value)).strip("-") or "none"
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ArtifactStore:
+    """Size-capped ring buffer of failure captures"""
+
+    def __init__(
+        self,
+        directory="artifacts",
+        max_bytes=50 * 1024 * 1024,
+        screenshots=True,
+        jpeg_quality=60,
+        queue_size=16,
+    ):
+        """
+        Args:
+            directory: Where captures are kept (one sub-directory each)
+            max_bytes: Delete the oldest captures once the total exceeds this
+            screenshots: Take a screenshot as well as the HTML (browser checks only)
+            jpeg_quality: JPEG quality for screenshots when Chrome can produce JPEG
+            queue_size: Captures waiting to be written before new ones are dropped
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.screenshots = screenshots
+        self.jpeg_quality = jpeg_quality
+        self.captured = 0
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._writer = threading.Thread(target=self._run, name="artifacts", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the store from ARTIFACTS_DIR etc. in config.Settings (None: read from the
+        environment), or None if captures are disabled
+        """
+        settings = settings or config.Settings.from_env()
+        if not settings.artifacts_dir:
+            return None
+        return cls(
+            settings.artifacts_dir,
+            max_bytes=int(settings.artifacts_max_mb * 1024 * 1024),
+            screenshots=settings.artifact_screenshots,
+        )
+
+    def capture_driver(self, driver, check_id, step, reason=""):
+        """
+        Capture the page a browser step failed on
+        Args:
+            driver: WebDriver showing the failed page
+            check_id: Correlation ID of the check
+            step: Name of the failed step
+            reason: Why it failed
+        """
+        url = html = screenshot = None
+        try:
+            url = driver.current_url
+            html = driver.page_source
+            if self.screenshots:
+                screenshot = self._screenshot(driver)
+        except Exception as e:
+            logger.warning("Could not capture the failed page: %s", e)
+            if url is None and html is None:
+                return
+        self._enqueue(check_id, step, reason, url, html, screenshot)
+
+    def capture_page(self, url, html, check_id, step, reason=""):
+        """Capture a page fetched by the HTTP engine"""
+        self._enqueue(check_id, step, reason, url, html, None)
+
+    def close(self, timeout=30):
+        """Write everything still queued and stop the writer"""
+        self._queue.put(None)
+        self._writer.join(timeout)
+
+    def _screenshot(self, driver):
+        """(extension, bytes): a JPEG from Chrome's DevTools if possible, else a PNG"""
+        try:
+            data = driver.execute_cdp_cmd(
+                "Page.captureScreenshot",
+                {"format": "jpeg", "quality": self.jpeg_quality},
+            )["data"]
+            return "jpg", base64.b64decode(data)
+        except Exception:
+            return "png", driver.get_screenshot_as_png()
+
+    def _enqueue(self, check_id, step, reason, url, html, screenshot):
+        item = {
+            "time": time.time(),
+            "check_id": check_id,
+            "step": step,
+            "reason": reason,
+            "url": url,
+            "html": html,
+            "screenshot": screenshot,
+        }
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Artifact queue full, dropped capture of '%s'", step)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                path = self._write(item)
+                self.captured += 1
+                logger.info("🗂️ Saved failure artifacts to %s", path)
+                self._evict()
+            except OSError as e:
+                logger.error("Could not save failure artifacts: %s", e)
+
+    def _write(self, item):
+        """Write one capture to its own directory"""
+        stamp = datetime.fromtimestamp(item["time"]).strftime("%Y%m%d-%H%M%S-%f")
+        name = f"{stamp}_{_safe_name(item['check_id'])}_{_safe_name(item['step'])}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+
+        meta = {
+            "time": datetime.fromtimestamp(item["time"]).isoformat(timespec="seconds"),
+            "check_id": item["check_id"],
+            "step": item["step"],
+            "reason": item["reason"],
+            "url": item["url"],
+        }
+        if item["html"] is not None:
+            with gzip.open(
+                os.path.join(path, "page.html.gz"), "wt", encoding="utf-8"
+            ) as f:
+                f.write(item["html"])
+        if item["screenshot"] is not None:
+            extension, data = item["screenshot"]
+            meta["screenshot"] = f"screenshot.{extension}"
+            with open(os.path.join(path, meta["screenshot"]), "wb") as f:
+                f.write(data)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        return path
+
+    def _evict(self):
+        """Delete the oldest captures until the total size is under the cap"""
+        captures = sorted(
+            entry.path for entry in os.scandir(self.directory) if entry.is_dir()
+        )
+        sizes = {path: _directory_size(path) for path in captures}
+        total = sum(sizes.values())
+        # Names start with the capture time, so sorting puts the oldest first;
+        # the newest capture is always kept
+        for path in captures[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= sizes[path]
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+End-to-end check benchmark for Cita Previa Checker Bot
+Runs CitaChecker against the local fixture site and reports per-step latency, total latency and peak RSS
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+
+from browser_watchdog import process_tree_rss
+from cita_checker import CitaChecker
+from driver_pool import DriverPool
+from fixture_site import OUTCOMES, FixtureSite
+from http_engine import HttpCheckEngine
+from pacing import PacingPolicy
+
+# Step that causes each fixture page request
+STEP_BY_PAGE = {
+    "citar": "navigate",
+    "citar_sede": "office_select",
+    "acInfo": "btnAceptar",
+    "acEntrada": "btnEntrar",
+    "acValidarEntrada": "btnEnviar",
+    "acCitar": "solicitar_cita",
+}
+
+EXPECTED = {
+    "no_citas": False,
+    "clave_only": False,
+    "available": True,
+}
+
+
+class RssSampler:
+    """Track peak RSS of this process and every browser/driver process it spawns"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        try:
+            self.peak = max(self.peak, process_tree_rss(os.getpid()))
+        except OSError:
+            # /proc is not available (e.g. macOS); fall back to this process only
+            import resource
+
+            self.peak = max(
+                self.peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def step_latencies(requests, started, finished):
+    """
+    Split one check into per-step latencies using fixture request arrival times
+    Each step runs from the previous request's arrival to the request it causes
+    """
+    steps = {}
+    previous = started
+    for page, arrived in requests:
+        step = STEP_BY_PAGE.get(page, page)
+        steps[step] = steps.get(step, 0.0) + (arrived - previous)
+        previous = arrived
+    steps["classification"] = finished - previous
+    return steps
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_benchmark(runs, engine, outcome, delay, headless=True):
+    """
+    Run the benchmark
+    Returns: dict with per-run results, per-step timings and peak RSS
+    """
+    results = []
+    with FixtureSite(outcome=outcome, delays={"*": delay}) as site:
+        checker = CitaChecker(headless=headless, pacing=PacingPolicy(0, 0))
+        checker.PROVINCIA_URL = site.provincia_url
+        checker.pool = DriverPool(checker.create_driver)
+        if engine == "http":
+            checker.engine = HttpCheckEngine(checker)
+
+        try:
+            with RssSampler() as sampler:
+                for run in range(1, runs + 1):
+                    site.state.drain_requests()
+                    started = time.perf_counter()
+                    available, message = checker.perform_check()
+                    finished = time.perf_counter()
+                    results.append(
+                        {
+                            "run": run,
+                            "available": available,
+                            "correct": available == EXPECTED[outcome],
+                            "message": message,
+                            "total": finished - started,
+                            "steps": step_latencies(
+                                site.state.drain_requests(), started, finished
+                            ),
+                        }
+                    )
+        finally:
+            if checker.engine is not None:
+                checker.engine.close()
+            checker.pool.close()
+
+    return {"results": results, "peak_rss": sampler.peak}
+
+
+def print_report(report, engine, outcome):
+    """Print per-step and total latency statistics"""
+    results = report["results"]
+    print(f"\nEngine: {engine}   Outcome: {outcome}   Runs: {len(results)}")
+    print(f"Correct results: {sum(r['correct'] for r in results)}/{len(results)}")
+
+    steps = list(STEP_BY_PAGE.values()) + ["classification"]
+    print(f"\n{'step':<16}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    print("-" * 56)
+    for step in steps + ["total"]:
+        if step == "total":
+            print("-" * 56)
+            values = [r["total"] for r in results]
+        else:
+            values = [r["steps"][step] for r in results if step in r["steps"]]
+        if not values:
+            continue
+        print(
+            f"{step:<16}{statistics.mean(values):>9.3f}s{percentile(values, 50):>9.3f}s"
+            f"{percentile(values, 95):>9.3f}s{max(values):>9.3f}s"
+        )
+
+    print(f"\nPeak RSS (bot + browser processes): {report['peak_rss'] / 2**20:.1f} MiB")
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="Number of checks")
+    parser.add_argument("--engine", choices=("selenium", "http"), default="selenium")
+    parser.add_argument("--outcome", choices=OUTCOMES, default="no_citas")
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Seconds added to every response"
+    )
+    parser.add_argument("--show-browser", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="Show checker logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    report = run_benchmark(
+        args.runs,
+        args.engine,
+        args.outcome,
+        args.delay,
+        headless=not args.show_browser,
+    )
+    print_report(report, args.engine, args.outcome)
+
+
+if __name__ == "__main__":
+    main()
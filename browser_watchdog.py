@@ -0,0 +1,348 @@
+"""
+Browser process watchdog for Cita Previa Checker Bot
+Tracks the chromedriver/Chrome process trees the bot spawns, samples their memory and
+CPU after every check, recycles sessions over a memory or age limit and kills processes
+left behind by failed starts or failed quits
+"""
+
+import logging
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Process names (as in /proc/<pid>/stat) that belong to a browser session
+BROWSER_PROCESS_PREFIXES = ("chrome", "chromium", "headless_shell")
+
+
+@dataclass(frozen=True)
+class ProcessInfo:
+    """One process as read from /proc/<pid>/stat"""
+
+    pid: int
+    ppid: int
+    name: str
+    state: str
+    rss: int  # bytes
+    cpu: float  # seconds of user + system time
+    start: int  # clock ticks after boot
+
+
+def read_process_table():
+    """Every process on the host, read from /proc; raises OSError where /proc is missing"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    ticks = os.sysconf("SC_CLK_TCK")
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may itself contain spaces
+        name = stat[stat.index("(") + 1 : stat.rindex(")")]
+        fields = stat.rsplit(")", 1)[1].split()
+        table[int(entry)] = ProcessInfo(
+            pid=int(entry),
+            ppid=int(fields[1]),
+            name=name,
+            state=fields[0],
+            rss=int(fields[21]) * page_size,
+            cpu=(int(fields[11]) + int(fields[12])) / ticks,
+            start=int(fields[19]),
+        )
+    return table
+
+
+def process_tree(table, root_pid):
+    """root_pid and all its descendants that are in the table"""
+    children = {}
+    for info in table.values():
+        children.setdefault(info.ppid, []).append(info.pid)
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        if pid in table:
+            tree.append(pid)
+            stack.extend(children.get(pid, []))
+    return tree
+
+
+def process_tree_rss(root_pid):
+    """Resident memory (bytes) of root_pid and all its descendants"""
+    table = read_process_table()
+    return sum(table[pid].rss for pid in process_tree(table, root_pid))
+
+
+# Fallback start time where /proc is missing: when this module was first imported
+_IMPORTED = time.monotonic()
+
+
+def process_age(pid=None):
+    """Seconds since a process (default: this one) started"""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/stat") as f:
+            start = int(f.read().rsplit(")", 1)[1].split()[19])
+        return (_uptime_ticks() - start) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return time.monotonic() - _IMPORTED
+
+
+def _uptime_ticks():
+    with open("/proc/uptime") as f:
+        return float(f.read().split()[0]) * os.sysconf("SC_CLK_TCK")
+
+
+def _driver_pid(driver):
+    """PID of the chromedriver process behind a WebDriver, if it can be found"""
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+
+class BrowserWatchdog:
+    """Keep browser processes within memory and age limits and clean up leftovers"""
+
+    def __init__(
+        self,
+        max_rss_mb=1536,
+        max_age_minutes=360,
+        orphan_grace_seconds=120,
+        kill_timeout=3,
+    ):
+        """
+        Args:
+            max_rss_mb: Recycle a session whose process tree uses more memory than this
+            max_age_minutes: Recycle a session older than this
+            orphan_grace_seconds: Leave untracked browser processes alone while they are
+                younger than this (another thread may still be starting them)
+            kill_timeout: Seconds between SIGTERM and SIGKILL
+        """
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_age = max_age_minutes * 60
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.kill_timeout = kill_timeout
+
+        self.counters = {
+            "sessions_started": 0,
+            "recycled_memory": 0,
+            "recycled_age": 0,
+            "quit_leftovers_killed": 0,
+            "orphans_killed": 0,
+        }
+        self.browser_rss = 0
+        self._sessions = {}  # id(driver) -> dict(pid, start, created, cpu)
+        self._seen = {}  # pid -> start ticks of every process seen in a session tree
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the watchdog from BROWSER_* in config.Settings (None: read from the
+        environment), or None if disabled or unsupported
+        """
+        settings = settings or config.Settings.from_env()
+        if not settings.browser_watchdog:
+            return None
+        if not os.path.isdir("/proc"):
+            logger.warning("Browser watchdog needs /proc; running without it")
+            return None
+        return cls(
+            max_rss_mb=settings.browser_max_rss_mb,
+            max_age_minutes=settings.browser_max_age_minutes,
+        )
+
+    def register(self, driver):
+        """Start tracking a freshly created session"""
+        pid = _driver_pid(driver)
+        if pid is None:
+            logger.warning("Browser watchdog can't see this WebDriver's process")
+            return
+        table = read_process_table()
+        with self._lock:
+            self._sessions[id(driver)] = {
+                "pid": pid,
+                "start": table[pid].start if pid in table else None,
+                "created": time.monotonic(),
+                "cpu": 0.0,
+            }
+            self._remember(table, pid)
+            self.counters["sessions_started"] += 1
+
+    def inspect(self, driver):
+        """
+        Sample a session's process tree after a check
+        Returns: tuple (stats dict or None, recycle reason or None)
+        """
+        with self._lock:
+            session = self._sessions.get(id(driver))
+        if session is None:
+            return None, None
+
+        table = read_process_table()
+        tree = process_tree(table, session["pid"])
+        cpu = sum(table[pid].cpu for pid in tree)
+        stats = {
+            "browser_rss_bytes": sum(table[pid].rss for pid in tree),
+            "browser_cpu_seconds": round(max(0.0, cpu - session["cpu"]), 3),
+            "browser_processes": len(tree),
+            "browser_age_seconds": round(time.monotonic() - session["created"]),
+        }
+        with self._lock:
+            session["cpu"] = cpu
+            self._remember(table, session["pid"])
+            self.browser_rss = stats["browser_rss_bytes"]
+
+        logger.info(
+            "🧠 Browser: %.1f MiB RSS in %s processes, %.1fs CPU this check, "
+            "session age %.0f min",
+            stats["browser_rss_bytes"] / 1048576,
+            stats["browser_processes"],
+            stats["browser_cpu_seconds"],
+            stats["browser_age_seconds"] / 60,
+        )
+
+        reason = None
+        if stats["browser_rss_bytes"] > self.max_rss:
+            reason = "memory"
+        elif stats["browser_age_seconds"] > self.max_age:
+            reason = "age"
+        if reason:
+            with self._lock:
+                self.counters[f"recycled_{reason}"] += 1
+            logger.warning("♻️ Recycling browser session over its %s limit", reason)
+        return stats, reason
+
+    def release(self, driver):
+        """After quit(): kill whatever is left of the session's process tree"""
+        with self._lock:
+            session = self._sessions.pop(id(driver), None)
+        if session is None:
+            return
+        try:
+            table = read_process_table()
+        except OSError:
+            return
+        pid = session["pid"]
+        if pid in table and table[pid].start == session["start"]:
+            leftovers = [p for p in process_tree(table, pid) if table[p].state != "Z"]
+            if leftovers:
+                logger.warning(
+                    "WebDriver quit left %s processes running; killing them",
+                    len(leftovers),
+                )
+                self._kill(leftovers)
+                with self._lock:
+                    self.counters["quit_leftovers_killed"] += len(leftovers)
+
+    def reap_orphans(self, grace_seconds=None):
+        """
+        Kill browser processes no tracked session owns: processes once seen in a
+        session's tree that outlived it, and browser/driver children of this process
+        that never became a session (e.g. webdriver.Chrome failed partway)
+        Returns: number of processes killed
+        """
+        grace = self.orphan_grace_seconds if grace_seconds is None else grace_seconds
+        table = read_process_table()
+        now_ticks = _uptime_ticks()
+        ticks = os.sysconf("SC_CLK_TCK")
+
+        with self._lock:
+            owned = set()
+            for session in self._sessions.values():
+                owned.update(process_tree(table, session["pid"]))
+
+            orphans = set()
+            for pid, start in self._seen.items():
+                info = table.get(pid)
+                if info and info.start == start and pid not in owned:
+                    orphans.add(pid)
+            for info in table.values():
+                if (
+                    info.ppid == os.getpid()
+                    and info.pid not in owned
+                    and info.name.lower().startswith(BROWSER_PROCESS_PREFIXES)
+                    and (now_ticks - info.start) / ticks >= grace
+                ):
+                    orphans.update(process_tree(table, info.pid))
+
+            orphans = [pid for pid in orphans if table[pid].state != "Z"]
+            for pid in list(self._seen):
+                if pid not in table or table[pid].start != self._seen[pid]:
+                    del self._seen[pid]
+
+        if orphans:
+            logger.warning("🧹 Killing %s orphaned browser processes", len(orphans))
+            self._kill(orphans)
+            with self._lock:
+                self.counters["orphans_killed"] += len(orphans)
+        return len(orphans)
+
+    def close(self):
+        """Kill every browser process still left once all sessions are closed"""
+        try:
+            self.reap_orphans(grace_seconds=0)
+        except OSError:
+            pass
+        logger.info(
+            "Browser watchdog: "
+            + ", ".join(f"{name}={count}" for name, count in self.counters.items())
+        )
+
+    def prometheus_lines(self):
+        """Exposition lines for Metrics.add_collector"""
+        with self._lock:
+            lines = [
+                "# HELP cita_browser_events_total Browser sessions started, recycled and processes killed",
+                "# TYPE cita_browser_events_total counter",
+            ]
+            lines.extend(
+                f'cita_browser_events_total{{event="{name}"}} {count}'
+                for name, count in sorted(self.counters.items())
+            )
+            lines.append(
+                "# HELP cita_browser_rss_bytes Memory of the last inspected browser session"
+            )
+            lines.append("# TYPE cita_browser_rss_bytes gauge")
+            lines.append(f"cita_browser_rss_bytes {self.browser_rss}")
+        return lines
+
+    def _remember(self, table, pid):
+        """Record a session's current processes so they can be recognised as orphans later"""
+        for member in process_tree(table, pid):
+            self._seen[member] = table[member].start
+
+    def _kill(self, pids):
+        """SIGTERM, then SIGKILL whatever is still alive after kill_timeout"""
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+        deadline = time.monotonic() + self.kill_timeout
+        remaining = list(pids)
+        while remaining and time.monotonic() < deadline:
+            time.sleep(0.1)
+            remaining = [pid for pid in remaining if _alive(pid)]
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+def _alive(pid):
+    """True while a process exists and isn't a zombie"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
@@ -4,34 +4,73 @@ Cita Previa Extranjería Checker Bot
 Monitors availability for "POLICIA-CERTIFICADO DE REGISTRO DE CIUDADANO DE LA U.E." appointments in S.Cruz Tenerife
 """
 
+import argparse
+import atexit
+import dataclasses
 import logging
-import os
 import random
-import smtplib
+import sys
+import threading
 import time
 from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import Select, WebDriverWait
-
-# Load environment variables
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("cita_checker.log"), logging.StreamHandler()],
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from artifacts import ArtifactStore
+from browser_watchdog import BrowserWatchdog, process_age
+from click_strategies import BTN_ENTRAR_STRATEGIES, ClickStrategyEngine
+from config import ConfigError, ConfigWatcher, Settings, load_environment
+from driver_pool import DriverPool
+from driver_resolver import DriverResolver
+from flow import FlowStep, RetryPolicy, StepFailed, StepRunner
+from history import HistoryStore
+from interval_policy import AdaptiveIntervalPolicy
+from lean_profile import LeanProfile, format_stats
+from log_pipeline import LogPipeline, check_context, current_check_id
+from metrics import Metrics
+from notifications import NotificationDispatcher
+from pacing import PacingPolicy
+from page_probe import (
+    document_ready,
+    on_page,
+    page_fingerprint,
+    ready_with_element,
+    select_options_loaded,
+    session_expired,
+    take_snapshot,
+    url_contains_when_ready,
 )
+from result_classifier import Outcome, ResultClassifier
+from watchlist import load_watchlist
+
+# Load environment variables (the .env file is watched for changes while running)
+ENV_FILE = load_environment()
+
 logger = logging.getLogger(__name__)
 
+# Separator between checks in the log
+BANNER = "=" * 60
+
+# Window the "Solicitar Cita" result opens in while holding position
+RESULT_WINDOW_NAME = "cita_result"
+
+# Window each office's flow opens in during a sweep
+OFFICE_WINDOW_NAME = "cita_office"
+
+# Selenium's webdriver package is by far the slowest import; these are bound by
+# _load_selenium() the first time a browser is needed
+By = EC = Select = WebDriverWait = None
+
+
+def _load_selenium():
+    """Import the Selenium helpers the browser flow uses"""
+    global By, EC, Select, WebDriverWait
+    if WebDriverWait is not None:
+        return
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import Select, WebDriverWait
+
 
 class CitaChecker:
     """Check for available Cita Previa appointments"""
@@ -42,6 +81,9 @@ class CitaChecker:
         "https://icp.administracionelectronica.gob.es/icpco/citar?p=38&locale=es"
     )
 
+    # Browser identity shared by the Selenium and HTTP engines
+    USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
     # Values for desired office
     OFFICE_VALUE = "7"
     OFFICE_NAME = "CNP San Cristobal de LA LAGUNA, CALLE NAVA Y GRIMON, 66, Santa Cruz de Tenerife"
@@ -51,33 +93,269 @@ class CitaChecker:
     TRAMITE_VALUE = "4038"
     TRAMITE_NAME = "POLICIA-CERTIFICADO DE REGISTRO DE CIUDADANO DE LA U.E."
 
-    def __init__(self, headless=True):
-        """Initialize the checker with browser options"""
+    def __init__(
+        self,
+        headless=True,
+        pool=None,
+        pacing=None,
+        click_engine=None,
+        metrics=None,
+        target=None,
+        notifier=None,
+        lean_profile=None,
+        interval_policy=None,
+        classifier=None,
+        retry_policy=None,
+        watchdog=None,
+        driver_resolver=None,
+        artifacts=None,
+        settings=None,
+    ):
+        """
+        Initialize the checker with browser options
+        Args:
+            settings: config.Settings (None: read from the environment); reloaded
+                settings are handed over with update_settings()
+            interval_policy: AdaptiveIntervalPolicy deciding the wait between checks
+                (None for the fixed interval)
+            classifier: ResultClassifier for the acCitar page
+            retry_policy: RetryPolicy for failed steps (defaults to the settings)
+            watchdog: BrowserWatchdog tracking the browser processes (optional)
+            driver_resolver: DriverResolver caching the chromedriver/Chrome lookup
+            artifacts: ArtifactStore keeping the pages failed steps ended on (optional)
+            target: Optional WatchTarget overriding the office, tramite and applicant
+            notifier: NotificationDispatcher for alerts (created on first alert if omitted)
+            lean_profile: LeanProfile to block non-essential resources (None for a default profile)
+            headless: Run Chrome without a visible window
+            pool: Optional DriverPool to borrow warm sessions from
+            pacing: PacingPolicy for deliberate pauses (defaults to the settings)
+            click_engine: ClickStrategyEngine for fallback clicks (defaults to env settings)
+            metrics: Metrics collecting per-step timings (defaults to in-memory only)
+        """
+        self.settings = settings or Settings.from_env()
         self.headless = headless
+        self.pool = pool
+        self.pacing = pacing or PacingPolicy.from_config(self.settings)
+        self.click_engine = click_engine or ClickStrategyEngine.from_env(self.settings)
+        self.metrics = metrics or Metrics()
+        self.timer = None
         self.driver = None
+        self.notifier = notifier
+        self.lean_profile = lean_profile
+        self.interval_policy = interval_policy
+        self.classifier = classifier or ResultClassifier()
+        self.retry_policy = retry_policy or RetryPolicy.from_config(self.settings)
+        self.watchdog = watchdog
+        self.driver_resolver = driver_resolver or DriverResolver.from_env(self.settings)
+        self.artifacts = artifacts
+        self.first_request_at = None
         self.last_notification_time = None
 
-    def setup_driver(self):
-        """Setup Chrome WebDriver with options"""
+        # Optional alternative engine (e.g. HttpCheckEngine) used by perform_check
+        self.engine = None
+
+        # Hold position: stay parked on the validation page between checks
+        self._parked_handle = None
+        self._parked_url = None
+        self._parked_at = None
+
+        # Office sweep: tab holding the province page every office starts from
+        self._sweep_handle = None
+
+        # Settings handed over by a reload, applied when the next check starts
+        self._pending_settings = None
+        self._settings_changed = threading.Event()
+
+        # Target, applicant data required by the form, and hold position
+        self.target = target
+        self._apply_settings(self.settings)
+        if target is not None:
+            self.PROVINCIA_URL = target.provincia_url
+            self.OFFICE_VALUE = target.office_value
+            self.OFFICE_NAME = target.office_name or target.office_value
+            self.TRAMITE_VALUE = target.tramite_value
+            self.TRAMITE_NAME = target.tramite_name or target.tramite_value
+            self.PROVINCIA = target.provincia or self.PROVINCIA
+            self.nie_number = target.nie_number
+            self.full_name = target.full_name
+
+    def _apply_settings(self, settings):
+        """Take the target, applicant and hold-position settings"""
+        self.hold_position = settings.hold_position
+        self.park_max_seconds = settings.park_max_minutes * 60
+        if self.target is not None:
+            # Watch list entries carry their own target and applicant
+            return
+        cls = type(self)
+        self.PROVINCIA_URL = settings.provincia_url or cls.PROVINCIA_URL
+        self.PROVINCIA = settings.provincia or cls.PROVINCIA
+        self.OFFICE_VALUE = settings.office_value or cls.OFFICE_VALUE
+        self.OFFICE_NAME = settings.office_name or (
+            settings.office_value or cls.OFFICE_NAME
+        )
+        self.TRAMITE_VALUE = settings.tramite_value or cls.TRAMITE_VALUE
+        self.TRAMITE_NAME = settings.tramite_name or (
+            settings.tramite_value or cls.TRAMITE_NAME
+        )
+        self.nie_number = settings.nie_number
+        self.full_name = settings.full_name
+
+    @property
+    def current_settings(self):
+        """Settings in effect from the next check on"""
+        return self._pending_settings or self.settings
+
+    def update_settings(self, settings):
+        """
+        Hand over reloaded settings (callable from any thread)
+        They are applied when the next check starts, so a running check is not affected
+        """
+        self._pending_settings = settings
+        self._settings_changed.set()
+
+    def apply_pending_settings(self):
+        """
+        Apply the settings handed over by update_settings()
+        Returns: the new settings, or None if there were none
+        """
+        settings, self._pending_settings = self._pending_settings, None
+        if settings is None:
+            return None
+        held = self.hold_position
+        before = (
+            self.PROVINCIA_URL,
+            self.OFFICE_VALUE,
+            self.TRAMITE_VALUE,
+            self.nie_number,
+            self.full_name,
+        )
+        self.settings = settings
+        self._apply_settings(settings)
+        self.pacing.apply_settings(settings)
+        self.retry_policy = RetryPolicy.from_config(settings)
+        after = (
+            self.PROVINCIA_URL,
+            self.OFFICE_VALUE,
+            self.TRAMITE_VALUE,
+            self.nie_number,
+            self.full_name,
+        )
+        # A parked session was set up for the old target and applicant
+        if held and (not self.hold_position or before != after):
+            logger.info("🔄 Settings changed, giving up the held session")
+            self.release_session()
+        return settings
+
+    def wait_for_next_check(self, delay, interval_minutes=None):
+        """
+        Sleep until the next check
+        Args:
+            delay: Seconds to wait
+            interval_minutes: CHECK_INTERVAL_MINUTES the delay is based on; if a reload
+                changes it, the rest of the wait is rescaled (None: fixed wait)
+        """
+        deadline = time.monotonic() + delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._settings_changed.wait(remaining):
+                return
+            self._settings_changed.clear()
+            interval = self.current_settings.check_interval_minutes
+            if interval_minutes is None or interval == interval_minutes:
+                continue
+            deadline += (deadline - time.monotonic()) * (
+                interval / interval_minutes - 1
+            )
+            interval_minutes = interval
+            logger.info(
+                "⏳ Interval changed, next check in %.1f minutes",
+                max(0.0, deadline - time.monotonic()) / 60,
+            )
+
+    @property
+    def target_key(self):
+        """Identifier of the office/tramite combination being checked"""
+        if self.target is not None:
+            return self.target.name
+        return f"{self.OFFICE_VALUE}-{self.TRAMITE_VALUE}"
+
+    def create_driver(self):
+        """Create a new Chrome WebDriver with options"""
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.webdriver import WebDriver as Chrome
+
+        _load_selenium()
         chrome_options = Options()
         if self.headless:
             chrome_options.add_argument("--headless")
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_argument(
-            "user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        )
+        chrome_options.add_argument(f"user-agent={self.USER_AGENT}")
+        if self.lean_profile:
+            self.lean_profile.apply(chrome_options)
+
+        # Reuse the resolved chromedriver/Chrome instead of rediscovering them
+        service = self.driver_resolver.service_for(chrome_options)
+        driver = Chrome(options=chrome_options, service=service)
+        if self.watchdog:
+            self.watchdog.register(driver)
+        try:
+            # No implicit wait: optional elements are probed via page snapshots and
+            # everything the flow depends on is waited for explicitly
+            driver.implicitly_wait(0)
+            if self.lean_profile:
+                self.lean_profile.configure(driver)
+        except Exception:
+            self._quit_driver(driver)
+            raise
+        return driver
 
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.driver.implicitly_wait(10)
-        logger.info("WebDriver initialized")
+    def mark_first_request(self, timer=None):
+        """
+        Remember how long after process start the first request to the site went out
+        Args:
+            timer: CheckTimer to record it on (defaults to this check's)
+        """
+        if self.first_request_at is None:
+            self.first_request_at = process_age()
+            (timer or self.timer).annotate(
+                time_to_first_request=round(self.first_request_at, 3)
+            )
+
+    def setup_driver(self):
+        """Setup Chrome WebDriver, borrowing a warm session from the pool if any"""
+        if self.pool:
+            self.driver = self.pool.checkout()
+        else:
+            self.driver = self.create_driver()
+            logger.info("WebDriver initialized")
+
+    def close_driver(self, discard=False):
+        """
+        Close the WebDriver, or hand it back to the pool
+        Args:
+            discard: Session is in a bad state and must not be reused
+        """
+        if not self.driver:
+            return
+
+        driver, self.driver = self.driver, None
+        if self.pool:
+            self.pool.checkin(driver, discard=discard)
+        else:
+            self._quit_driver(driver)
 
-    def close_driver(self):
-        """Close the WebDriver"""
-        if self.driver:
-            self.driver.quit()
+    def _quit_driver(self, driver):
+        """Quit a session the pool doesn't own; the watchdog kills what quit() leaves"""
+        try:
+            driver.quit()
             logger.info("WebDriver closed")
+        except Exception as e:
+            logger.warning("Error while closing WebDriver: %s", e)
+        finally:
+            if self.watchdog:
+                self.watchdog.release(driver)
 
     def set_random_window_size(self):
         """Set radom window size to prevent bot detection"""
@@ -86,445 +364,967 @@ class CitaChecker:
         height = (width * height_factor) // 3
         self.driver.set_window_size(width, height)
 
-    def sleep_random(self):
-        """Sleep between 2 and 5 seconds to prevent bot detection"""
-        time.sleep(random.randint(2, 5))
+    def perform_check(self):
+        """
+        Run one check with the configured engine
+        Returns: tuple (available: bool, message: str)
+        """
+        self.apply_pending_settings()
+
+        # Everything logged during the check (fallbacks included) shares one ID
+        with check_context(self.target_key):
+            if self.engine is not None:
+                return self.engine.check_availability()
+            return self.check_availability()
 
-    def check_availability(self):
+    def check_availability(self, fallback_info=None):
         """
         Check if appointments are available
+        Args:
+            fallback_info: Fields describing the failed HTTP attempt this check
+                replaces, added to its metrics record (None if it isn't a fallback)
         Returns: tuple (available: bool, message: str)
         """
+        available, message = None, ""
+        _load_selenium()
+        self.timer = self.metrics.start_check(self.target_key)
+        if fallback_info:
+            self.timer.annotate(**fallback_info)
         try:
             logger.info("Starting availability check...")
-            self.setup_driver()
-            self.set_random_window_size()
-
-            # Navigate directly to provincia page
-            self.driver.get(self.PROVINCIA_URL)
-            logger.info(f"Navigated to: {self.PROVINCIA_URL}")
-
-            # Wait for the page to load
-            wait = WebDriverWait(self.driver, 15)
-            self.sleep_random()
-
-            # Dismiss cookie banner if present
-            try:
-                # Try to find and click the cookie accept button
-                cookie_button = self.driver.find_element(
-                    By.ID, "cookie_action_close_header"
-                )
-                cookie_button.click()
+            if self.driver is None:
+                self.timer.step("driver_setup")
+                self.setup_driver()
+            if self.lean_profile:
+                self.lean_profile.reset_stats(self.driver)
+
+            # Resume from the parked validation page when holding position
+            if self._parked_handle is not None:
+                result = self._resume_parked()
+                if result is not None:
+                    available, message = result
+                    return available, message
+                logger.info("🔄 Re-establishing the full path to the validation page")
+                self._unpark()
+                self.driver.delete_all_cookies()
+
+            available, message = self._run_check_flow()
+            return available, message
+
+        except Exception as e:
+            logger.error("Error checking availability: %s", e)
+            message = f"Error: {str(e)}"
+            return None, message
+
+        finally:
+            if self.lean_profile and self.driver is not None:
+                self._record_traffic()
+            recycle = self._inspect_browser()
+            self.timer.finish(available, message)
+            # Keep a healthy parked session; unclear results and errors leave the
+            # session in an unknown state, so it is not reused
+            if self._parked_handle is None or available is None or recycle:
+                self._unpark()
+                self.close_driver(discard=available is None or recycle)
+            if self.watchdog:
+                self._reap_orphans()
+
+    def _inspect_browser(self):
+        """
+        Attach the browser's memory and CPU to the check's metrics
+        Returns: True if the session is over the watchdog's limits and must be recycled
+        """
+        if not self.watchdog or self.driver is None:
+            return False
+        try:
+            stats, reason = self.watchdog.inspect(self.driver)
+        except Exception as e:
+            logger.warning("Could not inspect browser processes: %s", e)
+            return False
+        if stats:
+            self.timer.annotate(**stats)
+        return reason is not None
+
+    def _reap_orphans(self):
+        """Kill browser processes left behind by failed starts or quits"""
+        try:
+            self.watchdog.reap_orphans()
+        except Exception as e:
+            logger.warning("Could not reap orphaned browser processes: %s", e)
+
+    def _record_traffic(self):
+        """Log and attach the lean profile's traffic stats to the check's metrics"""
+        try:
+            stats = self.lean_profile.collect_stats(self.driver)
+        except Exception as e:
+            logger.warning("Could not collect traffic stats: %s", e)
+            return
+        logger.info("📦 Transferred %s", format_stats(stats))
+        self.timer.annotate(
+            bytes_transferred=stats["bytes"],
+            requests=stats["requests"],
+            requests_blocked=stats["blocked"],
+            page_load_seconds=stats["page_load_seconds"],
+        )
+
+    def _resume_parked(self):
+        """
+        Poll from the parked session
+        Returns: tuple (available: bool, message: str), or None if the session must be rebuilt
+        """
+        try:
+            return self._poll_parked(WebDriverWait(self.driver, 15))
+        except WebDriverException as e:
+            logger.warning("Parked session unusable: %s", e)
+            return None
+
+    def _run_check_flow(self):
+        """
+        Walk the appointment flow on the current driver and classify the result
+        Returns: tuple (available: bool, message: str)
+        """
+        wait = WebDriverWait(self.driver, 15)
+        self.set_random_window_size()
+        runner = StepRunner(
+            self.retry_policy,
+            self.timer,
+            probe=lambda: take_snapshot(self.driver),
+            on_failure=self._capture_failure if self.artifacts else None,
+        )
+        steps = self._walk_steps(wait)
+        if not self.hold_position:
+            steps += self._request_steps(wait)
+
+        try:
+            result = runner.run(steps)
+        except StepFailed as e:
+            return None, e.reason
+        if not self.hold_position:
+            return result
+
+        # Park this tab on the validation page and request the cita from a second one
+        self._park()
+        result = self._poll_parked(wait)
+        if result is None:
+            return None, "Session expired right after reaching the validation page"
+        return result
+
+    def _capture_failure(self, step, reason):
+        """Keep the page a step failed on (written in the background)"""
+        self.artifacts.capture_driver(
+            self.driver, current_check_id(), step.name, reason
+        )
+
+    def _walk_steps(self, wait):
+        """Steps from the province page up to the validation page (after btnEnviar #1)"""
+        return self._province_steps(wait) + self._entry_steps(wait)
+
+    def _province_steps(self, wait):
+        """Steps on the province page, up to Aceptar"""
+        return [
+            FlowStep(
+                "navigation",
+                lambda: self._navigate(wait),
+                failure="Could not load the province page",
+            ),
+            FlowStep("cookie_dismissal", self._dismiss_cookies),
+            FlowStep(
+                "office_select",
+                lambda: self._select_office(wait),
+                failure="Could not select office",
+                retry_when=on_page("sede"),
+            ),
+            FlowStep(
+                "tramite_select",
+                lambda: self._select_tramite(wait),
+                failure="Could not select tramite",
+                retry_when=on_page("tramiteGrupo[0]"),
+            ),
+            FlowStep(
+                "btnAceptar",
+                lambda: self._click_aceptar(wait),
+                failure="Could not click Aceptar",
+                retry_when=on_page("btnAceptar"),
+            ),
+        ]
+
+    def _entry_steps(self, wait):
+        """Steps from acInfo through the personal data form"""
+        return [
+            FlowStep(
+                "btnEntrar",
+                self._click_entrar,
+                failure="Could not click 'Presentación sin Cl@ve'",
+                retry_when=on_page("btnEntrar"),
+            ),
+            FlowStep(
+                "personal_data",
+                lambda: self._fill_personal_data(wait),
+                failure="Could not fill personal data",
+                retry_when=on_page("txtIdCitado"),
+            ),
+            FlowStep(
+                "btnEnviar",
+                lambda: self._submit_personal_data(wait),
+                failure="Could not submit form",
+                retry_when=on_page("txtIdCitado", "btnEnviar"),
+            ),
+        ]
+
+    def _request_steps(self, wait):
+        """Steps from the validation page to the classified result"""
+        return [
+            FlowStep(
+                "solicitar_cita",
+                lambda: self._click_solicitar(wait),
+                failure="Could not request cita",
+                retry_when=on_page("btnEnviar", without=("txtIdCitado",)),
+            ),
+            FlowStep("classification", lambda: self._classify_page(wait)),
+        ]
+
+    def _navigate(self, wait):
+        """Navigate directly to the provincia page"""
+        self.mark_first_request()
+        self.driver.get(self.PROVINCIA_URL)
+        logger.info("Navigated to: %s", self.PROVINCIA_URL)
+
+        # Wait for the page to load
+        wait.until(ready_with_element((By.ID, "sede")))
+        self.pacing.pause("navigate")
+
+    def _dismiss_cookies(self):
+        """Dismiss the cookie banner if present (never fails the check)"""
+        try:
+            snapshot = take_snapshot(self.driver)
+            if snapshot["present"].get("cookie_action_close_header"):
+                self.driver.find_element(By.ID, "cookie_action_close_header").click()
                 logger.info("Dismissed cookie banner")
-                self.sleep_random()
-            except NoSuchElementException:
+                self.pacing.pause("cookies")
+            else:
                 logger.info("No cookie banner found or already dismissed")
-            except Exception as e:
-                logger.warning(f"Could not dismiss cookie banner: {str(e)}")
-
-            # Select correct office
-            try:
-                oficina_select = wait.until(
-                    EC.presence_of_element_located((By.ID, "sede"))
-                )
-                select_oficina = Select(oficina_select)
-                select_oficina.select_by_value(self.OFFICE_VALUE)
-                logger.info(f"Selected '{self.OFFICE_NAME}'")
-
-                # Wait for page to refresh and load tramites
-                time.sleep(2)
-                self.sleep_random()
-            except Exception as e:
-                logger.error(f"Could not select office: {str(e)}")
-                return None, "Could not select office"
-
-            # Select the tramite
-            try:
-                tramite_select_element = wait.until(
-                    EC.presence_of_element_located((By.ID, "tramiteGrupo[0]"))
-                )
-                tramite_select = Select(tramite_select_element)
-
-                # Check if our tramite is available
-                tramite_available = False
-                for option in tramite_select.options:
-                    if option.get_attribute("value") == self.TRAMITE_VALUE:
-                        tramite_available = True
-                        break
-
-                if not tramite_available:
-                    logger.error(f"Tramite '{self.TRAMITE_NAME}' not available")
-                    return None, "Tramite not available"
-
-                # Select the tramite
-                tramite_select.select_by_value(self.TRAMITE_VALUE)
-                logger.info(f"Selected tramite: {self.TRAMITE_NAME}")
-                time.sleep(2)
-                self.sleep_random()
-
-            except Exception as e:
-                logger.error(f"Could not select tramite: {str(e)}")
-                return None, f"Could not select tramite: {str(e)}"
-
-            # Click "Aceptar" to proceed to acInfo page
-            try:
-                aceptar_btn = wait.until(
-                    EC.element_to_be_clickable((By.ID, "btnAceptar"))
-                )
-                aceptar_btn.click()
-                logger.info("Clicked Aceptar button")
-                self.sleep_random()
-
-                # Verify we reached the acInfo page
-                current_url = self.driver.current_url
-                logger.info(f"Current page: {current_url}")
-
-            except Exception as e:
-                logger.error(f"Could not find or click Aceptar button: {str(e)}")
-                return None, f"Could not click Aceptar: {str(e)}"
-
-            # Click "Presentación sin Cl@ve" on acInfo page
-            try:
-                # Wait longer for the page to fully load
-                logger.info("Waiting for acInfo page to load...")
-                time.sleep(3)  # Give page more time to load
-                self.sleep_random()
-
-                # Create a longer wait for this specific button
-                long_wait = WebDriverWait(self.driver, 30)  # 30 seconds timeout
-
-                # Try multiple methods to find and click the button
-                btn_clicked = False
-
-                # Method 1: Try by ID with explicit wait
-                try:
-                    logger.info("Attempting to find btnEntrar by ID...")
-                    btn_entrar = long_wait.until(
-                        EC.presence_of_element_located((By.ID, "btnEntrar"))
-                    )
-                    # Wait a bit more for it to be clickable
-                    self.sleep_random()
-                    btn_entrar.click()
-                    logger.info("✓ Clicked 'btnEntrar' by ID")
-                    btn_clicked = True
-                except TimeoutException:
-                    logger.warning("Timeout waiting for btnEntrar by ID")
-                except Exception as e:
-                    logger.warning(f"Could not click btnEntrar by ID: {str(e)}")
-
-                # Method 2: Try by XPath with input type
-                if not btn_clicked:
-                    try:
-                        logger.info("Attempting to find button by XPath...")
-                        btn_entrar = self.driver.find_element(
-                            By.XPATH, "//input[@id='btnEntrar']"
-                        )
-                        btn_entrar.click()
-                        logger.info("✓ Clicked button by XPath")
-                        btn_clicked = True
-                    except Exception as e:
-                        logger.warning(f"Could not click button by XPath: {str(e)}")
-
-                # Method 3: Try JavaScript click as fallback
-                if not btn_clicked:
-                    try:
-                        logger.info("Attempting JavaScript click...")
-                        btn_entrar = self.driver.find_element(By.ID, "btnEntrar")
-                        self.driver.execute_script("arguments[0].click();", btn_entrar)
-                        logger.info("✓ Clicked button with JavaScript")
-                        btn_clicked = True
-                    except Exception as e:
-                        logger.warning(
-                            f"Could not click button with JavaScript: {str(e)}"
-                        )
-
-                if btn_clicked:
-                    self.sleep_random()
-                    # Verify we reached the acEntrada page
-                    current_url = self.driver.current_url
-                    logger.info(f"Current page: {current_url}")
-                else:
-                    # Log page info for debugging
-                    logger.error(
-                        "Failed to click 'Presentación sin Cl@ve' button with all methods"
-                    )
-                    logger.error(f"Current URL: {self.driver.current_url}")
-                    # Save screenshot for debugging (optional)
-                    try:
-                        self.driver.save_screenshot("debug_acinfo_page.png")
-                        logger.info("Saved debug screenshot to debug_acinfo_page.png")
-                    except Exception:
-                        pass
-                    return None, "Could not click 'Presentación sin Cl@ve' button"
-
-            except Exception as e:
-                logger.error(
-                    f"Unexpected error clicking 'Presentación sin Cl@ve' button: {str(e)}"
-                )
-                return None, f"Could not click 'Presentación sin Cl@ve': {str(e)}"
-
-            # Fill in personal data on acEntrada page
-            try:
-                # Select Pasaporte
-                pasaporte_select = wait.until(
-                    EC.element_to_be_clickable((By.ID, "rdbTipoDocPas"))
-                )
-                pasaporte_select.click()
-                logger.info("Selected Pasaporte")
-
-                # Enter NIE
-                nie_input = wait.until(
-                    EC.presence_of_element_located((By.ID, "txtIdCitado"))
-                )
-                nie_input.clear()
-                nie_input.send_keys(os.getenv("NIE_NUMBER", "X1234567A"))
-                logger.info("Filled NIE number")
-
-                # Enter name
-                nombre_input = self.driver.find_element(By.ID, "txtDesCitado")
-                nombre_input.clear()
-                nombre_input.send_keys(os.getenv("FULL_NAME", "TEST USER"))
-                logger.info("Filled full name")
-
-                # Select country (CHINA) - value 406
-                # pais_select = Select(self.driver.find_element(By.ID, "txtPaisNac"))
-                # country_value = os.getenv("COUNTRY_CODE", "406")  # 406 = CHINA
-                # pais_select.select_by_value(country_value)
-                # logger.info(f"Selected country with code: {country_value}")
-
-                self.sleep_random()
-            except Exception as e:
-                logger.error(f"Could not fill personal data: {str(e)}")
-                return None, f"Could not fill personal data: {str(e)}"
-
-            # Click second "Aceptar" to submit form and validate
-            try:
-                aceptar_btn2 = wait.until(
-                    EC.element_to_be_clickable((By.ID, "btnEnviar"))
-                )
-                aceptar_btn2.click()
-                logger.info("Clicked Aceptar button to submit form")
-                self.sleep_random()
-
-                # Verify we reached the validation page
-                current_url = self.driver.current_url
-                logger.info(f"Current page after submission: {current_url}")
-
-            except Exception as e:
-                logger.error(f"Could not find or click Aceptar button: {str(e)}")
-                return None, f"Could not submit form: {str(e)}"
-
-            # Click "Solicitar Cita" button on validation page
-            try:
-                solicitar_btn = wait.until(
-                    EC.element_to_be_clickable((By.ID, "btnEnviar"))
-                )
-                solicitar_btn.click()
-                logger.info("Clicked 'Solicitar Cita' button")
-                self.sleep_random()
-
-                # Log current URL after requesting appointment
-                current_url = self.driver.current_url
-                logger.info(f"Current page after 'Solicitar Cita': {current_url}")
-
-            except Exception as e:
-                logger.error(
-                    f"Could not find or click 'Solicitar Cita' button: {str(e)}"
-                )
-                return None, f"Could not request cita: {str(e)}"
-
-            # Check for availability message on acCitar page
-            page_source = self.driver.page_source.lower()
-
-            # Check for the specific "no appointments" message
-            no_citas_phrases = [
-                "no hay citas disponibles",
-                "en este momento no hay citas disponibles",
-                "no existen citas disponibles",
-                "agotadas las citas",
-                "no hay citas disponibles para la reserva sin cl@ve",
-            ]
-
-            has_no_citas = any(phrase in page_source for phrase in no_citas_phrases)
-
-            # Check for the specific message about Cl@ve availability
-            clave_available = (
-                "sí tienen a su disposición mediante el uso de cl@ve" in page_source
+        except Exception as e:
+            logger.warning("Could not dismiss cookie banner: %s", e)
+
+    def _select_office(self, wait):
+        """Select the correct office"""
+        oficina_select = wait.until(EC.presence_of_element_located((By.ID, "sede")))
+        Select(oficina_select).select_by_value(self.OFFICE_VALUE)
+        logger.info("Selected '%s'", self.OFFICE_NAME)
+        self.pacing.pause("office_select")
+
+    def _select_tramite(self, wait):
+        """Select the tramite once the office's tramites have loaded"""
+        tramite_values = wait.until(select_options_loaded("tramiteGrupo[0]"))
+
+        # Check if our tramite is available; retrying won't change that
+        if self.TRAMITE_VALUE not in tramite_values:
+            raise StepFailed(
+                "tramite_select",
+                f"Tramite '{self.TRAMITE_NAME}' not available",
+                retryable=False,
             )
 
-            if has_no_citas:
-                if clave_available:
-                    logger.info(
-                        "❌ No appointments available without Cl@ve (appointments available WITH Cl@ve)"
-                    )
-                    return (
-                        False,
-                        "No hay citas disponibles sin Cl@ve. Hay citas disponibles CON Cl@ve.",
-                    )
-                else:
-                    logger.info("❌ No appointments available")
-                    return False, "No hay citas disponibles en ninguna oficina"
-            else:
-                # Check if we can see a calendar, date selector, or appointment form
-                try:
-                    # Look for calendar or date selection elements
-                    self.driver.find_element(By.ID, "idCaptcha")
-                    logger.info("✅ APPOINTMENTS AVAILABLE! Calendar detected")
-                    return True, "¡Citas disponibles! Check the website immediately."
-                except NoSuchElementException:
-                    # Check for other date selection indicators
-                    try:
-                        self.driver.find_element(By.ID, "idSede")
-                        logger.info("✅ APPOINTMENTS MIGHT BE AVAILABLE! Form detected")
-                        return (
-                            True,
-                            "¡Posibles citas disponibles! Check the website immediately.",
-                        )
-                    except NoSuchElementException:
-                        # Check if we see the date/hour selection page
-                        if "selecciona" in page_source and (
-                            "fecha" in page_source or "hora" in page_source
-                        ):
-                            logger.info(
-                                "✅ APPOINTMENTS AVAILABLE! Date selection detected"
-                            )
-                            return (
-                                True,
-                                "¡Citas disponibles! Check the website immediately.",
-                            )
-                        else:
-                            # If no clear "no citas" message and no form elements, might be available
-                            logger.info(
-                                "⚠️ Status unclear - no clear 'no citas' message found"
-                            )
-                            return (
-                                True,
-                                "Possible appointments! Please check the website manually to confirm.",
-                            )
-
-        except Exception as e:
-            logger.error(f"Error checking availability: {str(e)}")
-            return None, f"Error: {str(e)}"
+        tramite_select = Select(self.driver.find_element(By.ID, "tramiteGrupo[0]"))
+        tramite_select.select_by_value(self.TRAMITE_VALUE)
+        logger.info("Selected tramite: %s", self.TRAMITE_NAME)
+        self.pacing.pause("tramite_select")
+
+    def _click_aceptar(self, wait):
+        """Click "Aceptar" to proceed to the acInfo page"""
+        aceptar_btn = wait.until(EC.element_to_be_clickable((By.ID, "btnAceptar")))
+        aceptar_btn.click()
+        logger.info("Clicked Aceptar button")
+        wait.until(EC.staleness_of(aceptar_btn))
+        wait.until(url_contains_when_ready("acInfo"))
+        logger.info("Current page: %s", self.driver.current_url)
+
+    def _click_entrar(self):
+        """Click "Presentación sin Cl@ve" on the acInfo page"""
+        logger.info("Waiting for acInfo page to load...")
+        WebDriverWait(self.driver, 30).until(url_contains_when_ready("acInfo"))
+        self.pacing.pause("acinfo")
+
+        # Try the click strategies, most recently successful first
+        if self.click_engine.click(self.driver, "btnEntrar", BTN_ENTRAR_STRATEGIES):
+            logger.info("Current page: %s", self.driver.current_url)
+            return
+
+        logger.error("Failed to click 'Presentación sin Cl@ve' button with all methods")
+        logger.error("Current URL: %s", self.driver.current_url)
+        raise StepFailed("btnEntrar", "no click strategy worked")
+
+    def _fill_personal_data(self, wait):
+        """Fill in personal data on the acEntrada page"""
+        # Select Pasaporte once the acEntrada page has loaded
+        wait.until(ready_with_element((By.ID, "rdbTipoDocPas")))
+        pasaporte_select = wait.until(
+            EC.element_to_be_clickable((By.ID, "rdbTipoDocPas"))
+        )
+        pasaporte_select.click()
+        logger.info("Selected Pasaporte")
+
+        # Enter NIE
+        nie_input = wait.until(EC.presence_of_element_located((By.ID, "txtIdCitado")))
+        nie_input.clear()
+        nie_input.send_keys(self.nie_number)
+        logger.info("Filled NIE number")
+
+        # Enter name
+        nombre_input = self.driver.find_element(By.ID, "txtDesCitado")
+        nombre_input.clear()
+        nombre_input.send_keys(self.full_name)
+        logger.info("Filled full name")
+
+        # Select country (CHINA) - value 406
+        # pais_select = Select(self.driver.find_element(By.ID, "txtPaisNac"))
+        # country_value = os.getenv("COUNTRY_CODE", "406")  # 406 = CHINA
+        # pais_select.select_by_value(country_value)
+        # logger.info(f"Selected country with code: {country_value}")
+
+        self.pacing.pause("personal_data")
+
+    def _submit_personal_data(self, wait):
+        """Click the second "Aceptar" to submit the form and validate"""
+        aceptar_btn2 = wait.until(EC.element_to_be_clickable((By.ID, "btnEnviar")))
+        aceptar_btn2.click()
+        logger.info("Clicked Aceptar button to submit form")
+        # Both pages use the id btnEnviar, so wait for the old button to go away
+        wait.until(EC.staleness_of(aceptar_btn2))
+        wait.until(url_contains_when_ready("acValidarEntrada"))
+        self.pacing.pause("validate")
+        logger.info("Current page after submission: %s", self.driver.current_url)
+
+    def _click_solicitar(self, wait):
+        """Click "Solicitar Cita" on the validation page"""
+        solicitar_btn = wait.until(EC.element_to_be_clickable((By.ID, "btnEnviar")))
+        solicitar_btn.click()
+        logger.info("Clicked 'Solicitar Cita' button")
+        wait.until(EC.staleness_of(solicitar_btn))
+        logger.info("Current page after 'Solicitar Cita': %s", self.driver.current_url)
+
+    def _classify_page(self, wait):
+        """Classify the acCitar page from a single snapshot of the DOM"""
+        wait.until(document_ready)
+        snapshot = take_snapshot(self.driver)
+        self.timer.annotate(page_fingerprint=page_fingerprint(snapshot))
+        return self.classify_result(snapshot)
+
+    def _park(self):
+        """Remember the validation page so later checks can resume from it"""
+        self._parked_handle = self.driver.current_window_handle
+        self._parked_url = self.driver.current_url
+        self._parked_at = time.monotonic()
+        logger.info("📌 Holding position at %s", self._parked_url)
+
+    def _unpark(self):
+        """Forget the parked validation page"""
+        self._parked_handle = None
+        self._parked_url = None
+        self._parked_at = None
+
+    def _poll_parked(self, wait):
+        """
+        Redo only the "Solicitar Cita" submission from the parked validation page
+        The result opens in a second tab, so the parked tab never leaves the page
+        Returns: tuple (available: bool, message: str), or None if the session expired
+        """
+        if time.monotonic() - self._parked_at > self.park_max_seconds:
+            logger.info("Parked session is too old, walking the full flow again")
+            return None
+
+        self.timer.step("resume")
+        self.driver.switch_to.window(self._parked_handle)
+        snapshot = take_snapshot(self.driver)
+        present = snapshot["present"]
+        if (
+            snapshot["url"] != self._parked_url
+            or not present.get("btnEnviar")
+            or present.get("txtIdCitado")
+        ):
+            logger.info("Parked tab is no longer on the validation page")
+            return None
+
+        self.timer.step("solicitar_cita")
+        solicitar_btn = wait.until(EC.element_to_be_clickable((By.ID, "btnEnviar")))
+        handles_before = set(self.driver.window_handles)
+        self.driver.execute_script(
+            "if (arguments[0].form) { arguments[0].form.target = arguments[1]; }",
+            solicitar_btn,
+            RESULT_WINDOW_NAME,
+        )
+        solicitar_btn.click()
+        logger.info("Clicked 'Solicitar Cita' button (parked session)")
 
+        try:
+            wait.until(lambda d: set(d.window_handles) - handles_before)
+            result_handle = (set(self.driver.window_handles) - handles_before).pop()
+            self.driver.switch_to.window(result_handle)
+
+            self.timer.step("classification")
+            wait.until(document_ready)
+            snapshot = take_snapshot(self.driver)
+            self.timer.annotate(page_fingerprint=page_fingerprint(snapshot))
+            logger.info("Current page after 'Solicitar Cita': %s", snapshot["url"])
         finally:
-            self.close_driver()
+            if self.driver.current_window_handle != self._parked_handle:
+                self.driver.close()
+            self.driver.switch_to.window(self._parked_handle)
 
-    def send_email_notification(self, subject, message):
-        """Send email notification"""
-        try:
-            sender_email = os.getenv("SENDER_EMAIL")
-            sender_password = os.getenv("SENDER_PASSWORD")
-            receiver_email = os.getenv("RECEIVER_EMAIL")
-            smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-            smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        if session_expired(snapshot):
+            logger.info("Site reports the parked session has expired")
+            return None
+        return self.classify_result(snapshot)
 
-            if not all([sender_email, sender_password, receiver_email]):
-                logger.warning(
-                    "Email credentials not configured. Skipping email notification."
-                )
-                return False
+    # Office sweep (see sweep.py)
 
-            # Create message
-            msg = MIMEMultipart()
-            msg["From"] = sender_email
-            msg["To"] = receiver_email
-            msg["Subject"] = subject
+    def sweep_start(self):
+        """
+        Load the province page once for a sweep, in the tab every office starts from
+        Returns: list of (office value, office name) offered on it
+        """
+        _load_selenium()
+        self._unpark()
+        if self.driver is None:
+            self.timer.step("driver_setup")
+            self.setup_driver()
+        wait = WebDriverWait(self.driver, 15)
+        self.set_random_window_size()
+        self.timer.step("navigation")
+        self._navigate(wait)
+        self.timer.step("cookie_dismissal")
+        self._dismiss_cookies()
+
+        self.timer.step("office_list")
+        self._sweep_handle = self.driver.current_window_handle
+        options = self.driver.execute_script(
+            "var el = document.getElementById('sede');"
+            "if (!el) { return []; }"
+            "return Array.prototype.map.call(el.options, function (o) {"
+            "  return [o.value, o.text.trim()];"
+            "});"
+        )
+        return [
+            (value, name or value) for value, name in options if value not in ("", "-1")
+        ]
 
-            body = f"""
-            Cita Previa Alert
-            =================
+    def sweep_office(self, office_value, office_name):
+        """
+        Check one office: select it in the province tab and walk the rest of the
+        flow in a second tab, so the province page stays loaded for the next office
+        Returns: tuple (available: bool, message: str)
+        """
+        wait = WebDriverWait(self.driver, 15)
+        runner = StepRunner(
+            self.retry_policy,
+            self.timer,
+            probe=lambda: take_snapshot(self.driver),
+            on_failure=self._capture_failure if self.artifacts else None,
+        )
+        steps = [
+            FlowStep(
+                "office_select",
+                lambda: self._sweep_select_office(office_value, office_name, wait),
+                failure="Could not select office",
+            ),
+            FlowStep(
+                "tramite_select",
+                lambda: self._select_tramite(wait),
+                failure="Could not select tramite",
+                retry_when=on_page("tramiteGrupo[0]"),
+            ),
+            FlowStep(
+                "btnAceptar",
+                lambda: self._open_office_tab(wait),
+                failure="Could not click Aceptar",
+            ),
+        ]
+        steps += self._entry_steps(wait) + self._request_steps(wait)
+        try:
+            return runner.run(steps)
+        except StepFailed as e:
+            return None, e.reason
+        finally:
+            self._back_to_province_tab()
+
+    def sweep_end(self, discard=False):
+        """Hand the sweep's browser session back (or throw it away)"""
+        self._sweep_handle = None
+        if self.driver is None:
+            return
+        recycle = self._inspect_browser()
+        self.close_driver(discard=discard or recycle)
+        if self.watchdog:
+            self._reap_orphans()
+
+    def _sweep_select_office(self, office_value, office_name, wait):
+        """Select an office on the sweep's province page"""
+        self._back_to_province_tab()
+        if not take_snapshot(self.driver)["present"].get("sede"):
+            # The province page was lost (e.g. the session expired); load it again
+            self._navigate(wait)
+        sede = wait.until(EC.presence_of_element_located((By.ID, "sede")))
+        Select(sede).select_by_value(office_value)
+        # Picking an office reloads the page with its tramites; wait for the old page
+        # to go so its tramite list isn't taken for the new office's
+        try:
+            WebDriverWait(self.driver, 5).until(EC.staleness_of(sede))
+        except TimeoutException:
+            pass
+        logger.info("Selected '%s'", office_name)
+        self.pacing.pause("office_select")
+
+    def _open_office_tab(self, wait):
+        """Click Aceptar with the form sent to a new tab, and switch to that tab"""
+        aceptar_btn = wait.until(EC.element_to_be_clickable((By.ID, "btnAceptar")))
+        handles_before = set(self.driver.window_handles)
+        self.driver.execute_script(
+            "if (arguments[0].form) { arguments[0].form.target = arguments[1]; }",
+            aceptar_btn,
+            OFFICE_WINDOW_NAME,
+        )
+        aceptar_btn.click()
+        logger.info("Clicked Aceptar button")
+        wait.until(lambda d: set(d.window_handles) - handles_before)
+        office_handle = (set(self.driver.window_handles) - handles_before).pop()
+        self.driver.switch_to.window(office_handle)
+        wait.until(url_contains_when_ready("acInfo"))
+        logger.info("Current page: %s", self.driver.current_url)
+
+    def _back_to_province_tab(self):
+        """Close the office tab (if any) and return to the province page"""
+        for handle in self.driver.window_handles:
+            if handle != self._sweep_handle:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+        self.driver.switch_to.window(self._sweep_handle)
+
+    def classify_result(self, snapshot, timer=None):
+        """
+        Classify the acCitar result page
+        Args:
+            snapshot: Page snapshot from page_probe.take_snapshot
+            timer: CheckTimer to record the classification on (defaults to this check's)
+        Returns: tuple (available: bool or None, message: str)
+        """
+        classification = self.classifier.classify(snapshot)
+        (timer or self.timer).annotate(
+            page_outcome=classification.outcome.value,
+            confidence=classification.confidence,
+        )
 
-            {message}
+        outcome = classification.outcome
+        if outcome == Outcome.CLAVE_ONLY:
+            logger.info(
+                "❌ No appointments available without Cl@ve (appointments available WITH Cl@ve)"
+            )
+        elif outcome == Outcome.NO_CITAS:
+            logger.info("❌ No appointments available")
+        elif outcome == Outcome.AVAILABLE:
+            logger.info(
+                "✅ APPOINTMENTS AVAILABLE! (confidence %.2f, signals: %s)",
+                classification.confidence,
+                ", ".join(classification.signals),
+            )
+        else:
+            logger.info(
+                "⚠️ Status unclear - %s page at %s", outcome.value, snapshot["url"]
+            )
+        return classification.as_result()
 
-            Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    def send_email_notification(self, subject, message, target_key=None):
+        """
+        Queue a notification on the background dispatcher (email and any other
+        configured channels); returns immediately
+        Args:
+            target_key: Target the alert is about, for duplicate suppression
+                (defaults to this checker's target)
+        Returns: True if queued, False if suppressed as a duplicate
+        """
+        body = f"""
+        Cita Previa Alert
+        =================
 
-            URL: {self.BASE_URL}
+        {message}
 
-            Check the website immediately if appointments are available!
+        Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 
-            ---
-            This is an automated message from Cita Previa Checker Bot
-            """
+        URL: {self.BASE_URL}
 
-            msg.attach(MIMEText(body, "plain"))
+        Check the website immediately if appointments are available!
 
-            # Send email
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(sender_email, sender_password)
-                server.send_message(msg)
+        ---
+        This is an automated message from Cita Previa Checker Bot
+        """
 
-            logger.info(f"✉️ Email notification sent to {receiver_email}")
-            return True
+        if self.notifier is None:
+            self.notifier = NotificationDispatcher.from_env(self.settings)
 
-        except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
-            return False
+        queued = self.notifier.notify(
+            target_key or self.target_key, True, subject, body
+        )
+        if queued:
+            self.last_notification_time = datetime.now()
+        return queued
+
+    def release_session(self):
+        """Give up a held browser session (e.g. on shutdown)"""
+        self._unpark()
+        self.close_driver()
+        if self.engine is not None:
+            self.engine.release_session()
+
+    def handle_result(self, available, message):
+        """Notify about or log the outcome of a check"""
+        if self.notifier is not None:
+            self.notifier.observe(self.target_key, available)
+
+        if available:
+            # Appointments found! Send notification
+            subject = f"🎉 CITA PREVIA AVAILABLE – {self.TRAMITE_NAME}"
+            if self.target is not None:
+                subject += f" ({self.target.name})"
+            self.send_email_notification(subject, message)
+
+        elif available is None:
+            # Unclear status - might want to notify
+            logger.warning("Status unclear - manual check recommended")
+
+    def run_once(self):
+        """
+        Run and report a single check (for cron jobs and quick tests)
+        Returns: tuple (available: bool, message: str)
+        """
+        logger.info("🤖 Single check of %s (%s)", self.TRAMITE_NAME, self.PROVINCIA)
+        available, message = self.perform_check()
+        self.handle_result(available, message)
+        if self.first_request_at is not None:
+            logger.info(
+                "⏱️ Time to first request: %.2fs after start", self.first_request_at
+            )
+        return available, message
 
-    def run_continuous_check(self, interval_minutes=15):
+    def run_continuous_check(self, interval_minutes=None):
         """
         Run continuous checking loop
         Args:
-            interval_minutes: Minutes between checks (default 15)
+            interval_minutes: Minutes between checks (None: CHECK_INTERVAL_MINUTES,
+                following reloads)
         """
         logger.info("🤖 Starting Cita Previa Checker Bot")
-        logger.info(f"📍 Location: {self.PROVINCIA}")
-        logger.info(f"📋 Tramite: {self.TRAMITE_NAME}")
-        logger.info(f"⏱️ Check interval: {interval_minutes} minutes")
-        logger.info("=" * 60)
+        logger.info("📍 Location: %s", self.PROVINCIA)
+        logger.info("📋 Tramite: %s", self.TRAMITE_NAME)
+        if self.interval_policy:
+            logger.info(
+                "⏱️ Adaptive interval: %s checks per day",
+                self.interval_policy.checks_per_day,
+            )
+        else:
+            logger.info(
+                "⏱️ Check interval: %s minutes",
+                interval_minutes or self.settings.check_interval_minutes,
+            )
+        logger.info(BANNER)
 
         check_count = 0
 
         try:
             while True:
                 check_count += 1
-                logger.info(f"\n{'=' * 60}")
-                logger.info(
-                    f"Check #{check_count} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                )
-                logger.info(f"{'=' * 60}")
-
-                available, message = self.check_availability()
-
-                if available:
-                    # Appointments found! Send notification
-                    subject = f"🎉 CITA PREVIA AVAILABLE – {self.TRAMITE_NAME}"
-                    self.send_email_notification(subject, message)
+                logger.info("\n" + BANNER)
+                logger.info("Check #%d", check_count)
+                logger.info(BANNER)
 
-                    # You can choose to stop checking or continue
-                    # Uncomment the next line to stop after finding availability
-                    # break
+                available, message = self.perform_check()
+                self.handle_result(available, message)
 
-                elif available is None:
-                    # Unclear status - might want to notify
-                    logger.warning("Status unclear - manual check recommended")
+                # You can choose to stop checking or continue
+                # Uncomment the next lines to stop after finding availability
+                # if available:
+                #     break
 
                 # Wait before next check
-                logger.info(
-                    f"⏳ Waiting {interval_minutes} minutes until next check..."
-                )
-                # variation by +-2min
-                time.sleep(interval_minutes * 60 + random.randint(-2, 2) * 60)
+                interval = None
+                if self.interval_policy:
+                    delay = self.interval_policy.next_delay(self.target_key, available)
+                elif interval_minutes:
+                    delay = interval_minutes * 60 + random.randint(-2, 2) * 60
+                else:
+                    # variation by +-2min
+                    interval = self.current_settings.check_interval_minutes
+                    delay = interval * 60 + random.randint(-2, 2) * 60
+                logger.info("⏳ Waiting %.1f minutes until next check...", delay / 60)
+                self.wait_for_next_check(delay, interval)
 
         except KeyboardInterrupt:
             logger.info("\n\n🛑 Bot stopped by user")
-            logger.info(f"Total checks performed: {check_count}")
+            logger.info("Total checks performed: %s", check_count)
         except Exception as e:
-            logger.error(f"Fatal error in main loop: {str(e)}")
+            logger.error("Fatal error in main loop: %s", e)
             raise
 
 
+def run_watchlist(settings, log_pipeline=None, watcher=None):
+    """
+    Serve every target in a watch list from one process
+    Args:
+        settings: config.Settings (WATCHLIST_FILE names the watch list)
+        log_pipeline: LogPipeline whose counters are exported with the metrics
+        watcher: ConfigWatcher; reloaded settings and watch list edits are applied
+            to the running scheduler and checkers (optional)
+    """
+    from coordination import Coordinator
+    from scheduler import WatchScheduler
+
+    path = settings.watchlist_file
+    targets = load_watchlist(path, settings)
+    metrics = Metrics.from_env(settings)
+    if log_pipeline:
+        metrics.add_collector(log_pipeline.prometheus_lines)
+    history = HistoryStore.from_env(settings)
+    if history:
+        metrics.add_sink(history.record)
+    notifier = NotificationDispatcher.from_env(settings)
+    lean_profile = LeanProfile.from_env(settings) if settings.lean_browser else None
+    click_engine = ClickStrategyEngine.from_env(settings)
+    pacing = PacingPolicy.from_config(settings)
+    interval_policy = AdaptiveIntervalPolicy.from_env(settings)
+    watchdog = BrowserWatchdog.from_env(settings)
+    if watchdog:
+        metrics.add_collector(watchdog.prometheus_lines)
+    artifacts = ArtifactStore.from_env(settings)
+    coordinator = Coordinator.from_env(settings)
+    if coordinator:
+        logger.info(
+            "🔒 Sharing the watch list as worker '%s' (%gs leases)",
+            coordinator.worker,
+            coordinator.lease_seconds,
+        )
+
+    def pool_size_for(settings, targets):
+        # Every target shares the browser pool; at most one session per concurrent
+        # check, plus one per target when sessions are held at the validation page
+        size = max(settings.driver_pool_size, settings.max_concurrent_checks)
+        if settings.hold_position:
+            size = max(size, len(targets))
+        return size
+
+    pool = None
+    checkers = []  # every checker created, for the cleanup on shutdown
+
+    def make_checker(target, settings):
+        nonlocal pool
+        checker = CitaChecker(
+            headless=settings.headless,
+            pacing=pacing,
+            click_engine=click_engine,
+            metrics=metrics,
+            target=target,
+            notifier=notifier,
+            lean_profile=lean_profile,
+            interval_policy=interval_policy,
+            watchdog=watchdog,
+            artifacts=artifacts,
+            settings=settings,
+        )
+        if pool is None:
+            pool = DriverPool(
+                checker.create_driver,
+                max_size=pool_size_for(settings, targets),
+                max_uses=settings.driver_max_uses,
+                watchdog=watchdog,
+            )
+        checker.pool = pool
+        if settings.check_engine == "http":
+            from http_engine import HttpCheckEngine
+
+            checker.engine = HttpCheckEngine(checker)
+        checkers.append(checker)
+        return checker
+
+    entries = {
+        target.name: (target, make_checker(target, settings)) for target in targets
+    }
+    scheduler = WatchScheduler(
+        list(entries.values()),
+        max_concurrency=settings.max_concurrent_checks,
+        host_checks_per_minute=settings.host_checks_per_minute,
+        interval_policy=interval_policy,
+        coordinator=coordinator,
+    )
+
+    def reload(settings, changed):
+        """Apply reloaded settings and watch list edits in place"""
+        try:
+            targets = load_watchlist(path, settings)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error("⚙️ Keeping the current watch list: %s", e)
+            targets = [target for target, _ in entries.values()]
+
+        updated = {}
+        for target in targets:
+            previous = entries.get(target.name)
+            # Only the interval changed: keep the checker and its session
+            if previous is not None and previous[0] == dataclasses.replace(
+                target, interval_minutes=previous[0].interval_minutes
+            ):
+                updated[target.name] = (target, previous[1])
+                previous[1].update_settings(settings)
+            else:
+                updated[target.name] = (target, make_checker(target, settings))
+        entries.clear()
+        entries.update(updated)
+
+        pacing.apply_settings(settings)
+        pool.grow(pool_size_for(settings, targets))
+        scheduler.apply_settings(settings)
+        scheduler.update_targets(list(entries.values()))
+
+    if watcher:
+        watcher.watch_file(path)
+        watcher.subscribe(reload)
+        watcher.start()
+    try:
+        scheduler.run_forever()
+    finally:
+        if watcher:
+            watcher.stop()
+        for checker in checkers:
+            checker.release_session()
+            if checker.engine is not None:
+                checker.engine.close()
+        pool.close()
+        if watchdog:
+            watchdog.close()
+        if coordinator:
+            coordinator.close()
+        if artifacts:
+            artifacts.close()
+        notifier.close()
+        metrics.close()
+        if history:
+            history.close()
+
+
 def main():
     """Main entry point"""
-    # Configuration
-    CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL_MINUTES", "15"))
-    HEADLESS = os.getenv("HEADLESS", "true").lower() == "true"
+    parser = argparse.ArgumentParser(description="Cita Previa availability checker")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Run a single check of the configured target and exit "
+        "(exit status 1 if the result is unclear)",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Check every office of the province for the tramite in one session "
+        "(also enabled by SWEEP_OFFICES=true)",
+    )
+    args = parser.parse_args()
+
+    # Configuration, validated before anything starts (logging included, so report
+    # problems on stderr)
+    try:
+        settings = Settings.from_env()
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    # Log through a background queue so a slow disk never holds up a check
+    log_pipeline = LogPipeline.from_env(settings).start()
+    atexit.register(log_pipeline.stop)
+    sweep_offices = args.sweep or settings.sweep_offices
+
+    # A running daemon follows edits to the .env file (and SIGHUP)
+    watcher = None
+    if not args.once:
+        watcher = ConfigWatcher(settings, ENV_FILE, settings.config_poll_seconds)
+
+    # Several office/tramite/applicant combinations from one daemon
+    if settings.watchlist_file and not args.once:
+        run_watchlist(settings, log_pipeline, watcher)
+        return
+
+    # Every check outcome is also kept in the SQLite history
+    metrics = Metrics.from_env(settings)
+    metrics.add_collector(log_pipeline.prometheus_lines)
+    history = HistoryStore.from_env(settings)
+    if history:
+        metrics.add_sink(history.record)
+
+    # Keep browser processes within memory/age limits and clean up leftovers
+    watchdog = BrowserWatchdog.from_env(settings)
+    if watchdog:
+        metrics.add_collector(watchdog.prometheus_lines)
+
+    # Pages that failed steps ended on are kept for diagnosis
+    artifacts = ArtifactStore.from_env(settings)
+
+    # Create checker instance backed by a pool of warm browser sessions
+    checker = CitaChecker(
+        headless=settings.headless,
+        metrics=metrics,
+        notifier=NotificationDispatcher.from_env(settings),
+        lean_profile=LeanProfile.from_env(settings) if settings.lean_browser else None,
+        interval_policy=AdaptiveIntervalPolicy.from_env(settings),
+        watchdog=watchdog,
+        artifacts=artifacts,
+        settings=settings,
+    )
+    checker.pool = DriverPool(
+        checker.create_driver,
+        max_size=settings.driver_pool_size,
+        max_uses=settings.driver_max_uses,
+        watchdog=watchdog,
+    )
 
-    # Create checker instance
-    checker = CitaChecker(headless=HEADLESS)
+    # Optionally replay the flow over plain HTTP, with Selenium as the fallback
+    if settings.check_engine == "http":
+        from http_engine import HttpCheckEngine
 
-    # Run continuous checking
-    checker.run_continuous_check(interval_minutes=CHECK_INTERVAL)
+        checker.engine = HttpCheckEngine(checker)
+        logger.info("Using HTTP check engine with Selenium fallback")
+
+    # Reloaded settings are taken over when the next check starts
+    if watcher:
+        watcher.subscribe(lambda settings, changed: checker.update_settings(settings))
+        watcher.start()
+
+    # Run continuous checking, or a single check, of one office or all of them
+    unclear = False
+    try:
+        if sweep_offices:
+            from sweep import OfficeSweep
+
+            sweep = OfficeSweep.from_config(checker)
+            if args.once:
+                results = sweep.run_once()
+                unclear = not results or any(r.available is None for r in results)
+            else:
+                sweep.run_forever()
+        elif args.once:
+            available, _ = checker.run_once()
+            unclear = available is None
+        else:
+            checker.run_continuous_check()
+    finally:
+        if watcher:
+            watcher.stop()
+        checker.release_session()
+        if checker.engine is not None:
+            checker.engine.close()
+        checker.pool.close()
+        if watchdog:
+            watchdog.close()
+        if artifacts:
+            artifacts.close()
+        checker.notifier.close()
+        checker.metrics.close()
+        if history:
+            history.close()
+    if unclear:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
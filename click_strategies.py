@@ -0,0 +1,178 @@
+"""
+Locator/click strategy engine for Cita Previa Checker Bot
+Tries click strategies with short bounded attempts and remembers which one works per step
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Locator strategies, as in selenium.webdriver.common.by.By (plain strings, spelled out
+# here so that importing this module doesn't load Selenium's webdriver package)
+BY_ID = "id"
+
+
+def click_when_clickable(locator):
+    """Strategy: wait for the element to be clickable and click it natively"""
+
+    def _click(driver, timeout):
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable(locator)
+        ).click()
+
+    return _click
+
+
+def click_with_javascript(locator):
+    """Strategy: wait for the element to be present and click it from JavaScript"""
+
+    def _click(driver, timeout):
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        element = WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located(locator)
+        )
+        driver.execute_script("arguments[0].click();", element)
+
+    return _click
+
+
+def submit_form(locator):
+    """
+    Strategy: submit the element's form from JavaScript as if the element were clicked,
+    without waiting for it (the other strategies have already waited)
+    """
+
+    def _submit(driver, timeout):
+        element = driver.find_element(*locator)
+        driver.execute_script(
+            "var form = arguments[0].form;"
+            "if (form.requestSubmit) { form.requestSubmit(arguments[0]); }"
+            "else { form.submit(); }",
+            element,
+        )
+
+    return _submit
+
+
+# "Presentación sin Cl@ve" button on the acInfo page
+BTN_ENTRAR_STRATEGIES = [
+    ("id", click_when_clickable((BY_ID, "btnEntrar"))),
+    ("javascript", click_with_javascript((BY_ID, "btnEntrar"))),
+    ("submit", submit_form((BY_ID, "btnEntrar"))),
+]
+
+
+class ClickStrategyEngine:
+    """Run click strategies, preferring the last one that worked for each step"""
+
+    def __init__(self, state_file="click_strategies.json", attempt_timeout=5):
+        """
+        Args:
+            state_file: JSON file where preferred strategies and stats are persisted
+            attempt_timeout: Seconds each strategy may wait for its element
+        """
+        self.state_file = state_file
+        self.attempt_timeout = attempt_timeout
+        self._lock = threading.Lock()
+        self.state = self._load()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the engine from CLICK_STRATEGY_FILE / CLICK_ATTEMPT_SECONDS in
+        config.Settings (None: read from the environment)
+        """
+        settings = settings or config.Settings.from_env()
+        return cls(
+            state_file=settings.click_strategy_file,
+            attempt_timeout=settings.click_attempt_seconds,
+        )
+
+    def click(self, driver, step, strategies):
+        """
+        Click the element for a step, trying the preferred strategy first
+        Args:
+            driver: WebDriver positioned on the page
+            step: Name of the flow step (key for persistence)
+            strategies: List of (name, callable(driver, timeout)) tuples
+        Returns: name of the strategy that succeeded, or None if all failed
+        """
+        preferred = self.state.get(step, {}).get("preferred")
+        ordered = sorted(strategies, key=lambda item: item[0] != preferred)
+
+        for name, strategy in ordered:
+            logger.info("Attempting to click '%s' by %s...", step, name)
+            started = time.monotonic()
+            try:
+                strategy(driver, self.attempt_timeout)
+            except Exception as e:
+                self._record(step, name, False, time.monotonic() - started)
+                if name == preferred:
+                    logger.warning(
+                        "Preferred strategy '%s' for '%s' failed, the site may have changed: %s",
+                        name,
+                        step,
+                        e,
+                    )
+                else:
+                    logger.warning("Could not click '%s' by %s: %s", step, name, e)
+                continue
+
+            self._record(step, name, True, time.monotonic() - started)
+            logger.info("✓ Clicked '%s' by %s", step, name)
+            return name
+
+        return None
+
+    def stats(self, step):
+        """Per-strategy success/failure counts and latency for a step"""
+        return self.state.get(step, {}).get("strategies", {})
+
+    def _record(self, step, name, success, latency):
+        """Update counters and the preferred strategy, then persist"""
+        with self._lock:
+            step_state = self.state.setdefault(
+                step, {"preferred": None, "strategies": {}}
+            )
+            entry = step_state["strategies"].setdefault(
+                name,
+                {"success": 0, "failure": 0, "total_seconds": 0.0, "last_seconds": 0.0},
+            )
+            entry["success" if success else "failure"] += 1
+            entry["total_seconds"] = round(entry["total_seconds"] + latency, 3)
+            entry["last_seconds"] = round(latency, 3)
+            if success:
+                step_state["preferred"] = name
+            self._save()
+
+    def _load(self):
+        """Load persisted state, starting empty if the file is missing or corrupt"""
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning("Ignoring unreadable click strategy file: %s", e)
+            return {}
+
+    def _save(self):
+        """Persist state atomically so a crash never leaves a half-written file"""
+        tmp_file = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logger.warning("Could not save click strategy file: %s", e)
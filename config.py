@@ -1,33 +1,487 @@
 """
 Configuration settings for Cita Previa Checker Bot
-You can modify these values or use environment variables
+Typed settings read from the environment and the .env file, validated at startup, and
+reloaded while the bot runs when the file changes or the process receives SIGHUP
 """
 
-# Check interval (in minutes)
-CHECK_INTERVAL_MINUTES = 15  # Check every 15 minutes
+import logging
+import os
+import signal
+import threading
+from dataclasses import dataclass, field, fields
+from urllib.parse import urlsplit
 
-# Browser settings
-HEADLESS_MODE = True  # Set to False to see the browser in action
+from dotenv import dotenv_values, find_dotenv
 
-# Cita Previa Details
-PROVINCIA = "Barcelona"
-TRAMITE_TYPE = "TOMA DE HUELLAS"
+logger = logging.getLogger(__name__)
 
-# Email notification settings (configure in .env file)
-# SENDER_EMAIL = your email
-# SENDER_PASSWORD = your app password (for Gmail, use App Password, not regular password)
-# RECEIVER_EMAIL = email to receive notifications
-# SMTP_SERVER = smtp.gmail.com (for Gmail)
-# SMTP_PORT = 587
+TRUE_VALUES = ("true", "1", "yes", "on")
+FALSE_VALUES = ("false", "0", "no", "off", "")
 
-# Personal information (required by the form)
-# NIE_NUMBER = your NIE or passport number
-# FULL_NAME = your full name as it appears on documents
+CHECK_ENGINES = ("selenium", "http")
+LOG_FORMATS = ("text", "json")
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LOG_ROTATE_WHENS = ("S", "M", "H", "D", "MIDNIGHT") + tuple(f"W{d}" for d in range(7))
+NOTIFY_CHANNELS = ("email", "webhook", "file")
+COORDINATION_SCHEMES = ("sqlite", "redis", "rediss")
 
-# Logging
-LOG_FILE = "cita_checker.log"
 
-# Advanced settings
-TIMEOUT_SECONDS = 15  # Timeout for page loads
-RETRY_ON_ERROR = True
-MAX_RETRIES = 3
+class ConfigError(ValueError):
+    """One or more settings are invalid"""
+
+    def __init__(self, problems):
+        super().__init__("Invalid configuration:\n  " + "\n  ".join(problems))
+        self.problems = problems
+
+
+def setting(env, default, restart=False):
+    """
+    Declare a setting
+    Args:
+        env: Environment variable it is read from
+        default: Value used when the variable is unset
+        restart: Changes only take effect after a restart
+    """
+    return field(default=default, metadata={"env": env, "restart": restart})
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Every setting the bot reads"""
+
+    # Target of the single-target mode (empty: CitaChecker's built-in target)
+    provincia_url: str = setting("PROVINCIA_URL", "")
+    provincia: str = setting("PROVINCIA", "")
+    office_value: str = setting("OFFICE_VALUE", "")
+    office_name: str = setting("OFFICE_NAME", "")
+    tramite_value: str = setting("TRAMITE_VALUE", "")
+    tramite_name: str = setting("TRAMITE_NAME", "")
+
+    # Applicant data required by the form
+    nie_number: str = setting("NIE_NUMBER", "X1234567A")
+    full_name: str = setting("FULL_NAME", "TEST USER")
+
+    # Check interval (in minutes)
+    check_interval_minutes: float = setting("CHECK_INTERVAL_MINUTES", 15.0)
+
+    # Hold position at the validation page
+    hold_position: bool = setting("HOLD_POSITION", False)
+    park_max_minutes: float = setting("PARK_MAX_MINUTES", 30.0)
+
+    # Step retries
+    retry_on_error: bool = setting("RETRY_ON_ERROR", True)
+    max_retries: int = setting("MAX_RETRIES", 3)
+    retry_base_seconds: float = setting("RETRY_BASE_SECONDS", 1.0)
+    retry_max_seconds: float = setting("RETRY_MAX_SECONDS", 15.0)
+
+    # Pauses between steps of the flow
+    pacing_min_seconds: float = setting("PACING_MIN_SECONDS", 0.5)
+    pacing_max_seconds: float = setting("PACING_MAX_SECONDS", 1.5)
+
+    # Watch list scheduling
+    max_concurrent_checks: int = setting("MAX_CONCURRENT_CHECKS", 2)
+    host_checks_per_minute: float = setting("HOST_CHECKS_PER_MINUTE", 4.0)
+
+    # Office sweep
+    sweep_office_spacing_seconds: float = setting("SWEEP_OFFICE_SPACING_SECONDS", 15.0)
+    sweep_max_offices: int = setting("SWEEP_MAX_OFFICES", 0)
+
+    # Process setup (read once at startup)
+    headless: bool = setting("HEADLESS", True, restart=True)
+    driver_pool_size: int = setting("DRIVER_POOL_SIZE", 1, restart=True)
+    driver_max_uses: int = setting("DRIVER_MAX_USES", 20, restart=True)
+    check_engine: str = setting("CHECK_ENGINE", "selenium", restart=True)
+    watchlist_file: str = setting("WATCHLIST_FILE", "", restart=True)
+    lean_browser: bool = setting("LEAN_BROWSER", False, restart=True)
+    sweep_offices: bool = setting("SWEEP_OFFICES", False, restart=True)
+    config_poll_seconds: float = setting("CONFIG_POLL_SECONDS", 5.0, restart=True)
+
+    # Browser binaries, lean profile and click strategies (read when Chrome starts)
+    chromedriver_path: str = setting("CHROMEDRIVER_PATH", "", restart=True)
+    chrome_binary: str = setting("CHROME_BINARY", "", restart=True)
+    driver_cache_file: str = setting(
+        "DRIVER_CACHE_FILE", ".driver_cache.json", restart=True
+    )
+    lean_profile_dir: str = setting("LEAN_PROFILE_DIR", ".chrome-lean", restart=True)
+    lean_block_patterns: str = setting("LEAN_BLOCK_PATTERNS", "", restart=True)
+    click_strategy_file: str = setting(
+        "CLICK_STRATEGY_FILE", "click_strategies.json", restart=True
+    )
+    click_attempt_seconds: float = setting("CLICK_ATTEMPT_SECONDS", 5.0, restart=True)
+
+    # Browser watchdog
+    browser_watchdog: bool = setting("BROWSER_WATCHDOG", True, restart=True)
+    browser_max_rss_mb: float = setting("BROWSER_MAX_RSS_MB", 1536.0, restart=True)
+    browser_max_age_minutes: float = setting(
+        "BROWSER_MAX_AGE_MINUTES", 360.0, restart=True
+    )
+
+    # Adaptive interval (0 checks per day: fixed interval)
+    check_budget_per_day: int = setting("CHECK_BUDGET_PER_DAY", 0, restart=True)
+    check_min_interval_minutes: float = setting(
+        "CHECK_MIN_INTERVAL_MINUTES", 3.0, restart=True
+    )
+    check_max_interval_minutes: float = setting(
+        "CHECK_MAX_INTERVAL_MINUTES", 120.0, restart=True
+    )
+    error_backoff_max_minutes: float = setting(
+        "ERROR_BACKOFF_MAX_MINUTES", 120.0, restart=True
+    )
+    history_days: int = setting("HISTORY_DAYS", 28, restart=True)
+
+    # Coordination between workers sharing a watch list
+    coordination_url: str = setting("COORDINATION_URL", "", restart=True)
+    coordination_worker_id: str = setting("COORDINATION_WORKER_ID", "", restart=True)
+    coordination_lease_seconds: float = setting(
+        "COORDINATION_LEASE_SECONDS", 120.0, restart=True
+    )
+
+    # Notifications
+    notify_channels: str = setting("NOTIFY_CHANNELS", "email", restart=True)
+    notify_webhook_url: str = setting("NOTIFY_WEBHOOK_URL", "", restart=True)
+    notify_file: str = setting("NOTIFY_FILE", "cita_notifications.log", restart=True)
+    notify_cooldown_minutes: float = setting(
+        "NOTIFY_COOLDOWN_MINUTES", 60.0, restart=True
+    )
+    notify_max_retries: int = setting("NOTIFY_MAX_RETRIES", 3, restart=True)
+    sender_email: str = setting("SENDER_EMAIL", "", restart=True)
+    sender_password: str = setting("SENDER_PASSWORD", "", restart=True)
+    receiver_email: str = setting("RECEIVER_EMAIL", "", restart=True)
+    smtp_server: str = setting("SMTP_SERVER", "smtp.gmail.com", restart=True)
+    smtp_port: int = setting("SMTP_PORT", 587, restart=True)
+
+    # Logging
+    log_level: str = setting("LOG_LEVEL", "INFO", restart=True)
+    log_file: str = setting("LOG_FILE", "cita_checker.log", restart=True)
+    log_format: str = setting("LOG_FORMAT", "text", restart=True)
+    log_max_mb: float = setting("LOG_MAX_MB", 10.0, restart=True)
+    log_rotate_when: str = setting("LOG_ROTATE_WHEN", "", restart=True)
+    log_backup_count: int = setting("LOG_BACKUP_COUNT", 5, restart=True)
+    log_compress: bool = setting("LOG_COMPRESS", True, restart=True)
+    log_queue_size: int = setting("LOG_QUEUE_SIZE", 10000, restart=True)
+
+    # Failure artifacts, metrics and history (empty paths disable them)
+    artifacts_dir: str = setting("ARTIFACTS_DIR", "artifacts", restart=True)
+    artifacts_max_mb: float = setting("ARTIFACTS_MAX_MB", 50.0, restart=True)
+    artifact_screenshots: bool = setting("ARTIFACT_SCREENSHOTS", True, restart=True)
+    metrics_file: str = setting("METRICS_FILE", "", restart=True)
+    metrics_port: int = setting("METRICS_PORT", 0, restart=True)
+    metrics_host: str = setting("METRICS_HOST", "127.0.0.1", restart=True)
+    history_db: str = setting("HISTORY_DB", "cita_history.sqlite3", restart=True)
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        Read and validate the settings
+        Args:
+            environ: Mapping to read from (defaults to os.environ)
+        Raises: ConfigError listing every invalid setting
+        """
+        environ = os.environ if environ is None else environ
+        values = {}
+        problems = []
+        for f in fields(cls):
+            env = f.metadata["env"]
+            raw = environ.get(env)
+            # An empty number means the default, as an unset variable does
+            if raw is None or (not raw.strip() and f.type in (int, float)):
+                continue
+            try:
+                values[f.name] = _parse(f.type, raw.strip())
+            except ValueError:
+                problems.append(f"{env}={raw!r} is not a valid {f.type.__name__}")
+        settings = cls(**values)
+        problems += settings.problems()
+        if problems:
+            raise ConfigError(problems)
+        return settings
+
+    def problems(self):
+        """Describe every value out of range (empty if the settings are usable)"""
+        problems = []
+
+        def require(ok, message):
+            if not ok:
+                problems.append(message)
+
+        require(self.check_interval_minutes > 0, "CHECK_INTERVAL_MINUTES must be > 0")
+        require(self.park_max_minutes > 0, "PARK_MAX_MINUTES must be > 0")
+        require(self.max_retries >= 0, "MAX_RETRIES must be >= 0")
+        require(self.retry_base_seconds >= 0, "RETRY_BASE_SECONDS must be >= 0")
+        require(
+            self.retry_max_seconds >= self.retry_base_seconds,
+            "RETRY_MAX_SECONDS must be >= RETRY_BASE_SECONDS",
+        )
+        require(self.pacing_min_seconds >= 0, "PACING_MIN_SECONDS must be >= 0")
+        require(
+            self.pacing_max_seconds >= self.pacing_min_seconds,
+            "PACING_MAX_SECONDS must be >= PACING_MIN_SECONDS",
+        )
+        require(self.max_concurrent_checks >= 1, "MAX_CONCURRENT_CHECKS must be >= 1")
+        require(self.host_checks_per_minute >= 0, "HOST_CHECKS_PER_MINUTE must be >= 0")
+        require(
+            self.sweep_office_spacing_seconds >= 0,
+            "SWEEP_OFFICE_SPACING_SECONDS must be >= 0",
+        )
+        require(self.sweep_max_offices >= 0, "SWEEP_MAX_OFFICES must be >= 0")
+        require(self.driver_pool_size >= 1, "DRIVER_POOL_SIZE must be >= 1")
+        require(self.driver_max_uses >= 1, "DRIVER_MAX_USES must be >= 1")
+        require(
+            self.check_engine in CHECK_ENGINES,
+            f"CHECK_ENGINE must be one of: {', '.join(CHECK_ENGINES)}",
+        )
+        require(self.config_poll_seconds >= 0, "CONFIG_POLL_SECONDS must be >= 0")
+        require(
+            not self.provincia_url or urlsplit(self.provincia_url).netloc,
+            f"PROVINCIA_URL '{self.provincia_url}' is not a URL",
+        )
+        require(
+            not self.watchlist_file or os.path.isfile(self.watchlist_file),
+            f"WATCHLIST_FILE '{self.watchlist_file}' does not exist",
+        )
+        require(self.click_attempt_seconds > 0, "CLICK_ATTEMPT_SECONDS must be > 0")
+        require(self.browser_max_rss_mb > 0, "BROWSER_MAX_RSS_MB must be > 0")
+        require(self.browser_max_age_minutes > 0, "BROWSER_MAX_AGE_MINUTES must be > 0")
+        require(self.check_budget_per_day >= 0, "CHECK_BUDGET_PER_DAY must be >= 0")
+        require(
+            0 < self.check_min_interval_minutes <= self.check_max_interval_minutes,
+            "CHECK_MIN_INTERVAL_MINUTES must be > 0 and <= CHECK_MAX_INTERVAL_MINUTES",
+        )
+        require(
+            self.error_backoff_max_minutes > 0, "ERROR_BACKOFF_MAX_MINUTES must be > 0"
+        )
+        require(self.history_days >= 1, "HISTORY_DAYS must be >= 1")
+        scheme = urlsplit(self.coordination_url).scheme
+        require(
+            not self.coordination_url
+            or (scheme in COORDINATION_SCHEMES and scheme != "sqlite")
+            or self.coordination_url.startswith("sqlite:///"),
+            "COORDINATION_URL must be sqlite:///path or redis://host:port/db",
+        )
+        require(
+            self.coordination_lease_seconds > 0,
+            "COORDINATION_LEASE_SECONDS must be > 0",
+        )
+        unknown = set(self.notify_channel_names) - set(NOTIFY_CHANNELS)
+        require(
+            not unknown,
+            f"NOTIFY_CHANNELS: unknown channel(s) {', '.join(sorted(unknown))} "
+            f"(use {', '.join(NOTIFY_CHANNELS)})",
+        )
+        require(
+            self.notify_cooldown_minutes >= 0, "NOTIFY_COOLDOWN_MINUTES must be >= 0"
+        )
+        require(self.notify_max_retries >= 0, "NOTIFY_MAX_RETRIES must be >= 0")
+        require(0 < self.smtp_port < 65536, "SMTP_PORT must be between 1 and 65535")
+        require(
+            self.log_level.upper() in LOG_LEVELS,
+            f"LOG_LEVEL must be one of: {', '.join(LOG_LEVELS)}",
+        )
+        require(
+            self.log_format.lower() in LOG_FORMATS,
+            f"LOG_FORMAT must be one of: {', '.join(LOG_FORMATS)}",
+        )
+        require(self.log_max_mb > 0, "LOG_MAX_MB must be > 0")
+        require(
+            not self.log_rotate_when
+            or self.log_rotate_when.upper() in LOG_ROTATE_WHENS,
+            "LOG_ROTATE_WHEN must be one of: S, M, H, D, midnight, W0-W6",
+        )
+        require(self.log_backup_count >= 0, "LOG_BACKUP_COUNT must be >= 0")
+        require(self.log_queue_size >= 1, "LOG_QUEUE_SIZE must be >= 1")
+        require(self.artifacts_max_mb > 0, "ARTIFACTS_MAX_MB must be > 0")
+        require(
+            0 <= self.metrics_port < 65536,
+            "METRICS_PORT must be between 1 and 65535 (0 or empty: disabled)",
+        )
+        return problems
+
+    @property
+    def notify_channel_names(self):
+        """NOTIFY_CHANNELS as a list of lowercase names"""
+        return [n.strip().lower() for n in self.notify_channels.split(",") if n.strip()]
+
+    def changed(self, other):
+        """Names of the settings that differ from other"""
+        return [
+            f.name
+            for f in fields(self)
+            if getattr(self, f.name) != getattr(other, f.name)
+        ]
+
+    @classmethod
+    def env_name(cls, name):
+        """Environment variable a setting is read from"""
+        return cls.__dataclass_fields__[name].metadata["env"]
+
+    @classmethod
+    def needs_restart(cls, name):
+        """True if changes to the setting only apply after a restart"""
+        return cls.__dataclass_fields__[name].metadata["restart"]
+
+
+def _parse(kind, raw):
+    """Convert an environment string to a setting's type"""
+    if kind is bool:
+        if raw.lower() in TRUE_VALUES:
+            return True
+        if raw.lower() in FALSE_VALUES:
+            return False
+        raise ValueError(raw)
+    if kind is str:
+        return raw
+    return kind(raw)
+
+
+# Variables set before the .env file was loaded; they take precedence over the file,
+# on reloads as well
+_process_environ = None
+_file_keys = set()
+
+
+def config_file():
+    """The .env file settings are loaded from (CONFIG_FILE overrides the lookup)"""
+    return os.getenv("CONFIG_FILE") or find_dotenv() or ".env"
+
+
+def load_environment(path=None):
+    """
+    Load the .env file into os.environ, under the variables already set
+    Returns: the path of the file
+    """
+    global _process_environ
+    if _process_environ is None:
+        _process_environ = dict(os.environ)
+    path = path or config_file()
+    _apply_file(path, _read_file(path))
+    return path
+
+
+def _read_file(path):
+    """Values from the .env file ({} if it doesn't exist)"""
+    if not os.path.isfile(path):
+        return {}
+    return {k: v for k, v in dotenv_values(path).items() if v is not None}
+
+
+def _apply_file(path, values):
+    """Update os.environ to the file's values, leaving process variables alone"""
+    global _file_keys
+    for key in _file_keys - set(values):
+        if key not in _process_environ:
+            os.environ.pop(key, None)
+    for key, value in values.items():
+        if key not in _process_environ:
+            os.environ[key] = value
+    _file_keys = set(values)
+
+
+class ConfigWatcher:
+    """Reload the settings when the .env file changes or on SIGHUP"""
+
+    def __init__(self, settings, path, poll_seconds=5.0):
+        """
+        Args:
+            settings: Settings currently in use
+            path: .env file to watch
+            poll_seconds: How often the file's modification time is checked
+                (0: only reload on SIGHUP)
+        """
+        self.settings = settings
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.reloads = 0
+        self._files = {path: self._mtime(path)}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def watch_file(self, path):
+        """Also reload when this file (e.g. the watch list) changes"""
+        self._files[path] = self._mtime(path)
+
+    def subscribe(self, callback):
+        """Call callback(settings, changed) after every reload"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """Start watching in a background thread"""
+        if (
+            hasattr(signal, "SIGHUP")
+            and threading.current_thread() is threading.main_thread()
+        ):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._wake.set())
+        self._thread = threading.Thread(target=self._run, name="config", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def reload(self):
+        """
+        Re-read the .env file and tell subscribers what changed
+        Invalid settings are logged and the current ones kept
+        Returns: True if the new settings were applied
+        """
+        with self._lock:
+            for path in self._files:
+                self._files[path] = self._mtime(path)
+            values = _read_file(self.path)
+            environ = dict(os.environ)
+            for key in _file_keys - set(values):
+                environ.pop(key, None)
+            environ.update(values)
+            environ.update(_process_environ or {})
+            try:
+                settings = Settings.from_env(environ)
+            except ConfigError as e:
+                logger.error("⚙️ Keeping the current settings: %s", e)
+                return False
+            _apply_file(self.path, values)
+
+            changed = settings.changed(self.settings)
+            self.settings = settings
+            self.reloads += 1
+
+        applied = [
+            Settings.env_name(n) for n in changed if not Settings.needs_restart(n)
+        ]
+        pending = [Settings.env_name(n) for n in changed if Settings.needs_restart(n)]
+        if applied:
+            logger.info("⚙️ Reloaded settings: %s", ", ".join(applied))
+        if pending:
+            logger.warning("⚙️ Restart to apply: %s", ", ".join(pending))
+        for callback in self._callbacks:
+            try:
+                callback(settings, changed)
+            except Exception as e:
+                logger.error("Could not apply reloaded settings: %s", e)
+        return True
+
+    def _changed_files(self):
+        return [
+            path for path, mtime in self._files.items() if self._mtime(path) != mtime
+        ]
+
+    def _run(self):
+        while not self._stopped:
+            hangup = self._wake.wait(self.poll_seconds or None)
+            self._wake.clear()
+            if self._stopped:
+                return
+            if hangup:
+                logger.info("⚙️ SIGHUP received, reloading settings")
+            elif not self._changed_files():
+                continue
+            self.reload()
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
@@ -0,0 +1,292 @@
+"""
+Lease-based coordination for Cita Previa Checker Bot
+Lets several processes or hosts share one watch list: a worker leases a target before
+checking it, heartbeats while the check runs and releases the lease with the outcome and
+the time the target is next due, so every target is checked by one worker at a time
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Lease:
+    """The right to check one target until expires_at (unless heartbeated)"""
+
+    target: str
+    worker: str
+    token: str
+    expires_at: float
+
+
+def default_worker_id():
+    """host:pid, unique per running process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def open_backend(url):
+    """
+    Coordination backend from a URL
+    Args:
+        url: sqlite:///relative.db or sqlite:////absolute.db (one host) or
+            redis://host:port/db (several hosts)
+    """
+    scheme = urlsplit(url).scheme
+    if scheme == "sqlite":
+        if not url.startswith("sqlite:///"):
+            raise ValueError(f"Expected sqlite:///path, got '{url}'")
+        return SqliteLeaseBackend(url[len("sqlite:///") :])
+    if scheme in ("redis", "rediss"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "COORDINATION_URL uses Redis but the 'redis' package is not installed "
+                "(pip install redis)"
+            )
+        return RedisLeaseBackend(redis.Redis.from_url(url, decode_responses=True))
+    raise ValueError(f"Unsupported coordination URL '{url}'")
+
+
+class Coordinator:
+    """A worker's view of the shared lease backend"""
+
+    def __init__(self, backend, worker=None, lease_seconds=120):
+        """
+        Args:
+            backend: SqliteLeaseBackend or RedisLeaseBackend
+            worker: Worker id recorded with leases (defaults to host:pid)
+            lease_seconds: Lease TTL; a crashed worker's targets are free again after this
+        """
+        self.backend = backend
+        self.worker = worker or default_worker_id()
+        self.lease_seconds = lease_seconds
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the coordinator from COORDINATION_URL etc. in config.Settings (None: read
+        from the environment), or None if not enabled
+        """
+        settings = settings or config.Settings.from_env()
+        if not settings.coordination_url:
+            return None
+        return cls(
+            open_backend(settings.coordination_url),
+            worker=settings.coordination_worker_id or None,
+            lease_seconds=settings.coordination_lease_seconds,
+        )
+
+    @property
+    def heartbeat_seconds(self):
+        return self.lease_seconds / 3
+
+    def acquire(self, target):
+        """Lease a target for a check; None if it is leased elsewhere or not due"""
+        return self.backend.acquire(target, self.worker, self.lease_seconds)
+
+    def heartbeat(self, lease):
+        """Extend a lease while its check runs; False if it was lost"""
+        alive = self.backend.heartbeat(lease, self.lease_seconds)
+        if not alive:
+            logger.warning("Lease on '%s' was lost during the check", lease.target)
+        return alive
+
+    def release(self, lease, available, delay):
+        """Give the target back with the outcome, due again after delay seconds"""
+        self.backend.release(lease, available, time.time() + delay)
+
+    def wait_seconds(self, target):
+        """How long to wait before trying to lease a target again"""
+        poll = min(30.0, self.lease_seconds / 4)
+        return max(poll, self.backend.next_due(target) - time.time())
+
+    def close(self):
+        self.backend.close()
+
+
+class SqliteLeaseBackend:
+    """Leases in a SQLite file shared by the worker processes of one host"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS leases (
+        target TEXT PRIMARY KEY,
+        worker TEXT,
+        token TEXT,
+        expires_at REAL NOT NULL DEFAULT 0,
+        next_due REAL NOT NULL DEFAULT 0,
+        last_outcome TEXT,
+        last_worker TEXT,
+        last_checked REAL
+    )
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Autocommit mode: the one transaction that needs to be atomic is explicit
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def acquire(self, target, worker, ttl):
+        """
+        Lease a target that is due and not leased by a live worker
+        Returns: Lease, or None if another worker holds it or it isn't due yet
+        """
+        with self._lock:
+            return self._acquire(target, worker, ttl)
+
+    def _acquire(self, target, worker, ttl):
+        now = time.time()
+        connection = self._connection
+        # BEGIN IMMEDIATE takes the write lock, so check-and-claim is atomic across processes
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT token, expires_at, next_due FROM leases WHERE target = ?",
+                (target,),
+            ).fetchone()
+            if row and ((row[0] and row[1] > now) or row[2] > now):
+                connection.execute("ROLLBACK")
+                return None
+            lease = Lease(target, worker, uuid.uuid4().hex, now + ttl)
+            connection.execute(
+                "INSERT INTO leases (target, worker, token, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(target) DO UPDATE SET worker = excluded.worker, "
+                "token = excluded.token, expires_at = excluded.expires_at",
+                (target, worker, lease.token, lease.expires_at),
+            )
+            connection.execute("COMMIT")
+            return lease
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, lease, ttl):
+        """Extend a lease; False if it was lost (expired and taken over)"""
+        expires_at = time.time() + ttl
+        with self._lock:
+            updated = self._connection.execute(
+                "UPDATE leases SET expires_at = ? WHERE target = ? AND token = ?",
+                (expires_at, lease.target, lease.token),
+            ).rowcount
+        if updated:
+            lease.expires_at = expires_at
+        return bool(updated)
+
+    def release(self, lease, outcome, next_due):
+        """Give the target back with the check's outcome and when it is next due"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE leases SET token = NULL, worker = NULL, expires_at = 0, "
+                "next_due = ?, last_outcome = ?, last_worker = ?, last_checked = ? "
+                "WHERE target = ? AND token = ?",
+                (
+                    next_due,
+                    json.dumps(outcome),
+                    lease.worker,
+                    time.time(),
+                    lease.target,
+                    lease.token,
+                ),
+            )
+
+    def next_due(self, target):
+        """When the target may next be leased (0 if now)"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT expires_at, next_due FROM leases WHERE target = ?", (target,)
+            ).fetchone()
+        return max(row) if row else 0.0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class RedisLeaseBackend:
+    """Leases in Redis, for workers spread over several hosts"""
+
+    def __init__(self, client, prefix="cita"):
+        """
+        Args:
+            client: redis.Redis (decode_responses=True)
+            prefix: Key prefix
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def acquire(self, target, worker, ttl):
+        """
+        Lease a target that is due and not leased by a live worker
+        Returns: Lease, or None if another worker holds it or it isn't due yet
+        """
+        if self.next_due(target) > time.time():
+            return None
+        lease = Lease(target, worker, uuid.uuid4().hex, time.time() + ttl)
+        if not self.client.set(
+            self._key("lease", target), lease.token, nx=True, px=int(ttl * 1000)
+        ):
+            return None
+        # Another worker may have checked and released the target between our due
+        # check and the claim; its release moved the due time forward
+        if self.next_due(target) > time.time():
+            self.client.delete(self._key("lease", target))
+            return None
+        return lease
+
+    def heartbeat(self, lease, ttl):
+        """Extend a lease; False if it was lost (expired and taken over)"""
+        key = self._key("lease", lease.target)
+        if self.client.get(key) != lease.token:
+            return False
+        self.client.pexpire(key, int(ttl * 1000))
+        lease.expires_at = time.time() + ttl
+        return True
+
+    def release(self, lease, outcome, next_due):
+        """Give the target back with the check's outcome and when it is next due"""
+        key = self._key("lease", lease.target)
+        holder = self.client.get(key)
+        if holder not in (lease.token, None):
+            # Lease expired and another worker took over; its release will count
+            return
+        self.client.set(self._key("due", lease.target), repr(next_due))
+        self.client.set(
+            self._key("last", lease.target),
+            json.dumps(
+                {"outcome": outcome, "worker": lease.worker, "checked": time.time()}
+            ),
+        )
+        # get-then-delete isn't atomic; a takeover in between would only shorten a
+        # lease that expired anyway, and the due time written above still applies
+        if holder is not None:
+            self.client.delete(key)
+
+    def next_due(self, target):
+        """When the target may next be leased (0 if now)"""
+        due = self.client.get(self._key("due", target))
+        return float(due) if due else 0.0
+
+    def close(self):
+        close = getattr(self.client, "close", None)
+        if close:
+            close()
+
+    def _key(self, kind, target):
+        return f"{self.prefix}:{kind}:{target}"
@@ -0,0 +1,144 @@
+"""
+WebDriver session pool for Cita Previa Checker Bot
+Keeps warm Chrome sessions around between checks instead of cold-starting one every cycle
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Script used to wipe per-origin storage before a session is handed out again
+CLEAR_STORAGE_SCRIPT = """
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+"""
+
+
+class DriverPool:
+    """Pool of reusable WebDriver sessions with checkout/return semantics"""
+
+    def __init__(self, driver_factory, max_size=1, max_uses=20, watchdog=None):
+        """
+        Args:
+            driver_factory: Callable returning a new WebDriver instance
+            max_size: Maximum number of live sessions (checked out + idle)
+            max_uses: Recycle a session after it has served this many checks
+            watchdog: BrowserWatchdog to clean up after quit() (optional)
+        """
+        self.driver_factory = driver_factory
+        self.max_size = max(1, max_size)
+        self.max_uses = max(1, max_uses)
+        self.watchdog = watchdog
+
+        self._idle = []
+        self._uses = {}
+        self._live = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def checkout(self, timeout=None):
+        """
+        Get a warm session, creating one if the pool has room
+        Blocks until a session is available or timeout (seconds) expires
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                if self._idle:
+                    driver = self._idle.pop()
+                    logger.info(
+                        "Reusing warm WebDriver session (%s previous uses)",
+                        self._uses[id(driver)],
+                    )
+                    return driver
+                if self._live < self.max_size:
+                    # Reserve the slot before releasing the lock to start Chrome
+                    self._live += 1
+                    break
+                if not self._cond.wait(timeout):
+                    raise TimeoutError("Timed out waiting for a WebDriver session")
+
+        try:
+            driver = self.driver_factory()
+        except Exception:
+            with self._cond:
+                self._live -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._uses[id(driver)] = 0
+        logger.info("WebDriver initialized")
+        return driver
+
+    def checkin(self, driver, discard=False):
+        """
+        Return a session to the pool
+        Args:
+            driver: Session obtained from checkout()
+            discard: Quit the session instead of reusing it (e.g. after an error)
+        """
+        if driver is None:
+            return
+
+        with self._cond:
+            uses = self._uses.get(id(driver), 0) + 1
+            self._uses[id(driver)] = uses
+            recycle = discard or self._closed or uses >= self.max_uses
+
+        if not recycle:
+            try:
+                self.reset_session(driver)
+            except Exception as e:
+                logger.warning("Could not reset WebDriver session: %s", e)
+                recycle = True
+
+        if recycle:
+            reason = "error" if discard else f"{uses} uses"
+            logger.info("Recycling WebDriver session (%s)", reason)
+            self._quit(driver)
+            return
+
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    def grow(self, max_size):
+        """Allow up to max_size live sessions (never shrinks, so no session is cut short)"""
+        with self._cond:
+            if max_size > self.max_size:
+                self.max_size = max_size
+                self._cond.notify_all()
+
+    def reset_session(self, driver):
+        """Clear cookies, storage and navigation so the next check starts fresh"""
+        driver.execute_script(CLEAR_STORAGE_SCRIPT)
+        driver.delete_all_cookies()
+        driver.get("about:blank")
+
+    def close(self):
+        """Quit all idle sessions; sessions still checked out are quit on return"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+
+        for driver in idle:
+            self._quit(driver)
+
+    def _quit(self, driver):
+        """Quit a session and free its slot"""
+        try:
+            driver.quit()
+            logger.info("WebDriver closed")
+        except Exception as e:
+            logger.warning("Error while closing WebDriver: %s", e)
+        finally:
+            if self.watchdog:
+                self.watchdog.release(driver)
+            with self._cond:
+                self._uses.pop(id(driver), None)
+                self._live -= 1
+                self._cond.notify()
@@ -0,0 +1,165 @@
+"""
+Cached chromedriver/Chrome resolution for Cita Previa Checker Bot
+Finds the driver and browser binaries once, remembers them (with their versions) in a
+small JSON file, and on later starts only re-checks that the files are unchanged
+instead of running Selenium's driver discovery for every new session
+"""
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Browser executables looked up on PATH when none is configured
+BROWSER_NAMES = (
+    "google-chrome",
+    "google-chrome-stable",
+    "chromium",
+    "chromium-browser",
+)
+
+
+def _file_signature(path):
+    """(size, mtime) of a file, or None if it is gone"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def _binary_version(path):
+    """Version string reported by `<path> --version`, or "" if it can't be run"""
+    try:
+        output = subprocess.run(
+            [path, "--version"], capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return output.strip()
+
+
+class DriverResolver:
+    """Resolve chromedriver and Chrome once per install instead of once per session"""
+
+    def __init__(
+        self, cache_file=".driver_cache.json", driver_path=None, browser_path=None
+    ):
+        """
+        Args:
+            cache_file: Where resolved paths and versions are remembered between runs
+            driver_path: chromedriver to use (skips discovery)
+            browser_path: Chrome binary to use (skips discovery)
+        """
+        self.cache_file = cache_file
+        self.driver_path = driver_path
+        self.browser_path = browser_path
+        self._resolved = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the resolver from CHROMEDRIVER_PATH / CHROME_BINARY / DRIVER_CACHE_FILE in
+        config.Settings (None: read from the environment)
+        """
+        settings = settings or config.Settings.from_env()
+        return cls(
+            cache_file=settings.driver_cache_file,
+            driver_path=settings.chromedriver_path or None,
+            browser_path=settings.chrome_binary or None,
+        )
+
+    def resolve(self, options):
+        """
+        Paths and versions of chromedriver and Chrome, from memory or the cache file
+        while the binaries are unchanged, otherwise discovered again
+        Args:
+            options: ChromeOptions (used by Selenium Manager when discovery is needed)
+        Returns: dict with driver_path, driver_version, browser_path, browser_version
+        """
+        with self._lock:
+            if self._resolved is None or not self._still_valid(self._resolved):
+                cached = self._load()
+                if cached and self._still_valid(cached):
+                    self._resolved = cached
+                else:
+                    self._resolved = self._discover(options)
+                    self._save(self._resolved)
+            return self._resolved
+
+    def service_for(self, options):
+        """
+        A chromedriver Service with the resolved paths applied to options
+        Returns: selenium Service pointing at the cached driver
+        """
+        from selenium.webdriver.chrome.service import Service
+
+        resolved = self.resolve(options)
+        if resolved["browser_path"] and not options.binary_location:
+            options.binary_location = resolved["browser_path"]
+        return Service(executable_path=resolved["driver_path"])
+
+    def _still_valid(self, resolved):
+        """Cheap check: the same binaries are still there, unchanged"""
+        if self.driver_path and resolved.get("driver_path") != self.driver_path:
+            return False
+        if self.browser_path and resolved.get("browser_path") != self.browser_path:
+            return False
+        for kind in ("driver", "browser"):
+            path = resolved.get(f"{kind}_path")
+            if path and _file_signature(path) != resolved.get(f"{kind}_signature"):
+                return False
+        return bool(resolved.get("driver_path"))
+
+    def _discover(self, options):
+        """Find the binaries: configured paths, then PATH, then Selenium Manager"""
+        driver_path = self.driver_path or shutil.which("chromedriver")
+        browser_path = self.browser_path or options.binary_location or None
+        if not browser_path:
+            browser_path = next(filter(None, map(shutil.which, BROWSER_NAMES)), None)
+
+        if not driver_path:
+            from selenium.webdriver.common.selenium_manager import SeleniumManager
+
+            if browser_path:
+                options.binary_location = browser_path
+            driver_path = SeleniumManager().driver_location(options)
+            browser_path = options.binary_location or browser_path
+
+        resolved = {
+            "driver_path": driver_path,
+            "driver_version": _binary_version(driver_path),
+            "driver_signature": _file_signature(driver_path),
+            "browser_path": browser_path,
+            "browser_version": _binary_version(browser_path) if browser_path else "",
+            "browser_signature": _file_signature(browser_path),
+        }
+        logger.info(
+            "Resolved %s and %s",
+            resolved["driver_version"] or driver_path,
+            resolved["browser_version"] or browser_path or "the default Chrome",
+        )
+        return resolved
+
+    def _load(self):
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, resolved):
+        temp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(resolved, f, indent=2)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logger.warning("Could not save driver cache: %s", e)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the ICP Cita Previa site
+Serves the pages and element IDs the checker depends on, with configurable response delays
+"""
+
+import argparse
+import html
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Outcomes the acCitar page can be configured to show
+OUTCOMES = ("no_citas", "clave_only", "available")
+
+OFFICES = {
+    "7": "CNP San Cristobal de LA LAGUNA, CALLE NAVA Y GRIMON, 66, Santa Cruz de Tenerife",
+    "8": "CNP Santa Cruz de Tenerife, AVENIDA TRES DE MAYO, 32",
+    "9": "CNP Puerto de la Cruz, CALLE VALOIS, 46",
+}
+
+TRAMITES = {
+    "4038": "POLICIA-CERTIFICADO DE REGISTRO DE CIUDADANO DE LA U.E.",
+    "4010": "POLICIA-TOMA DE HUELLAS (EXPEDICIÓN DE TARJETA) Y RENOVACIÓN DE TARJETA DE LARGA DURACIÓN",
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+COOKIE_BANNER = """
+<div id="cookie-law-info-bar">
+  Utilizamos cookies propias y de terceros.
+  <a href="#" id="cookie_action_close_header"
+     onclick="document.getElementById('cookie-law-info-bar').style.display='none'; return false;">Aceptar</a>
+</div>
+"""
+
+
+class FixtureState:
+    """Mutable settings and request log shared by all handler threads"""
+
+    def __init__(
+        self, outcome="no_citas", delays=None, cookie_banner=True, session_ttl=None
+    ):
+        """
+        Args:
+            outcome: One of OUTCOMES, shown on the acCitar page
+            delays: {page_name: seconds} added before responding (key "*" applies to all pages)
+            cookie_banner: Render the cookie banner on the province page
+            session_ttl: Seconds after which a session expires (None never expires)
+        """
+        self.outcome = outcome
+        self.delays = dict(delays or {})
+        self.cookie_banner = cookie_banner
+        self.session_ttl = session_ttl
+        self.sessions = {}  # session id -> creation time
+        self.requests = []  # list of (page_name, perf_counter arrival time)
+        self.lock = threading.Lock()
+
+    def delay_for(self, page):
+        return self.delays.get(page, self.delays.get("*", 0.0))
+
+    def log_request(self, page, arrived):
+        with self.lock:
+            self.requests.append((page, arrived))
+
+    def session_valid(self, session_id):
+        """True if the session exists and has not expired"""
+        with self.lock:
+            created = self.sessions.get(session_id)
+        if created is None:
+            return False
+        return self.session_ttl is None or time.monotonic() - created < self.session_ttl
+
+    def drain_requests(self):
+        """Return and clear the request log"""
+        with self.lock:
+            requests, self.requests = self.requests, []
+        return requests
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serve the ICP pages from the shared FixtureState"""
+
+    server_version = "ICPFixture/1.0"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        started = time.perf_counter()
+        state = self.server.state
+        parsed = urlparse(self.path)
+        page = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        params.update({k: v[-1] for k, v in parse_qs(body).items()})
+
+        if page == "citar" and params.get("sede"):
+            page_name = "citar_sede"
+        else:
+            page_name = page
+        state.log_request(page_name, started)
+
+        delay = state.delay_for(page_name)
+        if delay:
+            time.sleep(delay)
+
+        handlers = {
+            "citar": self._province_page,
+            "acInfo": self._acinfo_page,
+            "acEntrada": self._acentrada_page,
+            "acValidarEntrada": self._validar_page,
+            "acCitar": self._accitar_page,
+        }
+        handler = handlers.get(page)
+        if handler is None:
+            self._respond(404, "No encontrado", "<p>Página no encontrada</p>")
+        elif page != "citar" and not state.session_valid(self._session_id()):
+            self._respond(
+                200,
+                "Sesión caducada",
+                "<p>Su sesión ha caducado. Por favor, vuelva a empezar.</p>",
+            )
+        else:
+            handler(params)
+
+    def _session_id(self):
+        for part in (self.headers.get("Cookie") or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "JSESSIONID":
+                return value
+        return None
+
+    def _respond(self, status, title, body, set_session=None):
+        payload = PAGE_TEMPLATE.format(title=html.escape(title), body=body).encode(
+            "utf-8"
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        if set_session:
+            self.send_header("Set-Cookie", f"JSESSIONID={set_session}; Path=/")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _form(self, action, inner):
+        return (
+            f'<form id="citadoForm" name="citadoForm" method="POST" action="{action}">'
+            f'<input type="hidden" name="reCAPTCHA_token" value="{secrets.token_hex(8)}">'
+            f"{inner}</form>"
+        )
+
+    def _province_page(self, params):
+        state = self.server.state
+        session_id = self._session_id()
+        new_session = None
+        if not state.session_valid(session_id):
+            new_session = secrets.token_hex(16)
+            with state.lock:
+                state.sessions[new_session] = time.monotonic()
+
+        sede = params.get("sede", "")
+        reload_query = urlencode({"p": params.get("p", "38"), "locale": "es"})
+        office_options = '<option value="">Seleccione oficina</option>' + "".join(
+            f'<option value="{value}"{" selected" if value == sede else ""}>{html.escape(name)}</option>'
+            for value, name in OFFICES.items()
+        )
+        tramite_options = '<option value="-1">Seleccione trámite</option>'
+        if sede in OFFICES:
+            tramite_options += "".join(
+                f'<option value="{value}">{html.escape(name)}</option>'
+                for value, name in TRAMITES.items()
+            )
+
+        inner = f"""
+<label for="sede">Oficina</label>
+<select id="sede" name="sede"
+        onchange="window.location.search='{reload_query}&amp;sede=' + this.value">
+{office_options}
+</select>
+<label for="tramiteGrupo[0]">Trámites disponibles</label>
+<select id="tramiteGrupo[0]" name="tramiteGrupo[0]">
+{tramite_options}
+</select>
+<input type="button" id="btnAceptar" value="Aceptar" onclick="document.citadoForm.submit();">
+"""
+        body = (COOKIE_BANNER if state.cookie_banner else "") + self._form(
+            "acInfo", inner
+        )
+        self._respond(
+            200, "Cita Previa - S.Cruz Tenerife", body, set_session=new_session
+        )
+
+    def _acinfo_page(self, params):
+        inner = """
+<p>Para acceder al servicio de Cita Previa puede identificarse con Cl@ve o sin Cl@ve.</p>
+<input type="button" id="btnEntrar" value="Presentación sin Cl@ve" onclick="document.citadoForm.submit();">
+"""
+        self._respond(200, "Información", self._form("acEntrada", inner))
+
+    def _acentrada_page(self, params):
+        inner = """
+<input type="radio" id="rdbTipoDocNie" name="rdbTipoDoc" value="N.I.E." checked>
+<label for="rdbTipoDocNie">N.I.E.</label>
+<input type="radio" id="rdbTipoDocPas" name="rdbTipoDoc" value="PASAPORTE">
+<label for="rdbTipoDocPas">PASAPORTE</label>
+<input type="text" id="txtIdCitado" name="txtIdCitado" value="">
+<input type="text" id="txtDesCitado" name="txtDesCitado" value="">
+<input type="button" id="btnEnviar" value="Aceptar" onclick="document.citadoForm.submit();">
+"""
+        self._respond(200, "Datos personales", self._form("acValidarEntrada", inner))
+
+    def _validar_page(self, params):
+        if not params.get("txtIdCitado"):
+            self._respond(
+                200, "Error", "<p>Debe introducir el número de documento.</p>"
+            )
+            return
+        inner = """
+<p>Pulse Solicitar Cita para consultar la disponibilidad.</p>
+<input type="button" id="btnEnviar" value="Solicitar Cita" onclick="document.citadoForm.submit();">
+"""
+        self._respond(200, "Solicitar Cita", self._form("acCitar", inner))
+
+    def _accitar_page(self, params):
+        outcome = self.server.state.outcome
+        if outcome == "available":
+            body = self._form(
+                "acVerFormulario",
+                """
+<p>Seleccione una de las siguientes citas disponibles.</p>
+<div id="idCaptcha">Fecha y hora disponibles</div>
+<input type="radio" name="rdbCita" value="1"> CITA 1 Día: 12/01/2027 Hora: 09:30
+""",
+            )
+        elif outcome == "clave_only":
+            body = (
+                "<p>En este momento no hay citas disponibles para la reserva sin Cl@ve.</p>"
+                "<p>No obstante, sí tienen a su disposición mediante el uso de Cl@ve "
+                "citas para este trámite.</p>"
+            )
+        else:
+            body = "<p>En este momento no hay citas disponibles.</p>"
+        self._respond(200, "Cita Previa", body)
+
+
+class FixtureSite:
+    """Run the fixture server in a background thread"""
+
+    def __init__(self, host="127.0.0.1", port=0, **state_options):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            state_options: Passed to FixtureState (outcome, delays, cookie_banner)
+        """
+        self.state = FixtureState(**state_options)
+        self.server = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.server.daemon_threads = True
+        self.server.state = self.state
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/icpco/"
+
+    @property
+    def provincia_url(self):
+        """Drop-in replacement for CitaChecker.PROVINCIA_URL"""
+        return f"{self.base_url}citar?p=38&locale=es"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Serve the fixture site until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--outcome", choices=OUTCOMES, default="no_citas")
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Seconds added to every response"
+    )
+    parser.add_argument(
+        "--session-ttl", type=float, default=None, help="Seconds before sessions expire"
+    )
+    args = parser.parse_args()
+
+    site = FixtureSite(
+        args.host,
+        args.port,
+        outcome=args.outcome,
+        delays={"*": args.delay},
+        session_ttl=args.session_ttl,
+    )
+    print(f"Serving ICP fixture at {site.provincia_url}")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
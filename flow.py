@@ -0,0 +1,158 @@
+"""
+Step-level retries for Cita Previa Checker Bot
+Runs the appointment flow as a list of named steps; a failing step is retried where it
+stands when its page is still there, otherwise the flow goes back to a checkpoint,
+with bounded exponential backoff in between
+"""
+
+import logging
+import random
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class StepFailed(Exception):
+    """A step of the flow could not be completed"""
+
+    def __init__(self, step, reason, retryable=True):
+        super().__init__(f"{step}: {reason}")
+        self.step = step
+        self.reason = reason
+        self.retryable = retryable
+
+
+class FlowStep:
+    """One named step of the flow"""
+
+    def __init__(self, name, action, failure=None, retry_when=None, checkpoint=None):
+        """
+        Args:
+            name: Step name (also the timing span and failure reason)
+            action: Callable doing the step; its return value ends the flow if it is the last step
+            failure: Message prefix reported when the step finally fails
+            retry_when: Predicate on a page snapshot telling whether the step can be
+                retried in place (None: always go back to the checkpoint)
+            checkpoint: Step to go back to otherwise (defaults to the first step)
+        """
+        self.name = name
+        self.action = action
+        self.failure = failure or f"Could not complete {name}"
+        self.retry_when = retry_when
+        self.checkpoint = checkpoint
+
+
+class RetryPolicy:
+    """How often and how patiently failed steps are retried"""
+
+    def __init__(self, enabled=True, max_retries=3, base_delay=1.0, max_delay=15.0):
+        """
+        Args:
+            enabled: Retry at all (False: the first failure ends the check)
+            max_retries: Retries allowed per check, across all steps
+            base_delay: Seconds before the first retry, doubled for each further one
+            max_delay: Ceiling on the delay between retries
+        """
+        self.enabled = enabled
+        self.max_retries = max_retries if enabled else 0
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, settings=None):
+        """Build the policy from config.Settings (None: read from the environment)"""
+        settings = settings or config.Settings.from_env()
+        return cls(
+            enabled=settings.retry_on_error,
+            max_retries=settings.max_retries,
+            base_delay=settings.retry_base_seconds,
+            max_delay=settings.retry_max_seconds,
+        )
+
+    def delay(self, retry):
+        """Backoff before the given retry (1-based), with +/-20% jitter"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+
+class StepRunner:
+    """Run flow steps in order, retrying failed ones"""
+
+    def __init__(self, policy, timer, probe=None, on_failure=None):
+        """
+        Args:
+            policy: RetryPolicy
+            timer: CheckTimer receiving one span per step (retries add to the same span)
+            probe: Callable returning a snapshot of the current page, for retry_when
+            on_failure: Called with (step, reason) after every failed attempt, while
+                the failed page is still showing (e.g. to capture artifacts)
+        """
+        self.policy = policy
+        self.timer = timer
+        self.probe = probe
+        self.on_failure = on_failure
+        self.retries = 0
+
+    def run(self, steps):
+        """
+        Run the steps
+        Returns: the last step's return value
+        Raises: StepFailed once a step fails and no retries are left
+        """
+        index = 0
+        result = None
+        while index < len(steps):
+            step = steps[index]
+            self.timer.step(step.name)
+            try:
+                result = step.action()
+                index += 1
+                continue
+            except Exception as e:
+                error = e
+
+            reason = error.reason if isinstance(error, StepFailed) else str(error)
+            summary = reason.splitlines()[0] if reason else type(error).__name__
+            retryable = getattr(error, "retryable", True)
+            if self.on_failure is not None:
+                try:
+                    self.on_failure(step, reason)
+                except Exception as e:
+                    logger.warning("Failure hook for '%s' failed: %s", step.name, e)
+            if not retryable or self.retries >= self.policy.max_retries:
+                logger.error("%s: %s", step.failure, reason)
+                raise StepFailed(
+                    step.name, f"{step.failure}: {reason}", retryable
+                ) from error
+
+            self.retries += 1
+            self.timer.annotate(retries=self.retries)
+            index = self._resume_index(steps, index)
+            delay = self.policy.delay(self.retries)
+            logger.warning(
+                "Step '%s' failed (%s); retry %s/%s from '%s' in %.1fs",
+                step.name,
+                summary,
+                self.retries,
+                self.policy.max_retries,
+                steps[index].name,
+                delay,
+            )
+            self.timer.step("retry_backoff")
+            time.sleep(delay)
+
+        return result
+
+    def _resume_index(self, steps, index):
+        """Retry the failed step in place if its page is still there, else its checkpoint"""
+        step = steps[index]
+        if step.retry_when is not None and self.probe is not None:
+            try:
+                if step.retry_when(self.probe()):
+                    return index
+            except Exception as e:
+                logger.debug("Could not probe the page: %s", e)
+        names = [s.name for s in steps]
+        return names.index(step.checkpoint) if step.checkpoint in names else 0
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Persistent check history for Cita Previa Checker Bot
+Stores every check outcome in SQLite with batched writes, and answers questions about
+availability windows, failure rates and latency from the command line
+"""
+
+import argparse
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    engine TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    available INTEGER,
+    message TEXT,
+    failure_reason TEXT,
+    total_seconds REAL,
+    steps TEXT,
+    page_fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_checks_target_time ON checks (target, started_at);
+CREATE INDEX IF NOT EXISTS idx_checks_time ON checks (started_at);
+"""
+
+INSERT = """
+INSERT INTO checks (
+    target, engine, started_at, finished_at, available, message,
+    failure_reason, total_seconds, steps, page_fingerprint
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def connect(path):
+    """Open the history database, creating the schema if needed"""
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class HistoryStore:
+    """Batching writer for check records; use record() as a Metrics sink"""
+
+    def __init__(self, path="cita_history.sqlite3", batch_size=20, flush_seconds=5):
+        """
+        Args:
+            path: SQLite database file
+            batch_size: Write as soon as this many records are waiting
+            flush_seconds: Write waiting records at least this often
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name="history", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the store from HISTORY_DB in config.Settings (None: read from the
+        environment), or None if history is disabled
+        """
+        settings = settings or config.Settings.from_env()
+        return cls(settings.history_db) if settings.history_db else None
+
+    def record(self, record):
+        """Queue one finished check (a Metrics record) for writing"""
+        available = record.get("available")
+        self._queue.put(
+            (
+                record.get("target") or "",
+                record.get("engine"),
+                record["started_at"],
+                record["finished_at"],
+                None if available is None else int(bool(available)),
+                record.get("message"),
+                record.get("reason") or None,
+                record.get("total"),
+                json.dumps(record.get("steps", {})),
+                record.get("page_fingerprint"),
+            )
+        )
+
+    def close(self, timeout=30):
+        """Write everything still queued and stop the writer"""
+        self._queue.put(None)
+        self._writer.join(timeout)
+
+    def _run(self):
+        connection = connect(self.path)
+        batch = []
+        deadline = time.monotonic() + self.flush_seconds
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            if batch and (
+                stopping
+                or len(batch) >= self.batch_size
+                or time.monotonic() >= deadline
+            ):
+                try:
+                    with connection:
+                        connection.executemany(INSERT, batch)
+                except sqlite3.Error as e:
+                    logger.error("Could not write check history: %s", e)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+        connection.close()
+
+
+# Queries
+
+
+def availability_windows(connection, target=None, since=None):
+    """
+    Periods where consecutive checks of a target found appointments
+    Returns: list of (target, first_seen, last_seen, checks)
+    """
+    query = (
+        "SELECT target, started_at, available FROM checks WHERE available IS NOT NULL"
+    )
+    params = []
+    if target:
+        query += " AND target = ?"
+        params.append(target)
+    if since:
+        query += " AND started_at >= ?"
+        params.append(since)
+    query += " ORDER BY target, started_at"
+
+    windows = []
+    current = None
+    for row_target, started_at, available in connection.execute(query, params):
+        if current and current[0] != row_target:
+            windows.append(tuple(current))
+            current = None
+        if available:
+            if current is None:
+                current = [row_target, started_at, started_at, 0]
+            current[2] = started_at
+            current[3] += 1
+        elif current is not None:
+            windows.append(tuple(current))
+            current = None
+    if current:
+        windows.append(tuple(current))
+    return windows
+
+
+def failure_trend(connection, target=None, since=None, bucket="day"):
+    """
+    Check counts and failure (None outcome) rate per hour or day
+    Returns: list of (bucket, checks, failures, rate)
+    """
+    fmt = "%Y-%m-%d %H:00" if bucket == "hour" else "%Y-%m-%d"
+    query = (
+        f"SELECT strftime('{fmt}', started_at, 'unixepoch', 'localtime') AS bucket, "
+        "COUNT(*), SUM(available IS NULL) FROM checks WHERE 1 = 1"
+    )
+    params = []
+    if target:
+        query += " AND target = ?"
+        params.append(target)
+    if since:
+        query += " AND started_at >= ?"
+        params.append(since)
+    query += " GROUP BY bucket ORDER BY bucket"
+    return [
+        (name, total, failures, failures / total if total else 0.0)
+        for name, total, failures in connection.execute(query, params)
+    ]
+
+
+def latency_percentiles(connection, target=None, since=None, pcts=(50, 90, 99)):
+    """
+    Latency percentiles per step and for whole checks
+    Returns: dict {step: {"count": n, "p50": s, ...}}
+    """
+    query = "SELECT total_seconds, steps FROM checks WHERE 1 = 1"
+    params = []
+    if target:
+        query += " AND target = ?"
+        params.append(target)
+    if since:
+        query += " AND started_at >= ?"
+        params.append(since)
+
+    samples = {}
+    for total, steps in connection.execute(query, params):
+        if total is not None:
+            samples.setdefault("total", []).append(total)
+        for step, seconds in json.loads(steps or "{}").items():
+            samples.setdefault(step, []).append(seconds)
+
+    result = {}
+    for step, values in samples.items():
+        values.sort()
+        summary = {"count": len(values)}
+        for pct in pcts:
+            index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+            summary[f"p{pct}"] = values[index]
+        result[step] = summary
+    return result
+
+
+def hourly_availability(connection, target=None, since=None):
+    """
+    Checks and successful checks per local hour of day
+    Returns: dict {hour (0-23): (checks, available)}; failed checks are not counted
+    """
+    query = (
+        "SELECT CAST(strftime('%H', started_at, 'unixepoch', 'localtime') AS INTEGER), "
+        "COUNT(*), SUM(available) FROM checks WHERE available IS NOT NULL"
+    )
+    params = []
+    if target:
+        query += " AND target = ?"
+        params.append(target)
+    if since:
+        query += " AND started_at >= ?"
+        params.append(since)
+    query += " GROUP BY 1"
+    return {
+        hour: (checks, available or 0)
+        for hour, checks, available in connection.execute(query, params)
+    }
+
+
+def last_available(connection, target=None):
+    """Most recent check that found appointments, as (target, started_at, message)"""
+    query = "SELECT target, started_at, message FROM checks WHERE available = 1"
+    params = []
+    if target:
+        query += " AND target = ?"
+        params.append(target)
+    query += " ORDER BY started_at DESC LIMIT 1"
+    return connection.execute(query, params).fetchone()
+
+
+def _parse_since(value):
+    """'7d', '12h', '30m' or an ISO date -> unix timestamp"""
+    if not value:
+        return None
+    units = {"d": "days", "h": "hours", "m": "minutes"}
+    if value[-1] in units and value[:-1].isdigit():
+        delta = timedelta(**{units[value[-1]]: int(value[:-1])})
+        return (datetime.now() - delta).timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _fmt_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    """Query CLI"""
+    config.load_environment()
+    try:
+        settings = config.Settings.from_env()
+    except config.ConfigError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    parser = argparse.ArgumentParser(description="Query the check history")
+    parser.add_argument("--db", default=settings.history_db)
+    parser.add_argument("--target", help="Only this target (e.g. 7-4038)")
+    parser.add_argument("--since", help="Only checks since 7d / 12h / 30m / ISO date")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("last", help="When availability was last seen")
+    commands.add_parser("windows", help="Availability windows")
+    failures = commands.add_parser("failures", help="Failure-rate trend")
+    failures.add_argument("--bucket", choices=("hour", "day"), default="day")
+    commands.add_parser("latency", help="Latency percentiles per step")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("history is disabled (HISTORY_DB is empty); pass --db")
+
+    connection = connect(args.db)
+    since = _parse_since(args.since)
+
+    if args.command == "last":
+        row = last_available(connection, args.target)
+        if row:
+            print(f"{row[0]}: {_fmt_time(row[1])} - {row[2]}")
+        else:
+            print("Availability has not been seen yet")
+
+    elif args.command == "windows":
+        for target, first, last, checks in availability_windows(
+            connection, args.target, since
+        ):
+            minutes = (last - first) / 60
+            print(
+                f"{target}: {_fmt_time(first)} -> {_fmt_time(last)} "
+                f"({minutes:.0f} min, {checks} checks)"
+            )
+
+    elif args.command == "failures":
+        print(f"{'bucket':<18}{'checks':>8}{'failed':>8}{'rate':>8}")
+        for name, total, failed, rate in failure_trend(
+            connection, args.target, since, args.bucket
+        ):
+            print(f"{name:<18}{total:>8}{failed:>8}{rate:>8.1%}")
+
+    elif args.command == "latency":
+        print(f"{'step':<18}{'count':>7}{'p50':>9}{'p90':>9}{'p99':>9}")
+        for step, s in sorted(
+            latency_percentiles(connection, args.target, since).items()
+        ):
+            print(
+                f"{step:<18}{s['count']:>7}{s['p50']:>8.2f}s{s['p90']:>8.2f}s{s['p99']:>8.2f}s"
+            )
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
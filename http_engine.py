@@ -0,0 +1,491 @@
+"""
+Browser-free check engine for Cita Previa Checker Bot
+Replays the ICP form flow over a pooled HTTP session and falls back to Selenium when it can't
+"""
+
+import logging
+import time
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from flow import StepFailed
+from log_pipeline import current_check_id
+from page_probe import PROBE_IDS, page_fingerprint, session_expired
+
+logger = logging.getLogger(__name__)
+
+
+def with_query(url, **params):
+    """Return url with params added to (or replacing values in) its query string"""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update(params)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class Form:
+    """A parsed <form> with its successful controls"""
+
+    def __init__(self, action, method, element_id=None):
+        self.action = action
+        self.method = method
+        self.id = element_id
+        self.fields = []  # list of (name, value) in document order
+        self.selects = {}  # name -> list of option values
+        self.labels = {}  # select name -> {option value: option text}
+        self.radios = {}  # element id -> (name, value)
+        self.ids = set()  # ids of controls inside the form
+
+    def has(self, element_id):
+        """True if a control with this id lives in the form"""
+        return element_id in self.ids
+
+    def data(self, overrides=None):
+        """Form data as submitted by a browser, with overrides replacing fields"""
+        overrides = dict(overrides or {})
+        data = [(k, v) for k, v in self.fields if k not in overrides]
+        return data + list(overrides.items())
+
+
+class PageParser(HTMLParser):
+    """Collect forms, element ids and visible text from an HTML page"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self.ids = set()
+        self.text_parts = []
+        self._form = None
+        self._select = None
+        self._select_first = None
+        self._select_selected = None
+        self._option = None  # value of the <option> whose text is being read
+        self._skip_text = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        element_id = attrs.get("id")
+        if element_id:
+            self.ids.add(element_id)
+            if self._form is not None:
+                self._form.ids.add(element_id)
+
+        if tag in ("script", "style"):
+            self._skip_text += 1
+        elif tag == "form":
+            self._form = Form(
+                attrs.get("action") or "",
+                (attrs.get("method") or "get").lower(),
+                element_id,
+            )
+            self.forms.append(self._form)
+        elif tag == "input" and self._form is not None:
+            self._handle_input(attrs)
+        elif tag == "select" and self._form is not None:
+            self._select = attrs.get("name")
+            self._select_first = None
+            self._select_selected = None
+            if self._select:
+                self._form.selects[self._select] = []
+                self._form.labels[self._select] = {}
+        elif tag == "option" and self._select and self._form is not None:
+            value = attrs.get("value", "")
+            self._option = value
+            self._form.selects[self._select].append(value)
+            self._form.labels[self._select][value] = ""
+            if self._select_first is None:
+                self._select_first = value
+            if "selected" in attrs:
+                self._select_selected = value
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._skip_text = max(0, self._skip_text - 1)
+        elif tag == "option":
+            self._option = None
+        elif tag == "form":
+            # A select left open by malformed markup ends with its form
+            self._form = None
+            self._select = None
+            self._option = None
+        elif tag == "select" and self._select:
+            # Browsers submit the selected option, or the first one if none is
+            value = self._select_selected
+            if value is None:
+                value = self._select_first
+            if value is not None:
+                self._form.fields.append((self._select, value))
+            self._select = None
+            self._option = None
+
+    def handle_data(self, data):
+        if self._option is not None and self._form is not None:
+            labels = self._form.labels[self._select]
+            labels[self._option] = " ".join((labels[self._option] + data).split())
+        if not self._skip_text:
+            self.text_parts.append(data)
+
+    def _handle_input(self, attrs):
+        name = attrs.get("name")
+        input_type = (attrs.get("type") or "text").lower()
+        if input_type == "radio" and attrs.get("id"):
+            self._form.radios[attrs["id"]] = (name, attrs.get("value", "on"))
+        if not name or input_type in ("submit", "button", "image", "reset", "file"):
+            return
+        if input_type in ("checkbox", "radio") and "checked" not in attrs:
+            return
+        self._form.fields.append((name, attrs.get("value", "")))
+
+
+class Page:
+    """A fetched page: URL, raw HTML and parsed structure"""
+
+    def __init__(self, url, html):
+        self.url = url
+        self.html = html
+        parser = PageParser()
+        parser.feed(html)
+        parser.close()
+        self.forms = parser.forms
+        self.ids = parser.ids
+        self.text = " ".join(" ".join(parser.text_parts).split()).lower()
+
+    def form_with(self, element_id):
+        """First form containing a control with this id"""
+        for form in self.forms:
+            if form.has(element_id):
+                return form
+        return None
+
+    def snapshot(self, ids):
+        """Same shape as page_probe.take_snapshot, so classification can be shared"""
+        return {
+            "url": self.url,
+            "ready_state": "complete",
+            "title": "",
+            "text": self.text,
+            "present": {element_id: element_id in self.ids for element_id in ids},
+        }
+
+
+class HttpCheckEngine:
+    """Run the availability check with plain HTTP requests"""
+
+    def __init__(self, checker, timeout=15, pool_size=4, fallback=True):
+        """
+        Args:
+            checker: CitaChecker providing the target, pacing, classification and Selenium fallback
+            timeout: Per-request timeout in seconds
+            pool_size: Connections kept alive per host
+            fallback: Run the Selenium flow when a step can't be completed over HTTP
+        """
+        self.checker = checker
+        self.timeout = timeout
+        self.fallback = fallback
+        self.timer = None
+        self._parked_page = None
+        self._last_response = None  # (url, html) of the last page fetched
+        self._province_page = None  # province page shared by a sweep's offices
+        self._parked_at = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": checker.USER_AGENT,
+                "Accept-Language": "es-ES,es;q=0.9",
+            }
+        )
+
+    def check_availability(self):
+        """
+        Check if appointments are available
+        Returns: tuple (available: bool, message: str)
+        """
+        logger.info("Starting availability check (HTTP engine)...")
+        available, message = None, ""
+        falling_back = False
+        self.timer = self.checker.metrics.start_check(
+            self.checker.target_key, engine="http"
+        )
+        try:
+            # Resume from the parked validation page when holding position
+            if self._parked_page is not None:
+                result = self._poll_parked()
+                if result is not None:
+                    available, message = result
+                    return available, message
+                logger.info("🔄 Re-establishing the full path to the validation page")
+                self._parked_page = None
+
+            available, message = self._run_check_flow()
+            return available, message
+        except StepFailed as e:
+            logger.warning("HTTP engine could not complete step %s", e)
+            message = f"HTTP engine failed at {e.step}: {e.reason}"
+            self._capture_failure(e.step, e.reason)
+            falling_back = self.fallback
+        except requests.RequestException as e:
+            logger.warning("HTTP engine request failed: %s", e)
+            message = f"Error: {str(e)}"
+            falling_back = self.fallback
+        except Exception as e:
+            # e.g. a page the parser can't make sense of; as with the Selenium
+            # engine, no error ends the watch
+            logger.error("HTTP engine error: %s: %s", type(e).__name__, e)
+            message = f"Error: {type(e).__name__}: {e}"
+            self._capture_failure("http_engine", message)
+            falling_back = self.fallback
+        finally:
+            # A check that falls back is recorded once, by the Selenium engine
+            if not falling_back:
+                self.timer.finish(available, message)
+            if available is None:
+                self._parked_page = None
+
+        if not falling_back:
+            return None, message
+
+        logger.info("Falling back to the Selenium engine")
+        return self.checker.check_availability(
+            fallback_info={
+                "fallback_from": "http",
+                "http_failure": message,
+                "http_seconds": round(time.perf_counter() - self.timer.started, 3),
+            }
+        )
+
+    # Office sweep (see sweep.py)
+
+    def sweep_start(self):
+        """
+        Load the province page once for a sweep
+        Returns: list of (office value, office name) offered on it
+        """
+        self._parked_page = None
+        self._province_page = self._load_province()
+        form = self._require_form(self._province_page, "sede", "office_list")
+        labels = form.labels.get("sede", {})
+        return [
+            (value, labels.get(value) or value)
+            for value in form.selects.get("sede", [])
+            if value not in ("", "-1")
+        ]
+
+    def sweep_office(self, office_value, office_name):
+        """
+        Check one office in the sweep's session, reusing the loaded province page
+        Returns: tuple (available: bool, message: str)
+        """
+        try:
+            page, failure = self._walk_from_province(
+                self._province_page, office_value, office_name
+            )
+            if failure:
+                return failure
+            return self._request_cita(page)
+        except StepFailed as e:
+            logger.warning("HTTP engine could not complete step %s", e)
+            self._capture_failure(e.step, e.reason)
+            return None, f"HTTP engine failed at {e.step}: {e.reason}"
+        except requests.RequestException as e:
+            logger.warning("HTTP engine request failed: %s", e)
+            return None, f"Error: {str(e)}"
+        except Exception as e:
+            logger.error("HTTP engine error: %s: %s", type(e).__name__, e)
+            message = f"Error: {type(e).__name__}: {e}"
+            self._capture_failure("http_engine", message)
+            return None, message
+
+    def sweep_end(self, discard=False):
+        """Forget the sweep's province page"""
+        self._province_page = None
+
+    def _capture_failure(self, step, reason):
+        """Keep the last page fetched before a step failed"""
+        artifacts = self.checker.artifacts
+        if artifacts is None or self._last_response is None:
+            return
+        url, html = self._last_response
+        artifacts.capture_page(url, html, current_check_id(), step, reason)
+
+    def release_session(self):
+        """Forget the parked validation page"""
+        self._parked_page = None
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+    def _run_check_flow(self):
+        """Walk the form flow over HTTP and classify the result"""
+        page, failure = self._walk_to_validation()
+        if failure:
+            return failure
+
+        if not self.checker.hold_position:
+            return self._request_cita(page)
+
+        # Keep the session and validation form; later checks only resubmit it
+        self._parked_page = page
+        self._parked_at = time.monotonic()
+        logger.info("📌 Holding position at %s", page.url)
+        result = self._poll_parked()
+        if result is None:
+            return None, "Session expired right after reaching the validation page"
+        return result
+
+    def _walk_to_validation(self):
+        """
+        Walk from the province page up to the validation page (after btnEnviar #1)
+        Returns: tuple (validation page, None) or (None, failure tuple)
+        """
+        checker = self.checker
+        page = self._load_province()
+        return self._walk_from_province(page, checker.OFFICE_VALUE, checker.OFFICE_NAME)
+
+    def _load_province(self):
+        """Start a new ICP session on the province page"""
+        checker = self.checker
+
+        # Every check starts a new ICP session, but keeps the warm connections
+        self.session.cookies.clear()
+        self._last_response = None
+
+        self.timer.step("navigation")
+        checker.mark_first_request(self.timer)
+        page = self._get(checker.PROVINCIA_URL, step="navigation")
+        logger.info("Navigated to: %s", checker.PROVINCIA_URL)
+        checker.pacing.pause("navigate")
+        return page
+
+    def _walk_from_province(self, page, office_value, office_name):
+        """
+        Walk from a loaded province page up to the validation page for one office
+        Returns: tuple (validation page, None) or (None, failure tuple)
+        """
+        checker = self.checker
+        pacing = checker.pacing
+
+        self.timer.step("office_select")
+        # Select office; picking one reloads the province page with its tramites
+        form = self._require_form(page, "sede", "office_select")
+        if checker.TRAMITE_VALUE not in form.selects.get("tramiteGrupo[0]", []):
+            page = self._get(with_query(page.url, sede=office_value), "office_select")
+        logger.info("Selected '%s'", office_name)
+        pacing.pause("office_select")
+
+        # Select the tramite and accept
+        self.timer.step("tramite_select")
+        form = self._require_form(page, "tramiteGrupo[0]", "tramite_select")
+        if checker.TRAMITE_VALUE not in form.selects.get("tramiteGrupo[0]", []):
+            logger.error("Tramite '%s' not available", checker.TRAMITE_NAME)
+            return None, (None, "Tramite not available")
+        page = self._submit(
+            page,
+            form,
+            {"sede": office_value, "tramiteGrupo[0]": checker.TRAMITE_VALUE},
+            "btnAceptar",
+        )
+        logger.info("Selected tramite: %s", checker.TRAMITE_NAME)
+        pacing.pause("tramite_select")
+
+        # "Presentación sin Cl@ve" on acInfo
+        self.timer.step("btnEntrar")
+        form = self._require_form(page, "btnEntrar", "btnEntrar")
+        page = self._submit(page, form, {}, "btnEntrar")
+        logger.info("Current page: %s", page.url)
+        pacing.pause("acinfo")
+
+        # Personal data on acEntrada
+        self.timer.step("btnEnviar")
+        form = self._require_form(page, "txtIdCitado", "personal_data")
+        overrides = {
+            "txtIdCitado": checker.nie_number,
+            "txtDesCitado": checker.full_name,
+        }
+        if "rdbTipoDocPas" in form.radios:
+            name, value = form.radios["rdbTipoDocPas"]
+            overrides[name] = value
+        page = self._submit(page, form, overrides, "btnEnviar")
+        logger.info("Current page after submission: %s", page.url)
+        pacing.pause("validate")
+        return page, None
+
+    def _request_cita(self, page):
+        """
+        Submit "Solicitar Cita" from the validation page and classify the result
+        Returns: tuple (available: bool, message: str)
+        """
+        # "Solicitar Cita" on acValidarEntrada
+        self.timer.step("solicitar_cita")
+        form = self._require_form(page, "btnEnviar", "solicitar_cita")
+        page = self._submit(page, form, {}, "solicitar_cita")
+        logger.info("Current page after 'Solicitar Cita': %s", page.url)
+
+        self.timer.step("classification")
+        snapshot = page.snapshot(PROBE_IDS)
+        self.timer.annotate(page_fingerprint=page_fingerprint(snapshot))
+        return self.checker.classify_result(snapshot, self.timer)
+
+    def _poll_parked(self):
+        """
+        Redo only the "Solicitar Cita" submission with the parked session
+        Returns: tuple (available: bool, message: str), or None if the session expired
+        """
+        if time.monotonic() - self._parked_at > self.checker.park_max_seconds:
+            logger.info("Parked session is too old, walking the full flow again")
+            return None
+
+        self.timer.step("solicitar_cita")
+        page = self._parked_page
+        form = self._require_form(page, "btnEnviar", "solicitar_cita")
+        result = self._submit(page, form, {}, "solicitar_cita")
+        logger.info("Current page after 'Solicitar Cita': %s", result.url)
+
+        self.timer.step("classification")
+        snapshot = result.snapshot(PROBE_IDS)
+        self.timer.annotate(page_fingerprint=page_fingerprint(snapshot))
+        if session_expired(snapshot):
+            logger.info("Site reports the parked session has expired")
+            return None
+        return self.checker.classify_result(snapshot, self.timer)
+
+    def _get(self, url, step):
+        """GET a page, failing the step on HTTP errors"""
+        response = self.session.get(url, timeout=self.timeout)
+        return self._page(response, step)
+
+    def _submit(self, page, form, overrides, step):
+        """Submit a form the way a browser would, following redirects"""
+        url = urljoin(page.url, form.action or page.url)
+        data = form.data(overrides)
+        headers = {"Referer": page.url}
+        if form.method == "post":
+            response = self.session.post(
+                url, data=data, headers=headers, timeout=self.timeout
+            )
+        else:
+            response = self.session.get(
+                url, params=data, headers=headers, timeout=self.timeout
+            )
+        return self._page(response, step)
+
+    def _page(self, response, step):
+        """Parse a response, failing the step on error statuses"""
+        self._last_response = (response.url, response.text)
+        if response.status_code >= 400:
+            raise StepFailed(step, f"HTTP {response.status_code} from {response.url}")
+        return Page(response.url, response.text)
+
+    def _require_form(self, page, element_id, step):
+        """Find the form holding element_id or fail the step"""
+        form = page.form_with(element_id)
+        if form is None:
+            raise StepFailed(step, f"'{element_id}' not found on {page.url}")
+        return form
@@ -0,0 +1,178 @@
+"""
+Adaptive check intervals for Cita Previa Checker Bot
+Spreads a fixed daily check budget over the hours of the day according to when
+appointments have shown up before (from the check history), and backs off after
+consecutive failed checks
+"""
+
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+import history
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveIntervalPolicy:
+    """Decide how long to wait before a target's next check"""
+
+    # Pseudo-checks pulling each hour's availability rate towards the overall rate,
+    # so a single lucky check doesn't capture the whole budget
+    PRIOR_WEIGHT = 5
+
+    def __init__(
+        self,
+        history_path=None,
+        checks_per_day=96,
+        min_interval_minutes=3,
+        max_interval_minutes=120,
+        max_backoff_minutes=120,
+        history_days=28,
+        refresh_minutes=60,
+        jitter=0.1,
+    ):
+        """
+        Args:
+            history_path: SQLite check history to learn from (None: spread evenly)
+            checks_per_day: Daily check budget per target
+            min_interval_minutes: Never check a target more often than this
+            max_interval_minutes: Never leave a target unchecked longer than this
+            max_backoff_minutes: Ceiling on the delay after consecutive failed checks
+            history_days: How far back the history is considered
+            refresh_minutes: Recompute the plan from the history this often
+            jitter: Random +/- fraction applied to every delay
+        """
+        self.history_path = history_path
+        self.checks_per_day = checks_per_day
+        self.min_interval = min_interval_minutes * 60
+        self.max_interval = max_interval_minutes * 60
+        self.max_backoff = max_backoff_minutes * 60
+        self.history_days = history_days
+        self.refresh_seconds = refresh_minutes * 60
+        self.jitter = jitter
+
+        self._plans = {}  # target -> (monotonic time computed, [interval per hour])
+        self._failures = {}  # target -> consecutive None results
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the policy from CHECK_BUDGET_PER_DAY etc. in config.Settings (None: read
+        from the environment), or None if not enabled
+        """
+        settings = settings or config.Settings.from_env()
+        if not settings.check_budget_per_day:
+            return None
+        return cls(
+            history_path=settings.history_db or None,
+            checks_per_day=settings.check_budget_per_day,
+            min_interval_minutes=settings.check_min_interval_minutes,
+            max_interval_minutes=settings.check_max_interval_minutes,
+            max_backoff_minutes=settings.error_backoff_max_minutes,
+            history_days=settings.history_days,
+        )
+
+    def next_delay(self, target, available, now=None):
+        """
+        Seconds to wait before the target's next check
+        Args:
+            target: Target key as stored in the history
+            available: Outcome of the check that just finished
+            now: datetime to plan from (defaults to the current time)
+        """
+        now = now or datetime.now()
+        intervals = self.plan(target)
+
+        # Use this hour's interval, but don't sleep past the start of a busier hour
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        delay = min(
+            intervals[now.hour],
+            (next_hour - now).total_seconds() + intervals[next_hour.hour],
+        )
+
+        with self._lock:
+            failures = self._failures.get(target, 0) + 1 if available is None else 0
+            self._failures[target] = failures
+        if failures:
+            delay = min(max(delay, self.max_backoff), delay * 2**failures)
+            logger.info("%s failed checks in a row, backing off", failures)
+
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def plan(self, target):
+        """Interval in seconds for each hour of the day, refreshed from the history"""
+        with self._lock:
+            cached = self._plans.get(target)
+            if cached and time.monotonic() - cached[0] < self.refresh_seconds:
+                return cached[1]
+
+        counts = {}
+        if self.history_path:
+            since = time.time() - self.history_days * 86400
+            try:
+                connection = history.connect(self.history_path)
+                try:
+                    counts = history.hourly_availability(connection, target, since)
+                finally:
+                    connection.close()
+            except Exception as e:
+                logger.warning("Could not read check history: %s", e)
+
+        checks = self._allocate(counts)
+        intervals = [3600 / n for n in checks]
+        with self._lock:
+            self._plans[target] = (time.monotonic(), intervals)
+
+        busiest = sorted(range(24), key=lambda h: intervals[h])[:3]
+        logger.info(
+            "📅 Check plan for '%s': every %.0f minutes around %s, "
+            "up to %.0f minutes otherwise",
+            target,
+            intervals[busiest[0]] / 60,
+            ", ".join(f"{h:02d}:00" for h in sorted(busiest)),
+            max(intervals) / 60,
+        )
+        return intervals
+
+    def _allocate(self, counts):
+        """
+        Split the daily budget into checks per hour, proportional to each hour's
+        smoothed availability rate and within the min/max interval bounds
+        """
+        total_checks = sum(c for c, _ in counts.values())
+        total_available = sum(a for _, a in counts.values())
+        prior = total_available / total_checks if total_available else 1.0
+        weights = []
+        for hour in range(24):
+            checks, available = counts.get(hour, (0, 0))
+            weights.append(
+                (available + prior * self.PRIOR_WEIGHT) / (checks + self.PRIOR_WEIGHT)
+            )
+
+        floor = 3600 / self.max_interval
+        ceiling = 3600 / self.min_interval
+        budget = min(max(self.checks_per_day, 24 * floor), 24 * ceiling)
+
+        # Water-filling: hours that hit the ceiling keep it, the rest share what's left
+        allocation = [floor] * 24
+        open_hours = set(range(24))
+        remaining = budget - 24 * floor
+        while remaining > 1e-9 and open_hours:
+            weight_sum = sum(weights[h] for h in open_hours)
+            spent = 0.0
+            for hour in list(open_hours):
+                share = remaining * weights[hour] / weight_sum
+                granted = min(share, ceiling - allocation[hour])
+                allocation[hour] += granted
+                spent += granted
+                if allocation[hour] >= ceiling - 1e-9:
+                    open_hours.discard(hour)
+            remaining -= spent
+            if spent <= 1e-9:
+                break
+        return allocation
@@ -0,0 +1,242 @@
+"""
+Non-blocking logging for Cita Previa Checker Bot
+Log calls only put the record on a bounded queue; a background listener formats it and
+writes it to the console and to a size- or time-rotated, gzip-compressed log file, as
+plain text or JSON lines. Records logged during a check carry its correlation ID
+"""
+
+import contextvars
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(check_label)s%(message)s"
+
+
+def text_formatter():
+    """The console/log file format, tolerant of records logged outside the queue"""
+    return logging.Formatter(TEXT_FORMAT, defaults={"check_label": ""})
+
+
+_check_id = contextvars.ContextVar("check_id", default=None)
+_check_target = contextvars.ContextVar("check_target", default=None)
+
+
+def current_check_id():
+    """Correlation ID of the check running in this thread, or None"""
+    return _check_id.get()
+
+
+@contextmanager
+def check_context(target=None):
+    """
+    Tag every record logged inside the block with a new check ID
+    Args:
+        target: Target key logged alongside the ID
+    Yields: the check ID
+    """
+    check_id = uuid.uuid4().hex[:12]
+    id_token = _check_id.set(check_id)
+    target_token = _check_target.set(target)
+    try:
+        yield check_id
+    finally:
+        _check_id.reset(id_token)
+        _check_target.reset(target_token)
+
+
+class CheckContextFilter(logging.Filter):
+    """Copy the current check ID and target onto records (in the logging thread)"""
+
+    def filter(self, record):
+        record.check_id = _check_id.get()
+        record.target = _check_target.get()
+        record.check_label = f"[{record.check_id}] " if record.check_id else ""
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "check_id": getattr(record, "check_id", None),
+            "target": getattr(record, "target", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        """
+        Merge the message arguments (the only formatting done by the caller) and
+        leave the rest, including tracebacks, to the listener's formatters
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _gzip_namer(name):
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class LogPipeline:
+    """Queue, listener and handlers behind the root logger"""
+
+    def __init__(
+        self,
+        level=logging.INFO,
+        log_file="cita_checker.log",
+        json_format=False,
+        max_bytes=10 * 1024 * 1024,
+        rotate_when=None,
+        backup_count=5,
+        compress=True,
+        queue_size=10000,
+    ):
+        """
+        Args:
+            level: Root log level
+            log_file: Log file path (None: console only)
+            json_format: Write the log file as JSON lines instead of text
+            max_bytes: Rotate the log file at this size (ignored with rotate_when)
+            rotate_when: Rotate by time instead, e.g. "midnight" or "H"
+                (see logging.handlers.TimedRotatingFileHandler)
+            backup_count: Rotated files kept
+            compress: gzip rotated files
+            queue_size: Records buffered before new ones are dropped
+        """
+        self.level = level
+        self.log_file = log_file
+        self.json_format = json_format
+        self.max_bytes = max_bytes
+        self.rotate_when = rotate_when
+        self.backup_count = backup_count
+        self.compress = compress
+        self.queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.queue_handler.addFilter(CheckContextFilter())
+        self.listener = None
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the pipeline from LOG_* in config.Settings (None: read from the
+        environment)
+        """
+        settings = settings or config.Settings.from_env()
+        return cls(
+            level=settings.log_level.upper(),
+            log_file=settings.log_file or None,
+            json_format=settings.log_format.lower() == "json",
+            max_bytes=int(settings.log_max_mb * 1024 * 1024),
+            rotate_when=settings.log_rotate_when or None,
+            backup_count=settings.log_backup_count,
+            compress=settings.log_compress,
+            queue_size=settings.log_queue_size,
+        )
+
+    def start(self):
+        """Route the root logger through the queue and start the listener"""
+        handlers = [logging.StreamHandler()]
+        handlers[0].setFormatter(text_formatter())
+        if self.log_file:
+            handlers.append(self._file_handler())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+
+        self.listener = logging.handlers.QueueListener(
+            self.queue_handler.queue, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """Write out the queued records and close the handlers"""
+        if self.listener is None:
+            return
+        if self.queue_handler.dropped:
+            logging.getLogger(__name__).warning(
+                "%d log records were dropped (queue full)", self.queue_handler.dropped
+            )
+        self.listener.stop()
+        logging.getLogger().removeHandler(self.queue_handler)
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+
+    def prometheus_lines(self):
+        """Dropped-record counter, for Metrics.add_collector"""
+        return [
+            "# TYPE cita_log_records_dropped_total counter",
+            f"cita_log_records_dropped_total {self.queue_handler.dropped}",
+        ]
+
+    def _file_handler(self):
+        if self.rotate_when:
+            handler = logging.handlers.TimedRotatingFileHandler(
+                self.log_file,
+                when=self.rotate_when,
+                backupCount=self.backup_count,
+                encoding="utf-8",
+            )
+        else:
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_file,
+                maxBytes=self.max_bytes,
+                backupCount=self.backup_count,
+                encoding="utf-8",
+            )
+        if self.compress:
+            handler.namer = _gzip_namer
+            handler.rotator = _gzip_rotator
+        handler.setFormatter(JsonFormatter() if self.json_format else text_formatter())
+        return handler
@@ -0,0 +1,252 @@
+"""
+Per-step timing and metrics export for Cita Previa Checker Bot
+Records timing spans for each stage of a check, appends them to a JSON-lines file
+and optionally serves Prometheus-style metrics over HTTP
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+import config
+from log_pipeline import current_check_id
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets (seconds) for step and check durations
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+
+
+class CheckTimer:
+    """Timing spans for one check; starting a step closes the previous one"""
+
+    def __init__(self, metrics, target=None, engine="selenium"):
+        self.metrics = metrics
+        self.target = target
+        self.engine = engine
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.steps = {}
+        # Same ID as the check's log records, so the two can be joined
+        check_id = current_check_id()
+        self.fields = {"check_id": check_id} if check_id else {}
+        self.current_step = None
+        self._step_started = None
+
+    def step(self, name):
+        """Close the running span (if any) and open a new one"""
+        self._close_step()
+        self.current_step = name
+        self._step_started = time.perf_counter()
+
+    def annotate(self, **fields):
+        """Attach extra fields (e.g. traffic stats) to the check's record"""
+        self.fields.update(fields)
+
+    def finish(self, available, message=""):
+        """
+        Close the check and publish its timings
+        Args:
+            available: Outcome of the check (True / False / None)
+            message: Result message
+        """
+        self._close_step()
+        reason = self.current_step if available is None else ""
+        self.metrics.record_check(
+            {
+                **self.fields,
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "started_at": round(self.started_at, 3),
+                "finished_at": round(time.time(), 3),
+                "target": self.target,
+                "engine": self.engine,
+                "available": available,
+                "reason": reason,
+                "message": message,
+                "total": round(time.perf_counter() - self.started, 3),
+                "steps": {k: round(v, 3) for k, v in self.steps.items()},
+            }
+        )
+
+    def _close_step(self):
+        if self.current_step is None or self._step_started is None:
+            return
+        elapsed = time.perf_counter() - self._step_started
+        self.steps[self.current_step] = self.steps.get(self.current_step, 0.0) + elapsed
+        self._step_started = None
+
+
+class Metrics:
+    """Step histograms, outcome counters and their export surfaces"""
+
+    def __init__(self, jsonl_path=None, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            jsonl_path: Append one JSON line per check to this file (optional)
+            buckets: Histogram buckets in seconds
+        """
+        self.jsonl_path = jsonl_path
+        self.buckets = buckets
+        self.step_histograms = {}
+        self.check_histogram = Histogram(buckets)
+        self.outcomes = {}  # (engine, available, reason) -> count
+        self.bytes_transferred = 0
+        self.sinks = []
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build metrics from METRICS_FILE in config.Settings (None: read from the
+        environment) and start the endpoint on METRICS_PORT if set
+        """
+        settings = settings or config.Settings.from_env()
+        metrics = cls(jsonl_path=settings.metrics_file or None)
+        if settings.metrics_port:
+            metrics.serve(settings.metrics_port, settings.metrics_host)
+        return metrics
+
+    def add_sink(self, sink):
+        """Also hand every finished check record to sink(record) (e.g. the history store)"""
+        self.sinks.append(sink)
+
+    def add_collector(self, collector):
+        """Append collector() (a list of exposition lines) to the Prometheus output"""
+        self.collectors.append(collector)
+
+    def start_check(self, target=None, engine="selenium"):
+        """Begin timing a check"""
+        return CheckTimer(self, target, engine)
+
+    def record_check(self, record):
+        """Fold a finished check into the histograms/counters and append it to the file"""
+        with self._lock:
+            for step, seconds in record["steps"].items():
+                histogram = self.step_histograms.get(step)
+                if histogram is None:
+                    histogram = self.step_histograms[step] = Histogram(self.buckets)
+                histogram.observe(seconds)
+            self.check_histogram.observe(record["total"])
+            key = (record["engine"], str(record["available"]), record["reason"])
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            self.bytes_transferred += record.get("bytes_transferred", 0)
+
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except Exception as e:
+                    logger.warning("Could not write metrics file: %s", e)
+
+        for sink in self.sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                logger.warning("Could not record check: %s", e)
+
+    def render_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append(
+                "# HELP cita_step_duration_seconds Duration of each stage of a check"
+            )
+            lines.append("# TYPE cita_step_duration_seconds histogram")
+            for step, histogram in sorted(self.step_histograms.items()):
+                lines.extend(
+                    _histogram_lines(
+                        "cita_step_duration_seconds", histogram, f'step="{step}"'
+                    )
+                )
+
+            lines.append("# HELP cita_check_duration_seconds Duration of a whole check")
+            lines.append("# TYPE cita_check_duration_seconds histogram")
+            lines.extend(
+                _histogram_lines("cita_check_duration_seconds", self.check_histogram)
+            )
+
+            lines.append(
+                "# HELP cita_checks_total Checks by outcome and failure reason"
+            )
+            lines.append("# TYPE cita_checks_total counter")
+            for (engine, available, reason), count in sorted(self.outcomes.items()):
+                lines.append(
+                    f'cita_checks_total{{engine="{engine}",outcome="{available}",reason="{reason}"}} {count}'
+                )
+
+            lines.append(
+                "# HELP cita_transfer_bytes_total Bytes transferred by lean browser checks"
+            )
+            lines.append("# TYPE cita_transfer_bytes_total counter")
+            lines.append(f"cita_transfer_bytes_total {self.bytes_transferred}")
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve /metrics on a background thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info("📈 Metrics available at http://%s:%s/metrics", host, port)
+
+    def close(self):
+        """Stop the metrics endpoint"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _histogram_lines(name, histogram, labels=""):
+    """Exposition lines for one histogram"""
+    prefix = f"{labels}," if labels else ""
+    lines = [
+        f'{name}_bucket{{{prefix}le="{upper}"}} {count}'
+        for upper, count in zip(histogram.buckets, histogram.counts)
+    ]
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.total:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
@@ -0,0 +1,321 @@
+"""
+Non-blocking notification dispatch for Cita Previa Checker Bot
+Queues alerts for a background worker that delivers them over pluggable channels
+(SMTP with a reused connection, webhook, local file) with retries, backoff and dedup
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Notification:
+    """A queued alert"""
+
+    def __init__(self, target, outcome, subject, body):
+        self.target = target
+        self.outcome = outcome
+        self.subject = subject
+        self.body = body
+        self.created = datetime.now()
+        self.queued_at = None  # monotonic time the dispatcher recorded it as sent
+
+    @property
+    def key(self):
+        """Dedup key: same target and same outcome"""
+        return f"{self.target}:{self.outcome}"
+
+
+class EmailChannel:
+    """Send alerts by SMTP, keeping the authenticated connection open between alerts"""
+
+    name = "email"
+
+    def __init__(
+        self,
+        sender_email,
+        sender_password,
+        receiver_email,
+        smtp_server="smtp.gmail.com",
+        smtp_port=587,
+        timeout=30,
+    ):
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.receiver_email = receiver_email
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.timeout = timeout
+        self._server = None
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the channel from SENDER_EMAIL etc. in config.Settings (None: read from
+        the environment), or None if not configured
+        """
+        settings = settings or config.Settings.from_env()
+        sender_email = settings.sender_email
+        sender_password = settings.sender_password
+        receiver_email = settings.receiver_email
+        if not all([sender_email, sender_password, receiver_email]):
+            logger.warning(
+                "Email credentials not configured. Skipping email notification."
+            )
+            return None
+        return cls(
+            sender_email,
+            sender_password,
+            receiver_email,
+            smtp_server=settings.smtp_server,
+            smtp_port=settings.smtp_port,
+        )
+
+    def send(self, notification):
+        """Send one alert, reconnecting once if the kept-alive connection went stale"""
+        # Imported on first use so that short runs without alerts don't pay for them
+        import smtplib
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        msg = MIMEMultipart()
+        msg["From"] = self.sender_email
+        msg["To"] = self.receiver_email
+        msg["Subject"] = notification.subject
+        msg.attach(MIMEText(notification.body, "plain"))
+
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connection().send_message(msg)
+        logger.info("✉️ Email notification sent to %s", self.receiver_email)
+
+    def close(self):
+        """Close the SMTP connection"""
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
+
+    def _connection(self):
+        """Return a live SMTP connection, reusing the previous one if it still answers"""
+        import smtplib
+
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            self.close()
+
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            server.starttls()
+            server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        return server
+
+
+class WebhookChannel:
+    """POST alerts as JSON to a URL"""
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=15):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notification):
+        # Imported on first use; it pulls in http.client and ssl
+        import urllib.request
+
+        payload = json.dumps(
+            {
+                "target": notification.target,
+                "outcome": notification.outcome,
+                "subject": notification.subject,
+                "body": notification.body,
+                "time": notification.created.isoformat(timespec="seconds"),
+            }
+        ).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=payload, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+        logger.info("🔔 Webhook notification sent to %s", self.url)
+
+    def close(self):
+        pass
+
+
+class FileChannel:
+    """Append alerts to a local file"""
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, notification):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(
+                f"[{notification.created.strftime('%Y-%m-%d %H:%M:%S')}] "
+                f"{notification.subject}\n{notification.body}\n\n"
+            )
+        logger.info("📝 Notification written to %s", self.path)
+
+    def close(self):
+        pass
+
+
+class NotificationDispatcher:
+    """Background queue that delivers notifications to every channel"""
+
+    def __init__(
+        self, channels, cooldown_seconds=3600, max_retries=3, backoff_seconds=5
+    ):
+        """
+        Args:
+            channels: Objects with send(notification) and close()
+            cooldown_seconds: Suppress repeats of the same target+outcome for this long
+            max_retries: Delivery attempts per channel after the first one
+            backoff_seconds: Initial retry delay, doubled after every failure
+        """
+        self.channels = list(channels)
+        self.cooldown_seconds = cooldown_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._queue = queue.Queue()
+        self._last_sent = {}  # key -> monotonic time
+        self._last_outcome = {}  # target -> outcome
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._run, name="notifications", daemon=True
+        )
+        self._worker.start()
+
+    @classmethod
+    def from_env(cls, settings=None):
+        """
+        Build the dispatcher and its channels from NOTIFY_* in config.Settings (None:
+        read from the environment)
+        """
+        settings = settings or config.Settings.from_env()
+        channels = []
+        for name in settings.notify_channel_names:
+            if name == "email":
+                channel = EmailChannel.from_env(settings)
+                if channel:
+                    channels.append(channel)
+            elif name == "webhook" and settings.notify_webhook_url:
+                channels.append(WebhookChannel(settings.notify_webhook_url))
+            elif name == "file":
+                channels.append(FileChannel(settings.notify_file))
+            else:
+                logger.warning("Notification channel '%s' is not configured", name)
+
+        return cls(
+            channels,
+            cooldown_seconds=settings.notify_cooldown_minutes * 60,
+            max_retries=settings.notify_max_retries,
+        )
+
+    def observe(self, target, outcome):
+        """
+        Record a check outcome; when it changes, the next alert for the target is
+        a new event and is not held back by the cooldown
+        """
+        with self._lock:
+            if self._last_outcome.get(target) != outcome:
+                self._last_outcome[target] = outcome
+                for key in [k for k in self._last_sent if k.startswith(f"{target}:")]:
+                    del self._last_sent[key]
+
+    def notify(self, target, outcome, subject, body):
+        """
+        Queue a notification without blocking the caller
+        Returns: True if queued, False if suppressed as a duplicate
+        """
+        if not self.channels:
+            logger.warning("No notification channels configured")
+            return False
+
+        notification = Notification(target, outcome, subject, body)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_sent.get(notification.key)
+            if last is not None and now - last < self.cooldown_seconds:
+                logger.info(
+                    "Notification for '%s' suppressed (already sent %.0f minutes ago)",
+                    target,
+                    (now - last) / 60,
+                )
+                return False
+            # Recorded now so repeats queued meanwhile are held back; cleared again
+            # if no channel delivers it
+            self._last_sent[notification.key] = now
+            notification.queued_at = now
+
+        self._queue.put(notification)
+        return True
+
+    def close(self, timeout=30):
+        """Deliver what is queued (up to timeout seconds) and close the channels"""
+        self._queue.put(None)
+        self._worker.join(timeout)
+        for channel in self.channels:
+            channel.close()
+
+    def _run(self):
+        while True:
+            notification = self._queue.get()
+            if notification is None:
+                return
+            delivered = [
+                self._deliver(channel, notification) for channel in self.channels
+            ]
+            if not any(delivered):
+                self._forget(notification)
+
+    def _forget(self, notification):
+        """Let the next alert for an undelivered notification through the cooldown"""
+        with self._lock:
+            if self._last_sent.get(notification.key) == notification.queued_at:
+                del self._last_sent[notification.key]
+
+    def _deliver(self, channel, notification):
+        """Send to one channel with exponential backoff between attempts"""
+        delay = self.backoff_seconds
+        for attempt in range(self.max_retries + 1):
+            try:
+                channel.send(notification)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error("Failed to send %s notification: %s", channel.name, e)
+                    return False
+                logger.warning(
+                    "%s notification failed (%s), retrying in %gs",
+                    channel.name,
+                    e,
+                    delay,
+                )
+                time.sleep(delay)
+                delay *= 2
@@ -0,0 +1,48 @@
+"""
+Pacing policy for Cita Previa Checker Bot
+Single place that decides how long to pause between steps of the flow
+"""
+
+import random
+import time
+
+import config
+
+
+class PacingPolicy:
+    """Randomised, configurable pauses between flow steps"""
+
+    def __init__(self, min_delay=0.5, max_delay=1.5, step_delays=None):
+        """
+        Args:
+            min_delay: Lower bound of the default pause (seconds)
+            max_delay: Upper bound of the default pause (seconds)
+            step_delays: Optional {step_name: (min, max)} overrides
+        """
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.step_delays = step_delays or {}
+
+    @classmethod
+    def from_config(cls, settings=None):
+        """Build the policy from config.Settings (None: read from the environment)"""
+        policy = cls()
+        policy.apply_settings(settings or config.Settings.from_env())
+        return policy
+
+    def apply_settings(self, settings):
+        """Take PACING_MIN_SECONDS / PACING_MAX_SECONDS from reloaded settings"""
+        self.min_delay = settings.pacing_min_seconds
+        self.max_delay = max(self.min_delay, settings.pacing_max_seconds)
+
+    def delay_for(self, step=None):
+        """Pick the pause length for a step"""
+        low, high = self.step_delays.get(step, (self.min_delay, self.max_delay))
+        return random.uniform(low, high) if high > 0 else 0.0
+
+    def pause(self, step=None):
+        """Sleep for the pause chosen for a step"""
+        delay = self.delay_for(step)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
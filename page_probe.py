@@ -0,0 +1,161 @@
+"""
+Zero-wait DOM probing for Cita Previa Checker Bot
+Collects page markers and optional elements in a single execute_script round-trip
+"""
+
+import hashlib
+import re
+
+from selenium.common.exceptions import WebDriverException
+
+# Element IDs whose presence drives the flow and the result classification
+PROBE_IDS = [
+    "cookie_action_close_header",
+    "sede",
+    "tramiteGrupo[0]",
+    "btnAceptar",
+    "btnEntrar",
+    "txtIdCitado",
+    "btnEnviar",
+    "idCaptcha",
+    "idSede",
+]
+
+# Returns everything in one call so that misses never wait on the implicit timeout
+SNAPSHOT_SCRIPT = """
+var ids = arguments[0];
+var present = {};
+for (var i = 0; i < ids.length; i++) {
+    present[ids[i]] = document.getElementById(ids[i]) !== null;
+}
+// Text nodes outside <script> and <style>, as the HTTP engine's parser collects them;
+// textContent would include inline scripts, whose strings can look like a result
+var parts = [];
+var root = document.documentElement;
+if (root) {
+    var walker = document.createTreeWalker(root, NodeFilter.SHOW_TEXT, {
+        acceptNode: function (node) {
+            var parent = node.parentNode ? node.parentNode.nodeName : "";
+            return parent === "SCRIPT" || parent === "STYLE"
+                ? NodeFilter.FILTER_REJECT
+                : NodeFilter.FILTER_ACCEPT;
+        }
+    });
+    while (walker.nextNode()) {
+        parts.push(walker.currentNode.nodeValue);
+    }
+}
+var text = parts.join(" ");
+return {
+    url: window.location.href,
+    ready_state: document.readyState,
+    title: document.title,
+    text: text.replace(/\\s+/g, " ").toLowerCase(),
+    present: present
+};
+"""
+
+# Result page text meaning the ICP session is gone and the flow must restart
+SESSION_EXPIRED_PHRASES = [
+    "sesión ha caducado",
+    "sesion ha caducado",
+    "session has expired",
+    "vuelva a empezar",
+]
+
+
+def take_snapshot(driver, ids=None):
+    """
+    Probe the current page without waiting
+    Args:
+        driver: WebDriver positioned on the page to probe
+        ids: Element IDs to check (defaults to PROBE_IDS)
+    Returns: dict with url, ready_state, title, text (lowercased) and present (id -> bool)
+    """
+    return driver.execute_script(SNAPSHOT_SCRIPT, list(ids or PROBE_IDS))
+
+
+def session_expired(snapshot):
+    """True if a snapshot shows the site's expired-session page"""
+    return any(phrase in snapshot["text"] for phrase in SESSION_EXPIRED_PHRASES)
+
+
+def on_page(*ids, without=()):
+    """
+    Snapshot predicate: the page shows every id in ids and none in without
+    (an expired-session page never matches)
+    """
+
+    def _predicate(snapshot):
+        present = snapshot["present"]
+        return (
+            not session_expired(snapshot)
+            and all(present.get(element_id) for element_id in ids)
+            and not any(present.get(element_id) for element_id in without)
+        )
+
+    return _predicate
+
+
+def page_fingerprint(snapshot):
+    """
+    Short hash of a page's text and markers, with digits blanked out so dates and
+    counters don't change it; a new fingerprint for a known outcome means the page changed
+    """
+    text = re.sub(r"\d+", "#", snapshot["text"])
+    markers = ",".join(sorted(k for k, v in snapshot["present"].items() if v))
+    return hashlib.sha1(f"{markers}|{text}".encode("utf-8")).hexdigest()[:16]
+
+
+# Readiness conditions for WebDriverWait.until(), in the style of expected_conditions
+
+
+def document_ready(driver):
+    """Condition: the current document has finished loading"""
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def ready_with_element(locator):
+    """Condition: document loaded and the element is present; returns the element"""
+
+    def _predicate(driver):
+        if not document_ready(driver):
+            return False
+        elements = driver.find_elements(*locator)
+        return elements[0] if elements else False
+
+    return _predicate
+
+
+def url_contains_when_ready(fragment):
+    """Condition: the URL contains fragment and the document has finished loading"""
+
+    def _predicate(driver):
+        return fragment in driver.current_url and document_ready(driver)
+
+    return _predicate
+
+
+def select_options_loaded(element_id, min_options=2):
+    """
+    Condition: a <select> has been populated with at least min_options options
+    Looks the element up on every poll so it survives the page reloading underneath
+    Returns: list of option values
+    """
+
+    def _predicate(driver):
+        if not document_ready(driver):
+            return False
+        try:
+            values = driver.execute_script(
+                "var el = document.getElementById(arguments[0]);"
+                "if (!el || !el.options) { return null; }"
+                "return Array.prototype.map.call(el.options, function (o) { return o.value; });",
+                element_id,
+            )
+        except WebDriverException:
+            # Script raced with a navigation; poll again
+            return False
+        return values if values and len(values) >= min_options else False
+
+    return _predicate
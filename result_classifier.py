@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Result page classifier for Cita Previa Checker Bot
+Classifies the acCitar page from one pass over its text plus DOM markers, and checks
+itself against a corpus of saved pages from the command line
+"""
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import re
+import sys
+import time
+from dataclasses import dataclass
+from enum import Enum
+
+from page_probe import PROBE_IDS, SESSION_EXPIRED_PHRASES, take_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Outcome(Enum):
+    """What the result page says"""
+
+    NO_CITAS = "no_citas"
+    CLAVE_ONLY = "clave_only"
+    AVAILABLE = "available"
+    SESSION_EXPIRED = "session_expired"
+    ERROR = "error"
+    UNKNOWN = "unknown"
+
+
+# Check result (available) reported for each outcome; None means "could not tell"
+AVAILABILITY = {
+    Outcome.NO_CITAS: False,
+    Outcome.CLAVE_ONLY: False,
+    Outcome.AVAILABLE: True,
+    Outcome.SESSION_EXPIRED: None,
+    Outcome.ERROR: None,
+    Outcome.UNKNOWN: None,
+}
+
+# Text signals: signal -> phrases (lowercase, matched at the start of a word)
+SIGNAL_PHRASES = {
+    "no_citas": [
+        "no hay citas disponibles",
+        "en este momento no hay citas disponibles",
+        "no existen citas disponibles",
+        "agotadas las citas",
+        "no hay citas disponibles para la reserva sin cl@ve",
+    ],
+    "clave": [
+        "sí tienen a su disposición mediante el uso de cl@ve",
+        "si tienen a su disposicion mediante el uso de cl@ve",
+    ],
+    "session_expired": SESSION_EXPIRED_PHRASES,
+    "error": [
+        "the requested url was rejected",
+        "se ha producido un error",
+        "servicio no disponible",
+        "too many requests",
+    ],
+    "select": ["selecciona", "seleccione una"],
+    "date": ["fecha", "hora", "día:"],
+}
+
+
+@dataclass
+class Classification:
+    """A classified result page"""
+
+    outcome: Outcome
+    confidence: float
+    message: str
+    signals: tuple = ()
+
+    @property
+    def available(self):
+        return AVAILABILITY[self.outcome]
+
+    def as_result(self):
+        """The (available, message) tuple the checker reports"""
+        return self.available, self.message
+
+
+class ResultClassifier:
+    """Single-pass multi-pattern matcher over the page text plus DOM markers"""
+
+    def __init__(self, signal_phrases=None):
+        """
+        Args:
+            signal_phrases: dict signal -> phrases (defaults to SIGNAL_PHRASES)
+        """
+        self.signal_phrases = signal_phrases or SIGNAL_PHRASES
+        self._signal_of = {
+            phrase.lower(): signal
+            for signal, phrases in self.signal_phrases.items()
+            for phrase in phrases
+        }
+        # Longest phrases first so a phrase that extends another one wins
+        alternatives = sorted(self._signal_of, key=len, reverse=True)
+        self._pattern = re.compile(
+            r"(?<!\w)(?:" + "|".join(re.escape(p) for p in alternatives) + ")"
+        )
+
+    def signals(self, text):
+        """Set of signals found in the (lowercased) page text"""
+        return {
+            self._signal_of[match.group(0)] for match in self._pattern.finditer(text)
+        }
+
+    def classify(self, snapshot):
+        """
+        Classify a result page
+        Args:
+            snapshot: Page snapshot from page_probe.take_snapshot (or Page.snapshot)
+        Returns: Classification
+        """
+        found = self.signals(snapshot["text"])
+        present = snapshot["present"]
+        markers = {
+            element_id
+            for element_id in ("idCaptcha", "idSede")
+            if present.get(element_id)
+        }
+        signals = tuple(sorted(found | markers))
+
+        def result(outcome, confidence, message):
+            return Classification(outcome, confidence, message, signals)
+
+        if "session_expired" in found:
+            return result(
+                Outcome.SESSION_EXPIRED, 0.95, "Session expired before the result page"
+            )
+
+        if "no_citas" in found:
+            # A calendar next to a "no citas" message is contradictory; trust the text less
+            confidence = 0.6 if markers else 0.95
+            if "clave" in found:
+                return result(
+                    Outcome.CLAVE_ONLY,
+                    confidence,
+                    "No hay citas disponibles sin Cl@ve. Hay citas disponibles CON Cl@ve.",
+                )
+            return result(
+                Outcome.NO_CITAS,
+                confidence,
+                "No hay citas disponibles en ninguna oficina",
+            )
+
+        if "idCaptcha" in markers:
+            confidence = 0.95 if {"select", "date"} & found else 0.9
+            return result(
+                Outcome.AVAILABLE,
+                confidence,
+                "¡Citas disponibles! Check the website immediately.",
+            )
+
+        if "idSede" in markers:
+            return result(
+                Outcome.AVAILABLE,
+                0.7,
+                "¡Posibles citas disponibles! Check the website immediately.",
+            )
+
+        if "error" in found:
+            return result(Outcome.ERROR, 0.9, "The site returned an error page")
+
+        if "select" in found and "date" in found:
+            return result(
+                Outcome.AVAILABLE,
+                0.6,
+                "¡Citas disponibles! Check the website immediately.",
+            )
+
+        # Anything unrecognised is reported as unclear, never as an alert
+        return result(
+            Outcome.UNKNOWN,
+            0.0,
+            "Unrecognised result page - please check the website manually",
+        )
+
+
+# Offline corpus runner
+
+
+def load_corpus(directory):
+    """
+    Saved result pages and their expected outcomes
+    Returns: list of (file path, html, Outcome) from the directory's manifest.json
+    """
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    corpus = []
+    for name, expected in sorted(manifest.items()):
+        path = os.path.join(directory, name)
+        with open(path, encoding="utf-8") as f:
+            corpus.append((path, f.read(), Outcome(expected)))
+    return corpus
+
+
+def http_snapshots():
+    """Snapshot builder parsing pages like the HTTP engine; returns (build, close)"""
+    # Imported here so the classifier itself doesn't depend on the HTTP engine
+    from http_engine import Page
+
+    def build(path, html):
+        return Page(f"file://{os.path.basename(path)}", html).snapshot(PROBE_IDS)
+
+    return build, lambda: None
+
+
+def browser_snapshots():
+    """
+    Snapshot builder loading pages in headless Chrome and probing them with the
+    Selenium engine's snapshot script; returns (build, close)
+    """
+    from cita_checker import CitaChecker
+
+    driver = CitaChecker(headless=True).create_driver()
+
+    def build(path, html):
+        driver.get(pathlib.Path(os.path.abspath(path)).as_uri())
+        return take_snapshot(driver)
+
+    return build, driver.quit
+
+
+SNAPSHOT_BUILDERS = {"http": http_snapshots, "selenium": browser_snapshots}
+
+
+def main():
+    """Check the classifier against the corpus and time it"""
+    parser = argparse.ArgumentParser(
+        description="Run the result classifier over saved acCitar pages"
+    )
+    parser.add_argument(
+        "corpus",
+        nargs="?",
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "corpus", "accitar"
+        ),
+        help="Directory with saved pages and manifest.json",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1000, help="Classifications per page for timing"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("http", "selenium", "both"),
+        default="both",
+        help="Build snapshots like the HTTP engine, in Chrome like the Selenium "
+        "engine, or both (default; needs Chrome)",
+    )
+    args = parser.parse_args()
+
+    classifier = ResultClassifier()
+    corpus = load_corpus(args.corpus)
+    engines = ["http", "selenium"] if args.engine == "both" else [args.engine]
+    failures = 0
+    runs = 0
+    total_seconds = 0.0
+
+    for engine in engines:
+        build, close = SNAPSHOT_BUILDERS[engine]()
+        print(f"\n[{engine}]")
+        print(f"{'page':<32}{'expected':<17}{'got':<17}{'conf':>5}{'µs':>9}")
+        try:
+            for path, html, expected in corpus:
+                name = os.path.basename(path)
+                snapshot = build(path, html)
+                started = time.perf_counter()
+                for _ in range(args.repeat):
+                    classification = classifier.classify(snapshot)
+                elapsed = (time.perf_counter() - started) / args.repeat
+                total_seconds += elapsed
+                runs += 1
+
+                ok = classification.outcome == expected
+                failures += not ok
+                print(
+                    f"{name:<32}{expected.value:<17}{classification.outcome.value:<17}"
+                    f"{classification.confidence:>5.2f}{elapsed * 1e6:>9.1f}"
+                    f"{'' if ok else '  MISMATCH'}"
+                )
+        finally:
+            close()
+
+    print(
+        f"\n{runs - failures}/{runs} correct, "
+        f"{total_seconds / max(1, runs) * 1e6:.1f} µs per page on average"
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Bounded asyncio scheduler for Cita Previa Checker Bot
+Runs every watch target on its own interval with a global concurrency cap and a per-host
+request-rate ceiling; blocking Selenium work runs in a bounded thread pool. With a
+coordinator, targets are leased so several workers can share one watch list. Targets
+and limits can be changed while it runs
+"""
+
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class HostRateLimiter:
+    """Space check starts so no host sees more than max_per_minute of them"""
+
+    def __init__(self, max_per_minute):
+        self.set_rate(max_per_minute)
+        self._next_slot = {}
+        self._locks = {}
+
+    def set_rate(self, max_per_minute):
+        """Change the ceiling (0: unlimited); slots already handed out are kept"""
+        self.min_spacing = 60.0 / max_per_minute if max_per_minute > 0 else 0.0
+
+    async def acquire(self, host):
+        """Wait until the host's next slot is free"""
+        if not self.min_spacing:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_spacing
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class ConcurrencyLimit:
+    """Semaphore whose limit can change while checks hold it"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._running = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._running < self.limit)
+            self._running += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._changed:
+            self._running -= 1
+            self._changed.notify_all()
+
+    async def resize(self, limit):
+        """Change the limit; running checks above a lower limit finish normally"""
+        async with self._changed:
+            self.limit = limit
+            self._changed.notify_all()
+
+
+class WatchScheduler:
+    """Drive all watch targets from one event loop"""
+
+    def __init__(
+        self,
+        checkers,
+        max_concurrency=2,
+        host_checks_per_minute=4,
+        jitter=0.1,
+        interval_policy=None,
+        coordinator=None,
+    ):
+        """
+        Args:
+            checkers: list of (WatchTarget, CitaChecker) pairs
+            max_concurrency: Checks allowed to run at the same time across all targets
+            host_checks_per_minute: Ceiling on check starts per host
+            jitter: Random +/- fraction applied to each target's interval
+            interval_policy: AdaptiveIntervalPolicy replacing the targets' fixed
+                intervals (optional)
+            coordinator: coordination.Coordinator; each check first leases its target
+                so no other worker checks it at the same time (optional)
+        """
+        self.targets = {target.name: (target, checker) for target, checker in checkers}
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = HostRateLimiter(host_checks_per_minute)
+        self.jitter = jitter
+        self.interval_policy = interval_policy
+        self.coordinator = coordinator
+        self.check_counts = {name: 0 for name in self.targets}
+        self._limit = None
+        self._loop = None
+        self._failed = None
+        self._reloaded = None
+        self._executor_size = self.max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._executor_size, thread_name_prefix="check"
+        )
+
+    def run_forever(self):
+        """Run until interrupted"""
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logger.info("\n\n🛑 Bot stopped by user")
+            logger.info("Total checks performed: %s", sum(self.check_counts.values()))
+        finally:
+            self._executor.shutdown(wait=True)
+
+    async def run(self):
+        """Start one watch loop per target and run until one of them fails"""
+        self._loop = asyncio.get_running_loop()
+        self._limit = ConcurrencyLimit(self.max_concurrency)
+        self._reloaded = asyncio.Event()
+        self._failed = self._loop.create_future()
+        logger.info(
+            "🤖 Watching %s targets (max %s concurrent checks)",
+            len(self.targets),
+            self.max_concurrency,
+        )
+        for target, checker in self.targets.values():
+            self._log_target(target)
+            self._start(target.name, checker)
+        await self._failed
+
+    def apply_settings(self, settings):
+        """Take reloaded concurrency and rate limits (callable from any thread)"""
+        self._call_soon(self._apply_settings, settings)
+
+    def update_targets(self, checkers):
+        """
+        Replace the watched targets (callable from any thread)
+        Args:
+            checkers: list of (WatchTarget, CitaChecker) pairs; a target whose checker
+                is unchanged keeps its loop and session, and a new interval rescales
+                its current wait. Targets left out stop after their running check
+        """
+        self._call_soon(self._update_targets, list(checkers))
+
+    def _call_soon(self, func, *args):
+        if self._loop is None or self._loop.is_closed():
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _apply_settings(self, settings):
+        self.rate_limiter.set_rate(settings.host_checks_per_minute)
+        limit = max(1, settings.max_concurrent_checks)
+        if limit == self.max_concurrency:
+            return
+        logger.info("⚙️ Max concurrent checks: %s -> %s", self.max_concurrency, limit)
+        self.max_concurrency = limit
+        if limit > self._executor_size:
+            # Running checks finish on the old pool's threads
+            old, self._executor_size = self._executor, limit
+            self._executor = ThreadPoolExecutor(
+                max_workers=limit, thread_name_prefix="check"
+            )
+            old.shutdown(wait=False)
+        if self._limit is not None:
+            asyncio.ensure_future(self._limit.resize(limit))
+
+    def _update_targets(self, checkers):
+        previous = self.targets
+        self.targets = {target.name: (target, checker) for target, checker in checkers}
+        for name in previous.keys() - self.targets.keys():
+            logger.info("➖ '%s' removed from the watch list", name)
+        for target, checker in self.targets.values():
+            self.check_counts.setdefault(target.name, 0)
+            old = previous.get(target.name)
+            if old is not None and old[1] is checker:
+                continue
+            logger.info(
+                "%s '%s'", "➕ Added" if old is None else "🔄 Updated", target.name
+            )
+            if self._loop is not None:
+                self._log_target(target)
+                self._start(target.name, checker)
+
+        # Wake waiting loops so they stop or take their new interval
+        if self._reloaded is not None:
+            reloaded, self._reloaded = self._reloaded, asyncio.Event()
+            reloaded.set()
+
+    def _start(self, name, checker):
+        task = asyncio.create_task(self._watch(name, checker))
+        task.add_done_callback(self._loop_done)
+
+    def _loop_done(self, task):
+        if task.cancelled() or self._failed.done():
+            return
+        if task.exception() is not None:
+            self._failed.set_exception(task.exception())
+
+    def _log_target(self, target):
+        logger.info(
+            "📋 %s: office %s, tramite %s, every %g minutes",
+            target.name,
+            target.office_value,
+            target.tramite_value,
+            target.interval_minutes,
+        )
+
+    def _current(self, name, checker):
+        """The target's current entry, or None once checker no longer serves it"""
+        entry = self.targets.get(name)
+        if entry is None or entry[1] is not checker:
+            return None
+        return entry[0]
+
+    async def _watch(self, name, checker):
+        """Check one target until it is removed or replaced"""
+        loop = asyncio.get_running_loop()
+        target = self._current(name, checker)
+
+        # Spread the first checks out instead of starting everything at once
+        await self._sleep(
+            name, checker, random.uniform(0, min(60, target.interval_minutes * 60))
+        )
+
+        while True:
+            target = self._current(name, checker)
+            if target is None:
+                # Removed or replaced: give up its held session
+                await asyncio.to_thread(checker.release_session)
+                return
+
+            lease = None
+            if self.coordinator:
+                lease = await asyncio.to_thread(
+                    self.coordinator.acquire, checker.target_key
+                )
+                if lease is None:
+                    # Another worker holds it or checked it recently
+                    wait = await asyncio.to_thread(
+                        self.coordinator.wait_seconds, checker.target_key
+                    )
+                    await self._sleep(
+                        name, checker, wait * (1 + random.uniform(0, self.jitter))
+                    )
+                    continue
+                heartbeat = asyncio.create_task(self._heartbeat(lease))
+
+            await self.rate_limiter.acquire(target.host)
+            available = None
+            async with self._limit:
+                if self._current(name, checker) is None:
+                    # Removed or replaced while waiting for its turn
+                    if lease is not None:
+                        heartbeat.cancel()
+                        await self._release(name, lease, None, 0)
+                    continue
+                self.check_counts[name] += 1
+                logger.info("Check #%s for '%s'", self.check_counts[name], name)
+                try:
+                    available, _ = await loop.run_in_executor(
+                        self._executor, self._check_and_handle, checker
+                    )
+                except Exception as e:
+                    logger.error("Check for '%s' failed: %s", name, e)
+
+            interval = None
+            if self.interval_policy:
+                delay = self.interval_policy.next_delay(checker.target_key, available)
+            else:
+                target = self._current(name, checker) or target
+                interval = target.interval_minutes
+                delay = interval * 60 * (1 + random.uniform(-self.jitter, self.jitter))
+
+            if lease is not None:
+                heartbeat.cancel()
+                await self._release(name, lease, available, delay)
+
+            logger.info(
+                "⏳ '%s' waiting %.1f minutes until next check...", name, delay / 60
+            )
+            await self._sleep(name, checker, delay, interval)
+
+    async def _release(self, name, lease, available, delay):
+        try:
+            await asyncio.to_thread(self.coordinator.release, lease, available, delay)
+        except Exception as e:
+            logger.error("Could not release lease on '%s': %s", name, e)
+
+    async def _sleep(self, name, checker, delay, interval=None):
+        """
+        Wait before the next check; ends early if the target is removed, and is
+        rescaled if its interval changes (interval: minutes the delay is based on)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._reloaded.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+            target = self._current(name, checker)
+            if target is None:
+                return
+            if interval is not None and target.interval_minutes != interval:
+                deadline += (deadline - loop.time()) * (
+                    target.interval_minutes / interval - 1
+                )
+                interval = target.interval_minutes
+                logger.info(
+                    "⏳ '%s' interval changed, next check in %.1f minutes",
+                    name,
+                    max(0.0, deadline - loop.time()) / 60,
+                )
+
+    async def _heartbeat(self, lease):
+        """Keep a lease alive while its check waits and runs"""
+        while True:
+            await asyncio.sleep(self.coordinator.heartbeat_seconds)
+            try:
+                if not await asyncio.to_thread(self.coordinator.heartbeat, lease):
+                    return
+            except Exception as e:
+                logger.warning("Lease heartbeat failed: %s", e)
+
+    def _check_and_handle(self, checker):
+        """Blocking part of a check, run on the executor"""
+        available, message = checker.perform_check()
+        checker.handle_result(available, message)
+        return available, message
@@ -0,0 +1,172 @@
+"""
+Office sweep for Cita Previa Checker Bot
+Checks every office of the province for the tramite in one session: the province page
+is loaded (and the office list read) once, then each office is walked in turn with a
+minimum spacing between offices, giving one outcome per office
+"""
+
+import logging
+import random
+import time
+from dataclasses import dataclass
+
+from log_pipeline import check_context
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OfficeResult:
+    """Outcome of one office in a sweep"""
+
+    office_value: str
+    office_name: str
+    available: object  # True / False / None, as returned by a check
+    message: str
+
+
+class OfficeSweep:
+    """Sweep all offices with a checker's engine"""
+
+    def __init__(self, checker, office_spacing_seconds=15, max_offices=0):
+        """
+        Args:
+            checker: CitaChecker (its engine, if set, does the requests)
+            office_spacing_seconds: Minimum time between the start of two offices
+            max_offices: Check at most this many offices per sweep (0: all)
+        """
+        self.checker = checker
+        self.office_spacing = office_spacing_seconds
+        self.max_offices = max_offices
+
+    @classmethod
+    def from_config(cls, checker):
+        """Build the sweep from the checker's SWEEP_* settings"""
+        sweep = cls(checker)
+        sweep.apply_settings(checker.settings)
+        return sweep
+
+    def apply_settings(self, settings):
+        """Take SWEEP_OFFICE_SPACING_SECONDS / SWEEP_MAX_OFFICES from reloaded settings"""
+        self.office_spacing = settings.sweep_office_spacing_seconds
+        self.max_offices = settings.sweep_max_offices
+
+    def office_key(self, office_value):
+        """Target key of one office, as used by the metrics and history"""
+        return f"{office_value}-{self.checker.TRAMITE_VALUE}"
+
+    def run(self):
+        """
+        Run one sweep
+        Returns: list of OfficeResult, in the order the site lists the offices
+        """
+        checker = self.checker
+        settings = checker.apply_pending_settings()
+        if settings is not None:
+            self.apply_settings(settings)
+        walker = checker.engine if checker.engine is not None else checker
+        engine = "http" if checker.engine is not None else "selenium"
+        results = []
+
+        # All offices of a sweep share one correlation ID
+        with check_context(f"sweep-{checker.TRAMITE_VALUE}"):
+            # Session setup and the office list count towards the first office
+            walker.timer = checker.metrics.start_check(engine=engine)
+            try:
+                offices = walker.sweep_start()
+            except Exception as e:
+                logger.error("Could not load the office list: %s", e)
+                walker.timer.finish(None, f"Error: {str(e)}")
+                walker.sweep_end(discard=True)
+                return results
+            if self.max_offices:
+                offices = offices[: self.max_offices]
+            if not offices:
+                logger.error("The province page lists no offices")
+                walker.timer.finish(None, "No offices listed")
+                walker.sweep_end(discard=True)
+                return results
+            logger.info(
+                "🏢 Sweeping %d offices for %s", len(offices), checker.TRAMITE_NAME
+            )
+
+            next_start = time.monotonic()
+            available = None
+            for index, (office_value, office_name) in enumerate(offices):
+                if index:
+                    time.sleep(max(0.0, next_start - time.monotonic()))
+                    walker.timer = checker.metrics.start_check(
+                        self.office_key(office_value), engine=engine
+                    )
+                else:
+                    walker.timer.target = self.office_key(office_value)
+                next_start = time.monotonic() + self.office_spacing
+
+                logger.info("Office %d/%d: %s", index + 1, len(offices), office_name)
+                try:
+                    available, message = walker.sweep_office(office_value, office_name)
+                except Exception as e:
+                    logger.error("Error checking %s: %s", office_name, e)
+                    available, message = None, f"Error: {str(e)}"
+                walker.timer.finish(available, message)
+                results.append(
+                    OfficeResult(office_value, office_name, available, message)
+                )
+
+            # A session that ended on an unclear page isn't reused
+            walker.sweep_end(discard=available is None)
+        return results
+
+    def report(self, results):
+        """Notify about offices with appointments and log a summary"""
+        checker = self.checker
+        for result in results:
+            key = self.office_key(result.office_value)
+            if checker.notifier is not None:
+                checker.notifier.observe(key, result.available)
+            if result.available:
+                checker.send_email_notification(
+                    f"🎉 CITA PREVIA AVAILABLE – {checker.TRAMITE_NAME} "
+                    f"({result.office_name})",
+                    f"{result.office_name}\n\n{result.message}",
+                    target_key=key,
+                )
+
+        found = [r.office_name for r in results if r.available]
+        logger.info(
+            "Sweep finished: %d offices with appointments, %d without, %d unclear",
+            len(found),
+            sum(r.available is False for r in results),
+            sum(r.available is None for r in results),
+        )
+        for name in found:
+            logger.info("✅ %s", name)
+
+    def run_once(self):
+        """Run and report one sweep; returns its results"""
+        results = self.run()
+        self.report(results)
+        return results
+
+    def run_forever(self, interval_minutes=None):
+        """
+        Sweep every interval_minutes (+/- 2 minutes) until interrupted
+        (None: CHECK_INTERVAL_MINUTES, following reloads)
+        """
+        sweeps = 0
+        try:
+            while True:
+                sweeps += 1
+                logger.info("Sweep #%d", sweeps)
+                self.run_once()
+                interval = interval_minutes or (
+                    self.checker.current_settings.check_interval_minutes
+                )
+                delay = interval * 60 + random.randint(-2, 2) * 60
+                logger.info("⏳ Waiting %.1f minutes until next sweep...", delay / 60)
+                self.checker.wait_for_next_check(
+                    delay, None if interval_minutes else interval
+                )
+        except KeyboardInterrupt:
+            logger.info("\n\n🛑 Bot stopped by user")
+            logger.info("Total sweeps performed: %s", sweeps)
@@ -0,0 +1,115 @@
+"""
+Declarative watch list for Cita Previa Checker Bot
+Each entry names an office/tramite/applicant combination and how often to check it
+"""
+
+import json
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from config import Settings
+
+
+@dataclass
+class WatchTarget:
+    """One office/tramite/applicant combination to watch"""
+
+    name: str
+    provincia_url: str
+    office_value: str
+    tramite_value: str
+    nie_number: str
+    full_name: str
+    interval_minutes: float = 15
+    office_name: str = ""
+    tramite_name: str = ""
+    provincia: str = ""
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def host(self):
+        """Host the target's checks are sent to (used for rate limiting)"""
+        return urlsplit(self.provincia_url).netloc
+
+    def validate(self):
+        """Raise ValueError if the entry can't be checked"""
+        for attr in ("name", "provincia_url", "office_value", "tramite_value"):
+            if not str(getattr(self, attr) or "").strip():
+                raise ValueError(f"Watch target '{self.name}': '{attr}' is required")
+        if not self.host:
+            raise ValueError(
+                f"Watch target '{self.name}': invalid provincia_url '{self.provincia_url}'"
+            )
+        if self.interval_minutes <= 0:
+            raise ValueError(
+                f"Watch target '{self.name}': interval_minutes must be positive"
+            )
+
+
+# Keys accepted in a watch list entry
+TARGET_FIELDS = {
+    "name",
+    "provincia_url",
+    "office_value",
+    "tramite_value",
+    "nie_number",
+    "full_name",
+    "interval_minutes",
+    "office_name",
+    "tramite_name",
+    "provincia",
+}
+
+
+def target_from_dict(entry, defaults=None):
+    """
+    Build a WatchTarget from a watch list entry
+    Args:
+        entry: dict from the watch list file
+        defaults: dict of values used when the entry omits them
+    """
+    values = dict(defaults or {})
+    values.update(entry)
+    unknown = set(values) - TARGET_FIELDS
+    target = WatchTarget(
+        **{k: v for k, v in values.items() if k in TARGET_FIELDS},
+        extra={k: values[k] for k in unknown},
+    )
+    target.office_value = str(target.office_value)
+    target.tramite_value = str(target.tramite_value)
+    target.interval_minutes = float(target.interval_minutes)
+    target.validate()
+    return target
+
+
+def load_watchlist(path, settings=None):
+    """
+    Load targets from a JSON watch list
+    The file holds either a list of entries or {"defaults": {...}, "targets": [...]}
+    NIE_NUMBER / FULL_NAME from the settings (None: the environment) are used when an
+    entry omits them
+    """
+    settings = settings or Settings.from_env()
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        data = {"targets": data}
+
+    defaults = {
+        "nie_number": settings.nie_number,
+        "full_name": settings.full_name,
+    }
+    defaults.update(data.get("defaults", {}))
+
+    targets = [target_from_dict(entry, defaults) for entry in data.get("targets", [])]
+    if not targets:
+        raise ValueError(f"Watch list '{path}' has no targets")
+
+    names = [t.name for t in targets]
+    duplicates = {n for n in names if names.count(n) > 1}
+    if duplicates:
+        raise ValueError(
+            f"Duplicate watch target names: {', '.join(sorted(duplicates))}"
+        )
+    return targets